@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import bulk
 from .models import CashFlow, Category, OperationType, Status, Subcategory
 
 
@@ -31,8 +32,30 @@ class SubcategoryAdmin(admin.ModelAdmin):
 
 @admin.register(CashFlow)
 class CashFlowAdmin(admin.ModelAdmin):
-    list_display = ["date", "status", "operation_type", "category", "subcategory", "amount", "comment"]
+    list_display = ["date", "owner", "status", "operation_type", "category", "subcategory", "amount", "comment"]
     list_filter = ["date", "status", "operation_type", "category"]
-    search_fields = ["comment", "category__name", "subcategory__name"]
+    # Поиск идет по search_vector и триграммным индексам названий, см. get_search_results
+    search_fields = ["comment"]
     date_hierarchy = "date"
     ordering = ["-date"]
+    list_select_related = ["owner"]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).with_references()
+        # Суперпользователь видит все записи, остальные сотрудники — только свои
+        if request.user.is_superuser:
+            return queryset
+        return queryset.owned_by(request.user)
+
+    def get_search_results(self, request, queryset, search_term):
+        return queryset.search(search_term), False
+
+    def save_model(self, request, obj, form, change):
+        if obj.owner_id is None:
+            obj.owner = request.user
+        super().save_model(request, obj, form, change)
+
+    def delete_queryset(self, request, queryset):
+        """Действие «Удалить выбранные»: QuerySet.delete() не обновил бы дневные итоги и остатки"""
+
+        bulk.delete(queryset)
@@ -0,0 +1,267 @@
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast
+
+from . import metrics
+from .models import CashFlowDailyRollup, CashFlowFilterQuerySet
+from .references import get_references
+from .reports import GROUP_FIELDS
+from .versions import get_version
+
+DIMENSIONS = tuple(GROUP_FIELDS)
+
+
+class AnalyticsError(Exception):
+    """Аналитический бэкенд недоступен"""
+
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise AnalyticsError("Для аналитики в памяти установите numpy: poetry install -E analytics")
+    return numpy
+
+
+def bucket_days(np, days, period):
+    """Начала периодов для массива дат datetime64[D]: неделя начинается с понедельника, как date_trunc"""
+
+    if period == "day":
+        return days
+    if period == "week":
+        # 1970-01-01 — четверг: (дни + 3) % 7 — номер дня недели с понедельника
+        ordinals = days.astype("int64")
+        return (ordinals - (ordinals + 3) % 7).astype("datetime64[D]")
+    unit = {"month": "M", "year": "Y"}[period]
+    return days.astype(f"datetime64[{unit}]").astype("datetime64[D]")
+
+
+def to_decimal(kopecks):
+    return Decimal(int(kopecks)).scaleb(-2)
+
+
+class CashFlowFrame:
+    """Дневные итоги записей ДДС в столбцах NumPy для группировок в памяти процесса.
+
+    Справочники хранятся идентификаторами int64 (как BigAutoField) с отдельной маской пустых,
+    суммы — копейками int64 вместо Decimal, даты — datetime64[D]. Группировки, сводные таблицы и периоды
+    считаются векторно: np.unique по составному ключу и np.add.reduceat по отсортированным
+    строкам, без обращений к БД; названия справочников берутся из кеша справочников.
+    """
+
+    def __init__(self, days, dimensions, nulls, counts, amounts):
+        self.np = import_numpy()
+        self.days = days
+        self.dimensions = dimensions
+        self.nulls = nulls
+        self.counts = counts
+        self.amounts = amounts
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def load(cls, queryset):
+        """Кадр по набору дневных итогов одним запросом; суммы переводятся в копейки в SQL"""
+
+        np = import_numpy()
+        rows = queryset.order_by().values_list(
+            "date",
+            *(f"{name}_id" for name in DIMENSIONS),
+            "records_count",
+            Cast(F("amount_sum") * 100, BigIntegerField()),
+        )
+        columns = list(zip(*rows)) or [()] * (len(DIMENSIONS) + 3)
+        days, *ids, counts, amounts = columns
+        dimensions, nulls = {}, {}
+        for name, values in zip(DIMENSIONS, ids):
+            nulls[name] = np.array([value is None for value in values], dtype=bool)
+            dimensions[name] = np.array([0 if value is None else value for value in values], dtype=np.int64)
+        return cls(
+            np.array(days, dtype="datetime64[D]"),
+            dimensions,
+            nulls,
+            np.array(counts, dtype=np.int64),
+            np.array(amounts, dtype=np.int64),
+        )
+
+    @property
+    def nbytes(self):
+        arrays = [self.days, self.counts, self.amounts, *self.dimensions.values(), *self.nulls.values()]
+        return sum(array.nbytes for array in arrays)
+
+    def levels(self, name, period=None):
+        """Значения измерения по возрастанию, признак пустого значения и номер значения каждой строки.
+
+        Пустой справочник — последнее значение, как NULL при сортировке в PostgreSQL.
+        """
+
+        np = self.np
+        if name == "period":
+            values, inverse = np.unique(bucket_days(np, self.days, period), return_inverse=True)
+            return values, np.zeros(len(values), dtype=bool), inverse.reshape(-1)
+
+        ids, nulls = self.dimensions[name], self.nulls[name]
+        values, inverse = np.unique(ids[~nulls], return_inverse=True)
+        codes = np.full(len(ids), len(values), dtype=np.int64)
+        codes[~nulls] = inverse.reshape(-1)
+        empty = np.zeros(len(values), dtype=bool)
+        if nulls.any():
+            values, empty = np.append(values, 0), np.append(empty, True)
+        return values, empty, codes
+
+    def factorize(self, names, period=None):
+        """Группы строк кадра по измерениям: (значения и признаки пустых по группам, номер группы каждой строки).
+
+        Группы упорядочены по измерениям в порядке names, пустые справочники — последними.
+        """
+
+        np = self.np
+        levels, codes = [], []
+        for name in names:
+            values, empty, inverse = self.levels(name, period)
+            levels.append((values, empty))
+            codes.append(inverse)
+        if not names or not len(self):
+            return levels, np.zeros(len(self), dtype=np.int64)
+
+        shape = [len(values) for values, _ in levels]
+        groups, inverse = np.unique(np.ravel_multi_index(codes, shape), return_inverse=True)
+        positions = np.unravel_index(groups, shape)
+        grouped = [(values[position], empty[position]) for (values, empty), position in zip(levels, positions)]
+        return grouped, inverse.reshape(-1)
+
+    def group_sums(self, inverse, size, values):
+        """Точные суммы int64 по группам: сортировка по номеру группы и np.add.reduceat"""
+
+        np = self.np
+        if not size:
+            return np.zeros(0, dtype=np.int64)
+        order = np.argsort(inverse, kind="stable")
+        starts = np.searchsorted(inverse[order], np.arange(size))
+        return np.add.reduceat(values[order], starts)
+
+    def summarize(self, group_by=(), period=None):
+        """То же, что reports.summarize по дневным итогам: period, <группа>, <группа>_name, count, total"""
+
+        if not group_by and not period:
+            if not len(self):
+                return [{"count": None, "total": None}]
+            return [{"count": int(self.counts.sum()), "total": to_decimal(self.amounts.sum())}]
+
+        names = (["period"] if period else []) + list(group_by)
+        levels, inverse = self.factorize(names, period)
+        size = len(levels[0][0])
+        counts = self.group_sums(inverse, size, self.counts)
+        amounts = self.group_sums(inverse, size, self.amounts)
+        keep = self.np.flatnonzero(counts != 0)
+        columns = [self.labels(name, values[keep], empty[keep]) for name, (values, empty) in zip(names, levels)]
+
+        rows = []
+        for position, index in enumerate(keep.tolist()):
+            item = {}
+            for name, labels in zip(names, columns):
+                if name == "period":
+                    item["period"] = labels[position]
+                else:
+                    item[name], item[f"{name}_name"] = labels[position]
+            item["count"] = int(counts[index])
+            item["total"] = to_decimal(amounts[index])
+            rows.append(item)
+        return rows
+
+    def pivot(self, rows, columns, period=None):
+        """Сводная таблица сумм: измерения rows по строкам, columns — по столбцам ("period" — период).
+
+        Возвращает {"rows": [ключ строки], "columns": [ключ столбца], "values": [[Decimal]]}, где ключ —
+        кортеж подписей измерений: дата периода или (идентификатор, название) справочника.
+        """
+
+        np = self.np
+        row_values, row_index = self.factorize(rows, period)
+        column_values, column_index = self.factorize(columns, period)
+        shape = (len(row_values[0][0]) if rows else 1, len(column_values[0][0]) if columns else 1)
+        if not len(self):
+            shape = (0, 0)
+
+        counts = np.zeros(shape, dtype=np.int64)
+        amounts = np.zeros(shape, dtype=np.int64)
+        np.add.at(counts, (row_index, column_index), self.counts)
+        np.add.at(amounts, (row_index, column_index), self.amounts)
+
+        # Строки и столбцы без записей не выводятся, как и группы с нулевым количеством в отчете
+        kept_rows = np.flatnonzero(counts.sum(axis=1) != 0)
+        kept_columns = np.flatnonzero(counts.sum(axis=0) != 0)
+        return {
+            "rows": self.keys(rows, row_values, kept_rows),
+            "columns": self.keys(columns, column_values, kept_columns),
+            "values": [[to_decimal(value) for value in line] for line in amounts[np.ix_(kept_rows, kept_columns)]],
+        }
+
+    def keys(self, names, levels, positions):
+        labels = [
+            self.labels(name, values[positions], empty[positions]) for name, (values, empty) in zip(names, levels)
+        ]
+        return list(zip(*labels)) if names else [()] * len(positions)
+
+    def labels(self, name, values, empty):
+        """Подписи значений измерения: даты периодов или пары (идентификатор, название)"""
+
+        if name == "period":
+            return values.astype(object).tolist()
+        ids = [None if null else value for value, null in zip(values.tolist(), empty.tolist())]
+        references = get_references()
+        by_id = getattr(references, f"{name}_by_id")
+        if any(value is not None and value not in by_id for value in ids):
+            by_id = getattr(get_references(refresh=True), f"{name}_by_id")
+        return [(value, by_id[value].name if value in by_id else None) for value in ids]
+
+
+class FrameCache:
+    """Кадры аналитики в памяти процесса: LRU по набору фильтров с проверкой версии данных.
+
+    Запись любой строки ДДС повышает версию "cashflow" в общем кеше, поэтому кадр, загруженный
+    до изменения, в любом процессе перезагружается при следующем обращении.
+    """
+
+    def __init__(self):
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+
+    def get(self, owner, params):
+        # Ключ — только фильтры-измерения дневных итогов: кадр не умеет искать по тексту,
+        # поэтому отчеты с поиском строятся по записям (reports.report_queryset)
+        key = (owner.pk, *((name, str(params.get(name) or "")) for name in CashFlowFilterQuerySet.FILTER_PARAMS))
+        version = get_version("cashflow")
+        with self.lock:
+            cached = self.frames.get(key)
+            if cached is not None and cached[0] == version:
+                self.frames.move_to_end(key)
+                metrics.record_cache("analytics", hit=True)
+                return cached[1]
+
+        metrics.record_cache("analytics", hit=False)
+        frame = CashFlowFrame.load(CashFlowDailyRollup.objects.owned_by(owner).filter_by_params(params))
+        with self.lock:
+            self.frames[key] = (version, frame)
+            self.frames.move_to_end(key)
+            while len(self.frames) > settings.CASH_FLOW_ANALYTICS_CACHE_SIZE:
+                self.frames.popitem(last=False)
+        return frame
+
+
+frames = FrameCache()
+
+
+def get_frame(owner, params):
+    """Кадр дневных итогов пользователя с фильтрами списка записей (из кеша процесса)"""
+
+    return frames.get(owner, params)
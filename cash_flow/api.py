@@ -0,0 +1,257 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_POST
+
+from . import bulk
+from .forms import CashFlowBulkForm
+from .http_cache import versioned
+from .models import CashFlow, CashFlowDailyBalance
+from .pagination import InvalidCursor, paginate_keyset
+from .references import get_references
+
+# Поле API → колонка проекции values(); справочники отдаются идентификаторами
+CASHFLOW_FIELDS = {
+    "id": "id",
+    "date": "date",
+    "status": "status_id",
+    "operation_type": "operation_type_id",
+    "category": "category_id",
+    "subcategory": "subcategory_id",
+    "amount": "amount",
+    "comment": "comment",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+
+DEFAULT_CASHFLOW_FIELDS = ("id", "date", "status", "operation_type", "category", "subcategory", "amount", "comment")
+
+# Справочники, для которых ?expand= добавляет <поле>_name из кеша справочников
+EXPANDABLE_FIELDS = {
+    "status": "status_by_id",
+    "operation_type": "operation_type_by_id",
+    "category": "category_by_id",
+    "subcategory": "subcategory_by_id",
+}
+
+# Справочник API → (список в снимке справочников, имя поля родителя)
+REFERENCE_LISTS = {
+    "statuses": ("statuses", None),
+    "operation-types": ("operation_types", None),
+    "categories": ("categories", "operation_type"),
+    "subcategories": ("subcategories", "category"),
+}
+
+
+# Наибольшая длина периода кривой остатков, дней
+BALANCE_CURVE_MAX_DAYS = 3660
+
+
+class ApiParamsError(ValueError):
+    """Некорректные параметры запроса к API"""
+
+
+def error_response(message, status=400, **extra):
+    return JsonResponse({"error": message, **extra}, status=status)
+
+
+def api_login_required(view):
+    """Как login_required, но вместо перенаправления на страницу входа отвечает 401"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return error_response("Требуется вход в систему", status=401)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def parse_list_param(params, name, allowed, default=()):
+    """Разбирает список через запятую (?fields=date,amount) и проверяет допустимые значения"""
+
+    values = [value for value in ",".join(params.getlist(name)).split(",") if value]
+    unknown = [value for value in values if value not in allowed]
+    if unknown:
+        raise ApiParamsError(f"Неизвестные значения {name}: {', '.join(unknown)}")
+    return list(dict.fromkeys(values)) or list(default)
+
+
+def parse_limit(params):
+    limit = params.get("limit")
+    if not limit:
+        return settings.CASH_FLOW_API_PAGE_SIZE
+    if not limit.isdigit() or not int(limit):
+        raise ApiParamsError(f"Некорректный limit: {limit}")
+    return min(int(limit), settings.CASH_FLOW_API_MAX_PAGE_SIZE)
+
+
+def parse_date(params, name, default):
+    value = params.get(name)
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ApiParamsError(f"Некорректная дата {name}: {value}")
+
+
+def page_url(request, cursor):
+    params = request.GET.copy()
+    params["cursor"] = cursor
+    return f"{request.path}?{params.urlencode()}"
+
+
+@api_login_required
+@versioned("cashflow", "references", policy="api")
+def cashflow_list(request):
+    """Записи ДДС пользователя: фильтры списка, курсорная пагинация, выбор полей (?fields=) и названий (?expand=).
+
+    Строки читаются проекцией values(), без создания объектов модели.
+    """
+
+    try:
+        fields = parse_list_param(request.GET, "fields", CASHFLOW_FIELDS, DEFAULT_CASHFLOW_FIELDS)
+        expand = parse_list_param(request.GET, "expand", EXPANDABLE_FIELDS)
+        limit = parse_limit(request.GET)
+        columns = {CASHFLOW_FIELDS[name] for name in fields}
+        # Ключ курсора должен входить в проекцию, даже если его не запросили
+        columns |= {"date", "created_at", "id"}
+        columns |= {CASHFLOW_FIELDS[name] for name in expand}
+        queryset = CashFlow.objects.owned_by(request.user).filter_by_params(request.GET).values(*columns)
+        page = paginate_keyset(queryset, limit, request.GET.get("cursor"))
+    except ApiParamsError as error:
+        return error_response(str(error), fields=list(CASHFLOW_FIELDS), expand=list(EXPANDABLE_FIELDS))
+    except InvalidCursor:
+        return error_response("Некорректный курсор страницы")
+    except (ValueError, ValidationError):
+        return error_response("Некорректные параметры фильтрации")
+
+    references = get_references() if expand else None
+    results = []
+    for row in page:
+        item = {name: row[CASHFLOW_FIELDS[name]] for name in fields}
+        for name in expand:
+            reference = getattr(references, EXPANDABLE_FIELDS[name]).get(row[CASHFLOW_FIELDS[name]])
+            item[f"{name}_name"] = reference.name if reference else None
+        results.append(item)
+
+    return JsonResponse(
+        {
+            "results": results,
+            "next": page_url(request, page.next_cursor) if page.has_next() else None,
+            "previous": page_url(request, page.previous_cursor) if page.has_previous() else None,
+        }
+    )
+
+
+@api_login_required
+@require_POST
+def cashflow_bulk(request):
+    """Массовое действие над записями ДДС: тело JSON {"action", "scope", "ids", "status", "category", "subcategory"}.
+
+    Фильтры — те же параметры строки запроса, что у списка; отвечает числом затронутых записей.
+    """
+
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return error_response("Тело запроса должно быть JSON-объектом")
+    if not isinstance(data, dict):
+        return error_response("Тело запроса должно быть JSON-объектом")
+
+    form = CashFlowBulkForm(data)
+    if not form.is_valid():
+        return error_response("Некорректные параметры действия", errors=form.errors)
+
+    queryset = CashFlow.objects.owned_by(request.user).filter_by_params(request.GET)
+    try:
+        count = bulk.run(form.get_queryset(queryset), form.cleaned_data["action"], form.cleaned_data.get("changes"))
+    except (ValueError, ValidationError):
+        return error_response("Некорректные параметры фильтрации")
+    return JsonResponse({"action": form.cleaned_data["action"], "count": count})
+
+
+@api_login_required
+@versioned("cashflow", "references", policy="api")
+def balance(request):
+    """Остатки пользователя по статусам на конец дня ?date= (по умолчанию — сегодня).
+
+    Ответ строится по таблице остатков: одна строка ряда на статус, без суммирования записей.
+    """
+
+    try:
+        day = parse_date(request.GET, "date", timezone.localdate())
+    except ApiParamsError as error:
+        return error_response(str(error))
+
+    balances = CashFlowDailyBalance.objects.filter(owner_id=request.user.pk).balances_on(day)
+    statuses = get_references().status_by_id
+    results = [
+        {
+            "status": status_id,
+            "status_name": statuses[status_id].name if status_id in statuses else None,
+            "balance": value,
+        }
+        for status_id, value in sorted(balances.items(), key=lambda item: (item[0] is None, item[0] or 0))
+    ]
+    return JsonResponse({"date": day, "results": results, "total": sum(balances.values(), Decimal("0.00"))})
+
+
+@api_login_required
+@versioned("cashflow", "references", policy="api")
+def balance_curve(request):
+    """Остаток пользователя на конец каждого дня периода ?start=&end= (по умолчанию — текущий год) по статусам"""
+
+    today = timezone.localdate()
+    try:
+        start = parse_date(request.GET, "start", date(today.year, 1, 1))
+        end = parse_date(request.GET, "end", date(today.year, 12, 31))
+        if end < start or end - start > timedelta(days=BALANCE_CURVE_MAX_DAYS):
+            raise ApiParamsError(f"Период должен быть не длиннее {BALANCE_CURVE_MAX_DAYS} дней и end не раньше start")
+    except ApiParamsError as error:
+        return error_response(str(error))
+
+    curve = CashFlowDailyBalance.objects.filter(owner_id=request.user.pk).curve(start, end)
+    statuses = get_references().status_by_id
+    results = [
+        {
+            "status": status_id,
+            "status_name": statuses[status_id].name if status_id in statuses else None,
+            "points": [{"date": day, "balance": value} for day, value in points],
+        }
+        for status_id, points in sorted(curve.items(), key=lambda item: (item[0] is None, item[0] or 0))
+    ]
+    return JsonResponse({"start": start, "end": end, "results": results})
+
+
+@api_login_required
+@versioned("references", policy="references")
+def reference_tree(request):
+    """Полное дерево тип операции → категория → подкатегория с хешем содержимого"""
+
+    return JsonResponse(get_references().tree)
+
+
+@api_login_required
+@versioned("references", policy="references")
+def reference_list(request, name):
+    """Элементы справочника из кеша справочников; родитель отдается идентификатором"""
+
+    if name not in REFERENCE_LISTS:
+        return error_response(f"Неизвестный справочник: {name}", status=404, references=list(REFERENCE_LISTS))
+
+    attribute, parent_field = REFERENCE_LISTS[name]
+    results = []
+    for item in getattr(get_references(), attribute):
+        data = {"id": item.id, "name": item.name}
+        if parent_field:
+            data[parent_field] = item.parent_id
+        results.append(data)
+    return JsonResponse({"results": results})
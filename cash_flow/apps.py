@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CashFlowConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "cash_flow"
+
+    def ready(self):
+        from . import signals  # noqa: F401
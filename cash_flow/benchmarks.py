@@ -0,0 +1,222 @@
+import asyncio
+import io
+import json
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, p):
+    """Перцентиль с линейной интерполяцией по отсортированному списку"""
+
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100
+    lower, upper = math.floor(rank), math.ceil(rank)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarize_timings(timings, queries=()):
+    """Сводка замеров одного сценария: перцентили времени (мс) и число SQL-запросов (если они считались)"""
+
+    timings = sorted(timings)
+    summary = {
+        "iterations": len(timings),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "min_ms": round(timings[0], 3),
+        "max_ms": round(timings[-1], 3),
+    }
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = round(percentile(timings, p), 3)
+    if queries:
+        summary["queries_min"] = min(queries)
+        summary["queries_max"] = max(queries)
+    return summary
+
+
+class BenchmarkError(Exception):
+    """Сценарий замера завершился ошибкой"""
+
+
+class BenchmarkRunner:
+    """Прогоняет сценарии: прогрев, затем замер времени и числа запросов на каждый вызов.
+
+    Сценарий — функция, возвращающая ответ тестового клиента; setup (если задан) готовит
+    аргумент для каждого вызова вне замера, например запись, которую сценарий удалит.
+    """
+
+    def __init__(self, iterations=50, warmup=3):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.results = {}
+
+    def run_once(self, scenario, setup=None):
+        argument = setup() if setup else None
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = scenario(argument) if setup else scenario()
+            elapsed = (time.perf_counter() - started) * 1000
+        status = getattr(response, "status_code", 200)
+        if status >= 400:
+            raise BenchmarkError(f"Ответ {status}")
+        return elapsed, len(queries)
+
+    def measure(self, name, scenario, setup=None):
+        try:
+            for _ in range(self.warmup):
+                self.run_once(scenario, setup)
+            timings, queries = [], []
+            for _ in range(self.iterations):
+                elapsed, count = self.run_once(scenario, setup)
+                timings.append(elapsed)
+                queries.append(count)
+        except BenchmarkError as error:
+            raise BenchmarkError(f"{name}: {error}") from error
+        self.results[name] = summarize_timings(timings, queries)
+        return self.results[name]
+
+
+def compare_results(previous, current, metric="p95_ms"):
+    """Изменение метрики по сценариям относительно прошлого прогона: [(сценарий, было, стало, %)]"""
+
+    rows = []
+    for name, result in current["results"].items():
+        old = previous.get("results", {}).get(name)
+        if old is None or not old.get(metric):
+            continue
+        change = (result[metric] - old[metric]) / old[metric] * 100
+        rows.append((name, old[metric], result[metric], round(change, 1)))
+    return rows
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_results(path, data):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, indent=2, default=str)
+
+
+def load_summary(timings, statuses, elapsed):
+    """Итог нагрузочного прогона: пропускная способность, ошибки и перцентили времени ответа"""
+
+    return {
+        "requests": len(timings),
+        "errors": sum(1 for status in statuses if status >= 400),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(timings) / elapsed, 1) if elapsed else None,
+        **summarize_timings(timings),
+    }
+
+
+def wsgi_environ(path, query, headers):
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": "testserver",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in headers.items():
+        environ[f"HTTP_{name.upper().replace('-', '_')}"] = value
+    return environ
+
+
+def run_wsgi_load(application, urls, total, concurrency, headers):
+    """Прогоняет total GET-запросов по кругу urls через WSGI-приложение в concurrency потоках.
+
+    Так работает один синхронный воркер с потоками (gunicorn --threads): каждый запрос
+    занимает поток целиком, включая ожидание БД.
+    """
+
+    def request(url):
+        path, _, query = url.partition("?")
+        status = []
+        started = time.perf_counter()
+        response = application(wsgi_environ(path, query, headers), lambda line, _: status.append(int(line[:3])))
+        try:
+            b"".join(response)
+        finally:
+            response.close()
+        return (time.perf_counter() - started) * 1000, status[0]
+
+    urls = cycle(urls)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(request, [next(urls) for _ in range(total)]))
+    elapsed = time.perf_counter() - started
+    return load_summary([timing for timing, _ in results], [status for _, status in results], elapsed)
+
+
+async def asgi_request(application, url, headers):
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"testserver")] + [(name.encode(), value.encode()) for name, value in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    disconnected = asyncio.Event()
+    body_sent = False
+    status = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Клиент не отключается: обработчик ждет здесь, пока не отправит ответ
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    started = time.perf_counter()
+    await application(scope, receive, send)
+    return (time.perf_counter() - started) * 1000, status[0]
+
+
+def run_asgi_load(application, urls, total, concurrency, headers):
+    """Прогоняет total GET-запросов через ASGI-приложение: concurrency одновременных запросов в одном цикле событий"""
+
+    async def run():
+        queue = iter([url for url, _ in zip(cycle(urls), range(total))])
+        results = []
+
+        async def client():
+            for url in queue:
+                results.append(await asgi_request(application, url, headers))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+    return load_summary([timing for timing, _ in results], [status for _, status in results], elapsed)
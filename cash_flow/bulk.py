@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import CashFlow, CashFlowDailyRollup
+from .references import get_references, hierarchy_errors
+from .versions import bump_version
+
+BULK_ACTIONS = ("reassign", "delete")
+
+
+def resolve_changes(status_id=None, category_id=None, subcategory_id=None):
+    """Новые значения справочников для массового переназначения записей.
+
+    Родители достраиваются по кешу справочников: подкатегория задает категорию, категория —
+    тип операции; при смене категории без подкатегории подкатегория сбрасывается. Иерархия
+    проверяется один раз на всю операцию, а не для каждой записи.
+    """
+
+    references = get_references()
+    if not references.knows(None, category_id, subcategory_id, status_id):
+        references = get_references(refresh=True)
+
+    changes = {}
+    if status_id:
+        changes["status_id"] = status_id
+    if subcategory_id and not category_id:
+        subcategory = references.subcategory_by_id.get(subcategory_id)
+        category_id = subcategory.parent_id if subcategory else None
+    if category_id:
+        category = references.category_by_id.get(category_id)
+        changes["operation_type_id"] = category.parent_id if category else None
+        changes["category_id"] = category_id
+        changes["subcategory_id"] = subcategory_id or None
+    elif subcategory_id:
+        raise ValidationError({"subcategory": "Выбранный элемент справочника не существует"})
+    if not changes:
+        raise ValidationError("Не выбрано новое значение статуса, категории или подкатегории")
+
+    errors = hierarchy_errors(
+        changes.get("operation_type_id"), changes.get("category_id"), changes.get("subcategory_id"), status_id
+    )
+    if errors:
+        raise ValidationError(errors)
+    return changes
+
+
+def locked_ids(queryset):
+    """Идентификаторы записей набора, заблокированные до конца транзакции (FOR UPDATE)"""
+
+    return list(queryset.order_by("pk").select_for_update().values_list("pk", flat=True))
+
+
+def chunks(ids, batch_size):
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        yield ids[start:end]
+
+
+def add_delta(deltas, bucket, count, amount):
+    old_count, old_amount = deltas.get(bucket, (0, 0))
+    deltas[bucket] = (old_count + count, old_amount + amount)
+
+
+def reassign(queryset, changes, batch_size=None):
+    """Переназначает справочники всем записям набора; возвращает число измененных записей.
+
+    Каждая порция — один UPDATE, который заодно пересчитывает поисковый вектор, и одна
+    дельта дневных итогов на корзину: записи переносятся из старых корзин в новые.
+    """
+
+    batch_size = batch_size or settings.CASH_FLOW_BULK_BATCH_SIZE
+    updated = 0
+    with transaction.atomic():
+        ids = locked_ids(queryset)
+        for chunk in chunks(ids, batch_size):
+            batch = CashFlow.objects.filter(pk__in=chunk)
+            deltas = {}
+            for *bucket, count, amount in CashFlowDailyRollup.objects.raw_totals(batch):
+                moved = tuple(
+                    changes.get(field, value) for field, value in zip(CashFlowDailyRollup.BUCKET_FIELDS, bucket)
+                )
+                add_delta(deltas, tuple(bucket), -count, -amount)
+                add_delta(deltas, moved, count, amount)
+            updated += batch.update_search_vectors(**changes, updated_at=timezone.now())
+            CashFlowDailyRollup.objects.apply_deltas(deltas)
+
+    if updated:
+        bump_version("cashflow")
+        metrics.record_change("update", updated)
+    return updated
+
+
+def delete(queryset, batch_size=None):
+    """Удаляет все записи набора; возвращает число удаленных записей.
+
+    Записи ДДС ни на что не ссылаются, поэтому удаление — один DELETE на порцию, без загрузки
+    объектов и сигналов на каждую запись; дневные итоги (а через них и остатки) уменьшаются
+    одной дельтой на корзину. Этим же путем удаляет выбранные записи админка.
+    """
+
+    batch_size = batch_size or settings.CASH_FLOW_BULK_BATCH_SIZE
+    table = connection.ops.quote_name(CashFlow._meta.db_table)
+    deleted = 0
+    with transaction.atomic():
+        ids = locked_ids(queryset)
+        for chunk in chunks(ids, batch_size):
+            deltas = {
+                tuple(bucket): (-count, -amount)
+                for *bucket, count, amount in CashFlowDailyRollup.objects.raw_totals(
+                    CashFlow.objects.filter(pk__in=chunk)
+                )
+            }
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {table} WHERE id = ANY(%s)", [chunk])
+                deleted += cursor.rowcount
+            CashFlowDailyRollup.objects.apply_deltas(deltas)
+
+    if deleted:
+        bump_version("cashflow")
+        metrics.record_change("delete", deleted)
+    return deleted
+
+
+def run(queryset, action, changes=None, batch_size=None):
+    """Выполняет массовое действие над набором записей; возвращает число затронутых записей"""
+
+    if action == "delete":
+        return delete(queryset, batch_size)
+    return reassign(queryset, changes, batch_size)
@@ -0,0 +1,123 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .pagination import KEYSET_ORDERING
+from .references import aget_references, get_references
+
+# Колонки выгрузки; заголовки CSV совпадают с теми, что понимает импорт
+EXPORT_COLUMNS = (
+    ("id", "ID"),
+    ("date", "Дата"),
+    ("status", "Статус"),
+    ("operation_type", "Тип операции"),
+    ("category", "Категория"),
+    ("subcategory", "Подкатегория"),
+    ("amount", "Сумма"),
+    ("comment", "Комментарий"),
+)
+
+EXPORT_FIELDS = ("id", "date", "status_id", "operation_type_id", "category_id", "subcategory_id", "amount", "comment")
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson; charset=utf-8", "ndjson"),
+}
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку вместо накопления"""
+
+    def write(self, value):
+        return value
+
+
+def reference_names(references):
+    return (
+        references.status_by_id,
+        references.operation_type_by_id,
+        references.category_by_id,
+        references.subcategory_by_id,
+    )
+
+
+def export_values(queryset):
+    return queryset.order_by(*KEYSET_ORDERING).values_list(*EXPORT_FIELDS)
+
+
+def label_row(names, row):
+    pk, row_date, *reference_ids, amount, comment = row
+    labels = [by_id[value].name if value in by_id else "" for by_id, value in zip(names, reference_ids)]
+    return (pk, row_date, *labels, amount, comment)
+
+
+def iter_rows(queryset, chunk_size=None):
+    """Строки выгрузки без загрузки всего набора в память.
+
+    Идентификаторы справочников читаются из таблицы записей без JOIN (серверный курсор
+    PostgreSQL, порциями по chunk_size) и заменяются названиями из кеша справочников.
+    """
+
+    names = reference_names(get_references())
+    for row in export_values(queryset).iterator(chunk_size=chunk_size or settings.CASH_FLOW_EXPORT_CHUNK_SIZE):
+        yield label_row(names, row)
+
+
+async def aiter_rows(queryset, chunk_size=None):
+    """Асинхронная версия iter_rows (асинхронный ORM, те же порции серверного курсора)"""
+
+    names = reference_names(await aget_references())
+    # values_list().aiterator() выполняет запрос прямо в цикле событий, а values() — в потоке
+    rows = queryset.order_by(*KEYSET_ORDERING).values(*EXPORT_FIELDS)
+    async for row in rows.aiterator(chunk_size=chunk_size or settings.CASH_FLOW_EXPORT_CHUNK_SIZE):
+        yield label_row(names, [row[field] for field in EXPORT_FIELDS])
+
+
+def csv_header(writer):
+    # BOM, чтобы Excel открыл кириллицу в UTF-8
+    return "\ufeff" + writer.writerow([title for _, title in EXPORT_COLUMNS])
+
+
+def ndjson_line(row):
+    keys = [name for name, _ in EXPORT_COLUMNS]
+    return json.dumps(dict(zip(keys, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def iter_csv(queryset, chunk_size=None):
+    writer = csv.writer(Echo())
+    yield csv_header(writer)
+    for row in iter_rows(queryset, chunk_size):
+        yield writer.writerow(row)
+
+
+async def aiter_csv(queryset, chunk_size=None):
+    writer = csv.writer(Echo())
+    yield csv_header(writer)
+    async for row in aiter_rows(queryset, chunk_size):
+        yield writer.writerow(row)
+
+
+def iter_ndjson(queryset, chunk_size=None):
+    for row in iter_rows(queryset, chunk_size):
+        yield ndjson_line(row)
+
+
+async def aiter_ndjson(queryset, chunk_size=None):
+    async for row in aiter_rows(queryset, chunk_size):
+        yield ndjson_line(row)
+
+
+def iter_export(queryset, export_format, chunk_size=None):
+    if export_format == "ndjson":
+        return iter_ndjson(queryset, chunk_size)
+    return iter_csv(queryset, chunk_size)
+
+
+def aiter_export(queryset, export_format, chunk_size=None):
+    """Асинхронный итератор выгрузки для StreamingHttpResponse под ASGI"""
+
+    if export_format == "ndjson":
+        return aiter_ndjson(queryset, chunk_size)
+    return aiter_csv(queryset, chunk_size)
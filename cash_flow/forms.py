@@ -1,6 +1,8 @@
 from django import forms
 
+from .bulk import resolve_changes
 from .models import CashFlow, Category, OperationType, Status, Subcategory
+from .references import get_references, hierarchy_errors
 
 
 class CashFlowForm(forms.ModelForm):
@@ -36,24 +38,45 @@ class CashFlowForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        references = get_references()
+        # Дерево справочников встраивается в страницу формы: списки фильтруются без AJAX
+        self.reference_tree = references.tree
+        categories = references.categories
+        subcategories = references.subcategories
 
-        # Для существующей записи ограничиваем выбор категорий и подкатегорий
-        if self.instance and self.instance.pk:
-            if self.instance.operation_type:
-                self.fields["category"].queryset = Category.objects.filter(operation_type=self.instance.operation_type)
-            if self.instance.category:
-                self.fields["subcategory"].queryset = Subcategory.objects.filter(category=self.instance.category)
-        else:
-            self.fields["category"].queryset = Category.objects.all()
-            self.fields["subcategory"].queryset = Subcategory.objects.all()
+        # Списки категорий и подкатегорий сужаются только для отображения; проверяются значения
+        # по полным справочникам, а соответствие иерархии — в clean() через hierarchy_errors
+        operation_type_id = self.selected_id("operation_type")
+        if operation_type_id is not None:
+            categories = references.categories_for(operation_type_id)
+        category_id = self.selected_id("category")
+        if category_id is not None:
+            subcategories = references.subcategories_for(category_id)
+
+        # Варианты выбора берутся из кеша справочников, а не из запросов к БД при отрисовке
+        self.set_reference_choices("status", references.statuses, lambda item: item.name)
+        self.set_reference_choices("operation_type", references.operation_types, lambda item: item.name)
+        self.set_reference_choices("category", categories, references.category_label)
+        self.set_reference_choices("subcategory", subcategories, references.subcategory_label)
 
-            if self.initial.get("operation_type"):
-                operation_type = self.initial["operation_type"]
-                self.fields["category"].queryset = Category.objects.filter(operation_type=operation_type)
+    def selected_id(self, name):
+        """Выбранный справочник: из отправленных данных, записи или начальных значений формы"""
+
+        if self.is_bound:
+            value = self.data.get(self.add_prefix(name))
+        elif self.instance.pk:
+            value = getattr(self.instance, f"{name}_id")
+        else:
+            value = getattr(self.initial.get(name), "pk", self.initial.get(name))
+        try:
+            return int(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
 
-            if self.initial.get("category"):
-                category = self.initial["category"]
-                self.fields["subcategory"].queryset = Subcategory.objects.filter(category=category)
+    def set_reference_choices(self, name, items, label):
+        field = self.fields[name]
+        choices = [("", field.empty_label)] if field.empty_label is not None else []
+        field.choices = choices + [(item.id, label(item)) for item in items]
 
     def clean(self):
         """Дополнительная валидация на уровне формы"""
@@ -64,16 +87,28 @@ class CashFlowForm(forms.ModelForm):
         category = cleaned_data.get("category")
         subcategory = cleaned_data.get("subcategory")
 
-        if category and operation_type:
-            if category.operation_type != operation_type:
-                self.add_error("category", "Выбранная категория не принадлежит выбранному типу операции")
-
-        if subcategory and category:
-            if subcategory.category != category:
-                self.add_error("subcategory", "Выбранная подкатегория не принадлежит выбранной категории")
+        errors = hierarchy_errors(
+            operation_type.pk if operation_type else None,
+            category.pk if category else None,
+            subcategory.pk if subcategory else None,
+        )
+        for field, message in errors.items():
+            self.add_error(field, message)
 
         return cleaned_data
 
+    def validate_unique(self):
+        """У записи ДДС нет уникальных полей, кроме первичного ключа: проверка только тратит запрос"""
+
+    def save(self, commit=True):
+        """Запись уже проверена формой (включая full_clean модели), повторная валидация в save не нужна"""
+
+        instance = super().save(commit=False)
+        if commit:
+            instance.save(validate=False)
+            self._save_m2m()
+        return instance
+
 
 class StatusForm(forms.ModelForm):
     """Форма для статусов"""
@@ -123,3 +158,120 @@ class SubcategoryForm(forms.ModelForm):
             "category": forms.Select(attrs={"class": "form-control", "required": True}),
             "description": forms.Textarea(attrs={"class": "form-control", "rows": 3}),
         }
+
+
+class CashFlowImportForm(forms.Form):
+    """Форма загрузки выписки CSV/XLSX для импорта записей ДДС"""
+
+    file = forms.FileField(
+        label="Файл CSV или XLSX",
+        widget=forms.ClearableFileInput(attrs={"class": "form-control", "accept": ".csv,.xlsx"}),
+    )
+    encoding = forms.ChoiceField(
+        label="Кодировка CSV",
+        choices=[("", "Определить автоматически"), ("utf-8-sig", "UTF-8"), ("cp1251", "Windows-1251")],
+        required=False,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    dry_run = forms.BooleanField(
+        label="Только проверить, не сохранять",
+        required=False,
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"}),
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data["file"]
+        if not file.name.lower().endswith((".csv", ".xlsx")):
+            raise forms.ValidationError("Поддерживаются только файлы CSV и XLSX")
+        return file
+
+
+class IdListField(forms.Field):
+    """Список идентификаторов записей: повторяющийся параметр (?ids=1&ids=2), строка через запятую или список"""
+
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = value.split(",")
+        try:
+            return list(dict.fromkeys(int(item) for item in value if str(item).strip()))
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Некорректный список записей")
+
+
+class CashFlowBulkForm(forms.Form):
+    """Массовое действие над записями ДДС: выбранными (ids) или всеми, подходящими под фильтры списка"""
+
+    action = forms.ChoiceField(
+        label="Действие",
+        choices=[("reassign", "Изменить справочники"), ("delete", "Удалить")],
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    scope = forms.ChoiceField(
+        label="Записи",
+        choices=[("selected", "Выбранные"), ("filter", "Все по фильтрам")],
+        initial="selected",
+        required=False,
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    ids = IdListField(required=False)
+    status = forms.TypedChoiceField(
+        label="Статус",
+        coerce=int,
+        required=False,
+        empty_value=None,
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    category = forms.TypedChoiceField(
+        label="Категория",
+        coerce=int,
+        required=False,
+        empty_value=None,
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    subcategory = forms.TypedChoiceField(
+        label="Подкатегория",
+        coerce=int,
+        required=False,
+        empty_value=None,
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+
+    def __init__(self, *args, references=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Асинхронный список записей передает уже загруженный снимок справочников
+        references = references or get_references()
+        for name, items, label in (
+            ("status", references.statuses, lambda item: item.name),
+            ("category", references.categories, references.category_label),
+            ("subcategory", references.subcategories, references.subcategory_label),
+        ):
+            self.fields[name].choices = [("", "Не менять")] + [(item.id, label(item)) for item in items]
+
+    def clean(self):
+        """Выбранные записи обязательны для scope=selected; новые значения проверяются один раз на все записи"""
+
+        cleaned_data = super().clean()
+        # Все записи по фильтрам — только по явному scope=filter
+        cleaned_data["scope"] = cleaned_data.get("scope") or "selected"
+        if cleaned_data["scope"] == "selected" and not cleaned_data.get("ids"):
+            self.add_error("ids", "Не выбрано ни одной записи")
+        if cleaned_data.get("action") == "reassign" and not self.errors:
+            try:
+                cleaned_data["changes"] = resolve_changes(
+                    cleaned_data.get("status"), cleaned_data.get("category"), cleaned_data.get("subcategory")
+                )
+            except forms.ValidationError as error:
+                for field, messages in getattr(error, "message_dict", {None: error.messages}).items():
+                    self.add_error(field if field in self.fields else None, messages)
+        return cleaned_data
+
+    def get_queryset(self, queryset):
+        """Записи, к которым применяется действие: выбранные или весь отфильтрованный набор"""
+
+        if self.cleaned_data["scope"] == "selected":
+            return queryset.filter(pk__in=self.cleaned_data["ids"])
+        return queryset
@@ -0,0 +1,93 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .versions import aget_version, get_version
+
+
+def has_pending_messages(request):
+    """Есть ли у запроса непоказанные сообщения: такую страницу нельзя отдавать как 304"""
+
+    return hasattr(request, "_messages") and len(get_messages(request)) > 0
+
+
+def csrf_secret(request):
+    """Секрет CSRF запроса; если cookie еще нет, он создается и будет выставлен в ответе"""
+
+    get_token(request)
+    return request.META.get("CSRF_COOKIE", "")
+
+
+def versioned(*names, policy, csrf=False):
+    """Условный GET (ETag и Last-Modified) по версиям таблиц из общего кеша.
+
+    Версии повышаются сигналами при каждой записи, поэтому ответ 304 отдается без
+    рендеринга шаблона и без запросов к данным. Cache-Control берется из настройки
+    CASH_FLOW_CACHE_CONTROL по имени политики. Подходит и для асинхронных представлений.
+
+    csrf=True — для страниц с формами POST: ETag зависит от секрета CSRF, и после его смены
+    (вход, выход) браузер не получит 304 со старым токеном в форме; ответ варьируется по Cookie.
+    """
+
+    def data_state(request):
+        """Пользователь, версии таблиц и секрет CSRF запроса; для асинхронного представления они прочитаны заранее"""
+
+        state = getattr(request, "_data_state", None)
+        if state is None:
+            state = request._data_state = (
+                request.user.pk,
+                [get_version(name) for name in names],
+                csrf_secret(request) if csrf else "",
+            )
+        return state
+
+    def etag_func(request, *args, **kwargs):
+        if has_pending_messages(request):
+            return None
+        user_pk, versions, secret = data_state(request)
+        # Данные у каждого пользователя свои, поэтому ETag зависит и от него
+        key = f"{user_pk}:{request.get_full_path()}:{':'.join(map(str, versions))}:{secret}"
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        if has_pending_messages(request):
+            return None
+        _, versions, _ = data_state(request)
+        return datetime.fromtimestamp(max(versions) / 1e9, tz=timezone.utc)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        def add_cache_control(request, response):
+            if request.method in ("GET", "HEAD"):
+                patch_cache_control(response, **settings.CASH_FLOW_CACHE_CONTROL.get(policy, {}))
+                if csrf:
+                    patch_vary_headers(response, ("Cookie",))
+            return response
+
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # condition() вызывает etag_func синхронно, а в асинхронном коде нельзя обращаться к БД
+                user = await request.auser()
+                versions = [await aget_version(name) for name in names]
+                request._data_state = (user.pk, versions, csrf_secret(request) if csrf else "")
+                return add_cache_control(request, await conditional_view(request, *args, **kwargs))
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return add_cache_control(request, conditional_view(request, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
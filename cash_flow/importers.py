@@ -0,0 +1,283 @@
+import codecs
+import csv
+import io
+import time
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import metrics
+from .models import CashFlow, CashFlowDailyRollup
+from .references import get_references
+from .versions import bump_version
+
+COLUMNS = ("date", "status", "operation_type", "category", "subcategory", "amount", "comment")
+
+# Заголовки выгрузок на русском языке
+COLUMN_ALIASES = {
+    "дата": "date",
+    "статус": "status",
+    "тип операции": "operation_type",
+    "тип": "operation_type",
+    "категория": "category",
+    "подкатегория": "subcategory",
+    "сумма": "amount",
+    "комментарий": "comment",
+}
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y")
+
+# Кодировки CSV при автоопределении: UTF-8 (с BOM или без), иначе выгрузки Excel и 1С в Windows-1251
+ENCODINGS = ("utf-8-sig", "cp1251")
+
+
+class ImportFormatError(ValueError):
+    """Файл не удалось прочитать как таблицу записей ДДС"""
+
+
+class ImportResult:
+    """Итоги импорта: количество строк, созданные записи, ошибки по строкам и скорость"""
+
+    def __init__(self):
+        self.total = 0
+        self.created = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+
+def normalize_header(header):
+    names = []
+    for value in header:
+        name = str(value or "").strip().lower()
+        names.append(COLUMN_ALIASES.get(name, name))
+    missing = [name for name in COLUMNS if name != "comment" and name not in names]
+    if missing:
+        raise ImportFormatError(f"Нет обязательных колонок: {', '.join(missing)}")
+    return names
+
+
+def detect_encoding(file, chunk_size=64 * 1024):
+    """Первая из ENCODINGS, в которой читается весь файл; файл перематывается в начало"""
+
+    for encoding in ENCODINGS[:-1]:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            while chunk := file.read(chunk_size):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        finally:
+            file.seek(0)
+        return encoding
+    return ENCODINGS[-1]
+
+
+def read_csv(file, encoding=None):
+    """Построчное чтение CSV (двоичный файл) с разделителем «,», «;» или табуляцией.
+
+    Без encoding кодировка определяется по содержимому файла (см. ENCODINGS).
+    """
+
+    try:
+        encoding = encoding or detect_encoding(file)
+        stream = io.TextIOWrapper(file, encoding=encoding, newline="")
+        sample = stream.read(4096)
+        stream.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(stream, dialect)
+        header = normalize_header(next(reader, []))
+        for row in reader:
+            if any(row):
+                yield dict(zip(header, row))
+    except LookupError:
+        raise ImportFormatError(f"Неизвестная кодировка: {encoding}")
+    except UnicodeDecodeError as error:
+        raise ImportFormatError(f"Файл не читается в кодировке {encoding} (байт {error.start}): выберите другую")
+    except csv.Error as error:
+        raise ImportFormatError(f"Некорректный CSV: {error}")
+
+
+def read_xlsx(file):
+    """Построчное чтение первого листа XLSX в режиме read_only (нужен пакет openpyxl)"""
+
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ImportFormatError("Для импорта XLSX установите openpyxl: poetry install -E xlsx")
+
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        raise ImportFormatError("Файл не является книгой XLSX")
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = normalize_header(next(rows, []))
+        for row in rows:
+            if any(value not in (None, "") for value in row):
+                yield dict(zip(header, row))
+    finally:
+        workbook.close()
+
+
+def read_rows(file, file_format, encoding=None):
+    if file_format == "csv":
+        return read_csv(file, encoding)
+    if file_format == "xlsx":
+        return read_xlsx(file)
+    raise ImportFormatError(f"Неизвестный формат файла: {file_format}")
+
+
+def detect_format(filename):
+    return "xlsx" if str(filename).lower().endswith(".xlsx") else "csv"
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Некорректная дата: {value}")
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value).replace(" ", "").replace("\xa0", "").replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"Некорректная сумма: {value}")
+    # NaN и бесконечность разбираются без ошибки, но сравнение sNaN с нулем бросает InvalidOperation
+    if not amount.is_finite():
+        raise ValueError(f"Некорректная сумма: {value}")
+    if amount <= 0:
+        raise ValueError(f"Сумма должна быть больше нуля: {value}")
+    return amount
+
+
+class CashFlowImporter:
+    """Потоковый импорт записей ДДС: чтение пачками, проверка, bulk_create в транзакциях.
+
+    Названия справочников переводятся в идентификаторы по кешу справочников; иерархия
+    проверяется тем же CashFlow.clean, что и при сохранении одной записи.
+    """
+
+    def __init__(self, owner, batch_size=1000, dry_run=False):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        references = get_references(refresh=True)
+        self.statuses = {item.name.lower(): item.id for item in references.statuses}
+        self.operation_types = {item.name.lower(): item.id for item in references.operation_types}
+        self.categories = {(item.name.lower(), item.parent_id): item.id for item in references.categories}
+        self.subcategories = {(item.name.lower(), item.parent_id): item.id for item in references.subcategories}
+
+    @staticmethod
+    def lookup(mapping, key, title, value):
+        if key not in mapping:
+            raise ValueError(f"{title} не найден(а) в справочнике: {value}")
+        return mapping[key]
+
+    def build(self, row):
+        """Создает (не сохраняя) запись ДДС из строки файла"""
+
+        names = {name: str(row.get(name) or "").strip() for name in COLUMNS}
+        status_id = operation_type_id = category_id = subcategory_id = None
+        if names["status"]:
+            status_id = self.lookup(self.statuses, names["status"].lower(), "Статус", names["status"])
+        if names["operation_type"]:
+            operation_type_id = self.lookup(
+                self.operation_types, names["operation_type"].lower(), "Тип операции", names["operation_type"]
+            )
+        if names["category"]:
+            category_id = self.lookup(
+                self.categories, (names["category"].lower(), operation_type_id), "Категория", names["category"]
+            )
+        if names["subcategory"]:
+            subcategory_id = self.lookup(
+                self.subcategories, (names["subcategory"].lower(), category_id), "Подкатегория", names["subcategory"]
+            )
+
+        cashflow = CashFlow(
+            owner=self.owner,
+            date=parse_date(row.get("date")),
+            status_id=status_id,
+            operation_type_id=operation_type_id,
+            category_id=category_id,
+            subcategory_id=subcategory_id,
+            amount=parse_amount(row.get("amount")),
+            comment=names["comment"],
+        )
+        cashflow.full_clean(validate_unique=False)
+        cashflow.search_vector = cashflow.build_search_vector()
+        return cashflow
+
+    def run(self, rows):
+        """Импорт строк файла; все пачки сохраняются в одной транзакции.
+
+        Ошибка формата в середине файла (ImportFormatError) откатывает уже вставленные пачки,
+        так что файл либо импортируется целиком (кроме строк с ошибками), либо не импортируется вовсе.
+        """
+
+        if self.dry_run:
+            return self.import_rows(rows)
+        with transaction.atomic():
+            result = self.import_rows(rows)
+        metrics.record_change("create", result.created)
+        return result
+
+    def import_rows(self, rows):
+        result = ImportResult()
+        started = time.perf_counter()
+        rows = enumerate(rows, start=2)
+
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+
+            cashflows = []
+            for line, row in batch:
+                result.total += 1
+                try:
+                    cashflows.append(self.build(row))
+                except ValidationError as error:
+                    messages = [f"{field}: {'; '.join(errors)}" for field, errors in error.message_dict.items()]
+                    result.errors.append((line, ", ".join(messages)))
+                except ValueError as error:
+                    result.errors.append((line, str(error)))
+
+            if cashflows and not self.dry_run:
+                self.save_batch(cashflows)
+            result.created += len(cashflows)
+
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def save_batch(self, cashflows):
+        """Вставка пачки одним bulk_create и обновление дневных итогов одной дельтой на корзину"""
+
+        deltas = {}
+        for cashflow in cashflows:
+            bucket, amount = cashflow.get_rollup_bucket()
+            count, total = deltas.get(bucket, (0, 0))
+            deltas[bucket] = (count + 1, total + amount)
+
+        CashFlow.objects.bulk_create(cashflows, batch_size=self.batch_size)
+        CashFlowDailyRollup.objects.apply_deltas(deltas)
+        bump_version("cashflow")
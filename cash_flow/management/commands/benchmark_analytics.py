@@ -0,0 +1,91 @@
+import platform
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from django.utils import timezone
+
+from cash_flow.analytics import AnalyticsError, CashFlowFrame
+from cash_flow.benchmarks import BenchmarkError, BenchmarkRunner, save_results
+from cash_flow.models import CashFlowDailyRollup
+from cash_flow.reports import summarize
+
+# Срезы одного окна, как на панели отчетов: (группировки, период)
+SLICES = (
+    ((), None),
+    (("status",), None),
+    (("operation_type",), "month"),
+    (("category",), "month"),
+    (("category", "subcategory"), None),
+    (("status", "operation_type", "category", "subcategory"), "week"),
+    ((), "day"),
+)
+
+
+class Command(BaseCommand):
+    """Сравнение группировок сводного отчета: GROUP BY в PostgreSQL и кадр NumPy в памяти процесса"""
+
+    help = (
+        "Замеряет одинаковые срезы дневных итогов пользователя запросом GROUP BY и группировкой "
+        "закешированного кадра NumPy, проверяет совпадение результатов и сохраняет замеры в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", required=True, help="Email владельца записей")
+        parser.add_argument("--start-date", help="Начало окна (как фильтр списка записей)")
+        parser.add_argument("--end-date", help="Конец окна")
+        parser.add_argument("--iterations", type=int, default=30, help="Число замеров каждого сценария")
+        parser.add_argument("--warmup", type=int, default=3, help="Число прогревочных вызовов сценария")
+        parser.add_argument("--output", default="benchmark-analytics.json", help="Файл для результатов")
+
+    def handle(self, *args, **options):
+        if options["iterations"] <= 0 or options["warmup"] < 0:
+            raise CommandError("--iterations должен быть положительным, --warmup — неотрицательным")
+        owner = get_user_model().objects.filter(email=options["owner"]).first()
+        if owner is None:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+
+        params = QueryDict(mutable=True)
+        for name in ("start_date", "end_date"):
+            if options[name]:
+                params[name] = options[name]
+        rollups = CashFlowDailyRollup.objects.owned_by(owner).filter_by_params(params)
+
+        runner = BenchmarkRunner(options["iterations"], options["warmup"])
+        try:
+            load = runner.measure("numpy_load", lambda: CashFlowFrame.load(rollups))
+            frame = CashFlowFrame.load(rollups)
+        except AnalyticsError as error:
+            raise CommandError(str(error))
+        self.stdout.write(
+            f"Кадр: {len(frame)} строк дневных итогов, {frame.nbytes / 1024:.0f} КБ; загрузка p50 {load['p50_ms']} мс"
+        )
+
+        for group_by, period in SLICES:
+            name = "_".join(group_by or ["total"]) + (f"_by_{period}" if period else "")
+            if summarize(rollups, group_by, period) != frame.summarize(group_by, period):
+                raise CommandError(f"{name}: результаты SQL и NumPy различаются")
+            try:
+                sql = runner.measure(f"sql_{name}", lambda: summarize(rollups, group_by, period))
+                vectorized = runner.measure(f"numpy_{name}", lambda: frame.summarize(group_by, period))
+            except BenchmarkError as error:
+                raise CommandError(str(error))
+            speedup = sql["p50_ms"] / vectorized["p50_ms"] if vectorized["p50_ms"] else 0
+            self.stdout.write(
+                f"{name}: SQL p50 {sql['p50_ms']} мс, NumPy p50 {vectorized['p50_ms']} мс (×{speedup:.1f})"
+            )
+
+        data = {
+            "metadata": {
+                "timestamp": timezone.now().isoformat(),
+                "owner": owner.email,
+                "frame_rows": len(frame),
+                "frame_bytes": frame.nbytes,
+                "iterations": options["iterations"],
+                "warmup": options["warmup"],
+                "python": platform.python_version(),
+            },
+            "results": runner.results,
+        }
+        save_results(options["output"], data)
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
@@ -0,0 +1,189 @@
+import platform
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from cash_flow.benchmarks import BenchmarkError, BenchmarkRunner, compare_results, load_results, save_results
+from cash_flow.models import CashFlow, CashFlowDailyRollup, Status, Subcategory
+from cash_flow.pagination import encode_cursor
+
+
+class Command(BaseCommand):
+    """Набор замеров страниц и эндпоинтов ДДС: перцентили времени ответа и число SQL-запросов"""
+
+    help = (
+        "Замеряет список записей (фильтры, страницы), создание/изменение/удаление, AJAX, API, отчет "
+        "и список записей в админке; результаты сохраняются в JSON. Записи, созданные замером, откатываются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--owner", help="Email пользователя для запросов (по умолчанию — владелец большинства записей)"
+        )
+        parser.add_argument("--admin", help="Email суперпользователя для замера админки (по умолчанию — первый)")
+        parser.add_argument("--iterations", type=int, default=30, help="Число замеров каждого сценария")
+        parser.add_argument("--warmup", type=int, default=3, help="Число прогревочных вызовов сценария")
+        parser.add_argument("--output", default="benchmark-results.json", help="Файл для результатов")
+        parser.add_argument("--compare", help="Файл прошлого прогона: вывести изменение p95")
+
+    def handle(self, *args, **options):
+        if options["iterations"] <= 0 or options["warmup"] < 0:
+            raise CommandError("--iterations должен быть положительным, --warmup — неотрицательным")
+
+        owner = self.get_owner(options["owner"])
+        status = Status.objects.first()
+        subcategory = Subcategory.objects.select_related("category").filter(category__operation_type__isnull=False)
+        subcategory = subcategory.first()
+        if status is None or subcategory is None:
+            raise CommandError("Нужны хотя бы один статус и подкатегория с категорией и типом операции")
+
+        category = subcategory.category
+        form_data = {
+            "date": timezone.localdate().isoformat(),
+            "status": status.pk,
+            "operation_type": category.operation_type_id,
+            "category": category.pk,
+            "subcategory": subcategory.pk,
+            "amount": "100.00",
+            "comment": "benchmark",
+        }
+
+        client = Client()
+        client.force_login(owner)
+        runner = BenchmarkRunner(options["iterations"], options["warmup"])
+        records = CashFlow.objects.owned_by(owner)
+        total = records.count()
+
+        def get(url, **params):
+            return lambda: client.get(url, params)
+
+        def create_record():
+            return CashFlow.objects.create(
+                owner=owner,
+                date=form_data["date"],
+                status=status,
+                operation_type_id=category.operation_type_id,
+                category=category,
+                subcategory=subcategory,
+                amount=form_data["amount"],
+            )
+
+        list_url = reverse("cash_flow:cashflow_list")
+        today = timezone.localdate()
+        scenarios = [
+            ("list", get(list_url)),
+            ("list_offset_deep_page", get(list_url, pagination="offset", page=max(total // 20 // 2, 1))),
+            ("list_category_filter", get(list_url, category=category.pk)),
+            (
+                "list_date_range",
+                get(list_url, start_date=(today - timedelta(days=30)).isoformat(), end_date=today.isoformat()),
+            ),
+            ("list_search", get(list_url, search="оплата")),
+            ("get_categories", get(reverse("cash_flow:get_categories"), operation_type_id=category.operation_type_id)),
+            ("get_subcategories", get(reverse("cash_flow:get_subcategories"), category_id=category.pk)),
+            ("api_cashflows", get(reverse("cash_flow:api_cashflow_list"), expand="category,subcategory")),
+            ("api_hierarchy", get(reverse("cash_flow:api_reference_tree"))),
+            ("report_data", get(reverse("cash_flow:cashflow_report_data"))),
+        ]
+        if total:
+            # Курсор на середину списка: keyset-страница той же глубины, что и offset-страница выше
+            middle = records.for_list().order_by("-date", "-created_at", "-id")[total // 2]
+            scenarios.insert(2, ("list_keyset_deep_page", get(list_url, cursor=encode_cursor("next", middle))))
+
+        admin = self.get_admin(options["admin"])
+        admin_client = Client()
+        if admin is not None:
+            admin_client.force_login(admin)
+            scenarios.append(
+                ("admin_changelist", lambda: admin_client.get(reverse("admin:cash_flow_cashflow_changelist")))
+            )
+
+        scenarios += [
+            ("create", lambda: client.post(reverse("cash_flow:cashflow_create"), form_data)),
+            (
+                "update",
+                lambda record: client.post(
+                    reverse("cash_flow:cashflow_edit", args=[record.pk]), {**form_data, "amount": "200.00"}
+                ),
+                create_record,
+            ),
+            (
+                "delete",
+                lambda record: client.post(reverse("cash_flow:cashflow_delete", args=[record.pk])),
+                create_record,
+            ),
+        ]
+
+        with transaction.atomic():
+            for name, *scenario in scenarios:
+                try:
+                    result = runner.measure(name, *scenario)
+                except BenchmarkError as error:
+                    raise CommandError(str(error))
+                self.stdout.write(
+                    f"{name}: p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, p99 {result['p99_ms']} мс, "
+                    f"запросов {result['queries_min']}–{result['queries_max']}"
+                )
+            transaction.set_rollback(True)
+
+        data = {
+            "metadata": {
+                "timestamp": timezone.now().isoformat(),
+                "owner": owner.email,
+                "owner_rows": total,
+                "total_rows": CashFlow.objects.count(),
+                "rollup_rows": CashFlowDailyRollup.objects.count(),
+                "iterations": options["iterations"],
+                "warmup": options["warmup"],
+                "database": connection.vendor,
+                "cache": settings.CACHES["default"]["BACKEND"],
+                "pagination_mode": settings.CASH_FLOW_PAGINATION_MODE,
+                "count_mode": settings.CASH_FLOW_COUNT_MODE,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+            },
+            "results": runner.results,
+        }
+        save_results(options["output"], data)
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+        if options["compare"]:
+            for name, old, new, change in compare_results(load_results(options["compare"]), data):
+                self.stdout.write(f"{name}: p95 {old} → {new} мс ({change:+.1f}%)")
+
+    def get_owner(self, email):
+        User = get_user_model()
+        if email:
+            owner = User.objects.filter(email=email).first()
+            if owner is None:
+                raise CommandError(f"Пользователь {email} не найден")
+            return owner
+
+        owner_id = (
+            CashFlow.objects.values("owner_id")
+            .annotate(rows=Count("id"))
+            .order_by("-rows")
+            .values_list("owner_id", flat=True)
+            .first()
+        )
+        owner = User.objects.filter(pk=owner_id).first() if owner_id else User.objects.order_by("pk").first()
+        if owner is None:
+            raise CommandError("Нет пользователей: создайте записи командой generate_ledger")
+        return owner
+
+    def get_admin(self, email):
+        admins = get_user_model().objects.filter(is_superuser=True)
+        if email:
+            admin = admins.filter(email=email).first()
+            if admin is None:
+                raise CommandError(f"Суперпользователь {email} не найден")
+            return admin
+        return admins.order_by("pk").first()
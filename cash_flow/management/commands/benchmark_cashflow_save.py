@@ -0,0 +1,122 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.test.utils import CaptureQueriesContext
+
+from cash_flow.forms import CashFlowForm
+from cash_flow.models import CashFlow, Status, Subcategory
+
+
+def legacy_full_clean(cashflow):
+    """Валидация до оптимизации: ForeignKey.validate делает SELECT на каждую ссылку, плюс проверка уникальности"""
+
+    models.Model.clean_fields(cashflow)
+    cashflow.clean()
+    cashflow.validate_unique()
+
+
+class Command(BaseCommand):
+    """Замер числа SQL-запросов и времени на создание и изменение записи ДДС до и после оптимизации валидации"""
+
+    help = (
+        "Сравнивает запросы на создание/изменение записи ДДС через форму и через CashFlow.save(): "
+        "«до» — с проверкой внешних ключей запросами и повторной валидацией в save(), «после» — текущий код"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="Число повторов каждого сценария")
+
+    def handle(self, *args, **options):
+        owner = get_user_model().objects.order_by("pk").first()
+        status = Status.objects.first()
+        subcategory = Subcategory.objects.select_related("category").filter(category__operation_type__isnull=False)
+        subcategory = subcategory.first()
+        if status is None or subcategory is None:
+            raise CommandError("Нужны хотя бы один статус и подкатегория с категорией и типом операции")
+
+        category = subcategory.category
+        data = {
+            "date": "2025-01-01",
+            "status": status.pk,
+            "operation_type": category.operation_type_id,
+            "category": category.pk,
+            "subcategory": subcategory.pk,
+            "amount": "100.00",
+            "comment": "benchmark",
+        }
+
+        def valid_form(form):
+            if not form.is_valid():
+                raise CommandError(form.errors.as_text())
+            return form
+
+        def form_create(legacy=False):
+            form = valid_form(CashFlowForm(data=data))
+            form.instance.owner = owner
+            if not legacy:
+                return form.save()
+            # Раньше форма проверяла внешние ключи запросами, а save() повторял полную валидацию
+            legacy_full_clean(form.instance)
+            legacy_full_clean(form.instance)
+            form.instance.save(validate=False)
+            return form.instance
+
+        def form_update(cashflow, legacy=False):
+            instance = CashFlow.objects.get(pk=cashflow.pk)
+            form = valid_form(CashFlowForm(data={**data, "amount": "200.00"}, instance=instance))
+            if not legacy:
+                form.save()
+                return
+            legacy_full_clean(form.instance)
+            legacy_full_clean(form.instance)
+            form.instance.save(validate=False)
+
+        def model_create(legacy=False):
+            cashflow = CashFlow(
+                owner=owner,
+                date=data["date"],
+                status_id=status.pk,
+                operation_type_id=category.operation_type_id,
+                category_id=category.pk,
+                subcategory_id=subcategory.pk,
+                amount=data["amount"],
+            )
+            if legacy:
+                legacy_full_clean(cashflow)
+            cashflow.save(validate=not legacy)
+            return cashflow
+
+        def model_update(cashflow, legacy=False):
+            cashflow = CashFlow.objects.get(pk=cashflow.pk)
+            cashflow.amount = 300
+            if legacy:
+                legacy_full_clean(cashflow)
+            cashflow.save(validate=not legacy)
+
+        scenarios = [
+            ("Форма: создание", lambda created, legacy: form_create(legacy)),
+            ("Форма: изменение (с загрузкой записи)", form_update),
+            ("save(): создание", lambda created, legacy: model_create(legacy)),
+            ("save(): изменение (с загрузкой записи)", model_update),
+        ]
+
+        with transaction.atomic():
+            created = model_create()
+            for name, scenario in scenarios:
+                results = []
+                for legacy in (True, False):
+                    # Первый прогон прогревает кеш справочников
+                    scenario(created, legacy)
+                    with CaptureQueriesContext(connection) as queries:
+                        scenario(created, legacy)
+                    started = time.perf_counter()
+                    for _ in range(options["iterations"]):
+                        scenario(created, legacy)
+                    elapsed = (time.perf_counter() - started) / options["iterations"] * 1000
+                    results.append(f"запросов {len(queries)}, {elapsed:.2f} мс")
+                self.stdout.write(f"{name}: до — {results[0]}; после — {results[1]}")
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Замеры выполнены, тестовые записи удалены"))
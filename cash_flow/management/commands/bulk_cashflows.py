@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow import bulk
+from cash_flow.forms import CashFlowBulkForm
+from cash_flow.models import CashFlow, CashFlowQuerySet
+
+
+class Command(BaseCommand):
+    """Массовое изменение справочников или удаление записей ДДС пользователя"""
+
+    help = (
+        "Переназначает статус, категорию и подкатегорию или удаляет записи ДДС пользователя, "
+        "выбранные фильтрами списка или идентификаторами, набором UPDATE/DELETE"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=bulk.BULK_ACTIONS)
+        parser.add_argument("--owner", required=True, help="Email владельца записей")
+        parser.add_argument("--ids", help="Идентификаторы записей через запятую (по умолчанию — все по фильтрам)")
+        for name in CashFlowQuerySet.FILTER_PARAMS:
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, help=f"Фильтр списка записей {name}")
+        parser.add_argument("--set-status", type=int, help="Новый статус")
+        parser.add_argument("--set-category", type=int, help="Новая категория (тип операции следует за ней)")
+        parser.add_argument("--set-subcategory", type=int, help="Новая подкатегория")
+        parser.add_argument("--batch-size", type=int, default=None, help="Записей в одном UPDATE/DELETE")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать записи")
+
+    def handle(self, *args, **options):
+        owner = get_user_model().objects.filter(email=options["owner"]).first()
+        if owner is None:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+
+        form = CashFlowBulkForm(
+            {
+                "action": options["action"],
+                "scope": "selected" if options["ids"] else "filter",
+                "ids": options["ids"] or "",
+                "status": options["set_status"] or "",
+                "category": options["set_category"] or "",
+                "subcategory": options["set_subcategory"] or "",
+            }
+        )
+        if not form.is_valid():
+            raise CommandError(" ".join(error for errors in form.errors.values() for error in errors))
+
+        params = {name: options[name] for name in CashFlowQuerySet.FILTER_PARAMS if options[name]}
+        queryset = form.get_queryset(CashFlow.objects.owned_by(owner).filter_by_params(params))
+        try:
+            if options["dry_run"]:
+                self.stdout.write(f"Будет затронуто записей: {queryset.count()}")
+                return
+            count = bulk.run(queryset, options["action"], form.cleaned_data.get("changes"), options["batch_size"])
+        except (ValueError, ValidationError) as error:
+            raise CommandError(f"Некорректные параметры фильтрации: {error}")
+
+        verb = "Удалено" if options["action"] == "delete" else "Изменено"
+        self.stdout.write(self.style.SUCCESS(f"{verb} записей: {count}"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.models import CashFlowDailyBalance, CashFlowDailyRollup
+
+
+class Command(BaseCommand):
+    """Сверка дневных итогов и остатков ДДС с исходными записями"""
+
+    help = "Проверяет, что дневные итоги и остатки совпадают с суммами по исходным записям ДДС"
+
+    def handle(self, *args, **options):
+        mismatches = [
+            *(
+                (bucket, expected, actual, "итогах")
+                for bucket, expected, actual in CashFlowDailyRollup.objects.find_mismatches()
+            ),
+            *(
+                (key, expected, actual, "остатках")
+                for key, expected, actual in CashFlowDailyBalance.objects.find_mismatches()
+            ),
+        ]
+        for key, expected, actual, table in mismatches:
+            self.stdout.write(
+                self.style.ERROR(
+                    f"{key}: ожидалось {expected[0]} / {expected[1]}, в {table} {actual[0]} / {actual[1]}"
+                )
+            )
+        if mismatches:
+            raise CommandError(f"Расхождений: {len(mismatches)}. Запустите rebuild_rollups")
+        self.stdout.write(self.style.SUCCESS("Дневные итоги и остатки совпадают с записями ДДС"))
@@ -0,0 +1,49 @@
+from datetime import timedelta
+from itertools import combinations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from cash_flow.models import CashFlow, CashFlowQuerySet
+
+
+class Command(BaseCommand):
+    """Выводит планы EXPLAIN ANALYZE для всех комбинаций фильтров списка записей ДДС"""
+
+    help = "Печатает план запроса страницы списка ДДС для каждой комбинации фильтров"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=20, help="Размер страницы (LIMIT)")
+        parser.add_argument("--days", type=int, default=30, help="Ширина диапазона дат для фильтров по дате")
+        parser.add_argument("--no-analyze", action="store_true", help="Только EXPLAIN, без выполнения запроса")
+
+    def handle(self, *args, **options):
+        sample = CashFlow.objects.order_by("-date").first()
+        if sample is None:
+            raise CommandError("Нет записей ДДС для построения планов")
+
+        values = {
+            "start_date": str(sample.date - timedelta(days=options["days"])),
+            "end_date": str(sample.date),
+            "status": sample.status_id,
+            "operation_type": sample.operation_type_id,
+            "category": sample.category_id,
+            "subcategory": sample.subcategory_id,
+            "search": (sample.comment or "платеж").split()[0],
+        }
+        explain_options = {}
+        if connection.vendor == "postgresql" and not options["no_analyze"]:
+            explain_options = {"analyze": True, "buffers": True}
+
+        names = CashFlowQuerySet.FILTER_PARAMS
+        for size in range(len(names) + 1):
+            for combination in combinations(names, size):
+                params = {name: values[name] for name in combination}
+                queryset = CashFlow.objects.filter(owner_id=sample.owner_id).for_list().filter_by_params(params)
+                queryset = queryset[: options["page_size"]]
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f"Фильтры: {', '.join(combination) or 'без фильтров'}"))
+                self.stdout.write(queryset.explain(**explain_options))
+                self.stdout.write("")
+
+        self.stdout.write(self.style.SUCCESS(f"Построено планов: {2 ** len(names)}"))
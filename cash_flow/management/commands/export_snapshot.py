@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.models import CashFlow
+from cash_flow.snapshots import SNAPSHOT_FORMATS, SnapshotError, SnapshotExporter
+
+
+class Command(BaseCommand):
+    """Выгрузка денормализованного снимка записей ДДС в Parquet или Arrow для аналитики"""
+
+    help = (
+        "Выгружает записи ДДС с названиями справочников в файлы Parquet/Arrow по месяцам; "
+        "повторный запуск добавляет только записи, измененные после прошлой выгрузки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", required=True, help="Каталог снимка")
+        parser.add_argument("--format", dest="snapshot_format", choices=SNAPSHOT_FORMATS, default="parquet")
+        parser.add_argument("--owner", help="Email владельца (по умолчанию — все записи)")
+        parser.add_argument("--batch-size", type=int, default=None, help="Строк в одной порции чтения и записи")
+        parser.add_argument(
+            "--full", action="store_true", help="Выгрузить все записи заново, учитывая удаления (без --owner)"
+        )
+        parser.add_argument("--overlap", type=int, default=60, help="Перекрытие окна инкрементальной выгрузки, секунд")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] is not None and options["batch_size"] <= 0:
+            raise CommandError("--batch-size должен быть положительным")
+
+        queryset, scope = CashFlow.objects.all(), "all"
+        if options["owner"]:
+            owner = get_user_model().objects.filter(email=options["owner"]).first()
+            if owner is None:
+                raise CommandError(f"Пользователь {options['owner']} не найден")
+            # Отметка инкрементальной выгрузки своя у каждого владельца
+            queryset, scope = queryset.owned_by(owner), f"owner={owner.pk}"
+
+        try:
+            exporter = SnapshotExporter(
+                options["output"], options["snapshot_format"], options["batch_size"], options["overlap"]
+            )
+            result = exporter.run(full=options["full"], queryset=queryset, scope=scope)
+        except SnapshotError as error:
+            raise CommandError(str(error))
+
+        since = result["since"].isoformat() if result["since"] else "начала"
+        self.stdout.write(
+            self.style.SUCCESS(f"Выгружено записей: {result['rows']} в {result['files']} файлах (изменения с {since})")
+        )
@@ -0,0 +1,143 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from cash_flow.models import (CashFlow, CashFlowDailyBalance, CashFlowDailyRollup, Category, OperationType, Status,
+                              Subcategory)
+from cash_flow.versions import bump_version
+
+# Справочники по умолчанию, если в БД нет ни одной подкатегории с полной иерархией
+DEFAULT_REFERENCES = {
+    "Списание": {
+        "Маркетинг": ["Avito", "Farpost", "Яндекс.Директ"],
+        "Инфраструктура": ["VPS", "Прокси", "Домены"],
+        "Зарплата": ["Оклад", "Премия"],
+        "Налоги": ["НДФЛ", "УСН"],
+    },
+    "Пополнение": {
+        "Продажи": ["Розница", "Опт"],
+        "Инвестиции": ["Дивиденды", "Проценты по вкладам"],
+    },
+}
+DEFAULT_STATUSES = ["Бизнес", "Личное", "Налог"]
+
+COMMENTS = [
+    "",
+    "Оплата по счету",
+    "Оплата рекламы",
+    "Закупка товара",
+    "Продление подписки",
+    "Перевод от клиента",
+    "Возврат средств",
+    "Ежемесячный платеж",
+]
+
+
+class Command(BaseCommand):
+    """Генерация синтетического журнала записей ДДС для замеров производительности"""
+
+    help = "Создает указанное число записей ДДС пачками bulk_create с заданным разбросом дат и категорий"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000, help="Число записей")
+        parser.add_argument("--days", type=int, default=730, help="Глубина истории в днях от сегодняшней даты")
+        parser.add_argument("--users", type=int, default=1, help="Число владельцев bench1@example.com, ...")
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.0,
+            help="Неравномерность подкатегорий (закон Ципфа, вес 1/ранг^skew); 0 — равномерно",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000, help="Размер пачки вставки")
+        parser.add_argument("--seed", type=int, default=None, help="Зерно генератора случайных чисел")
+
+    def handle(self, *args, **options):
+        if options["rows"] <= 0 or options["days"] < 0 or options["users"] <= 0:
+            raise CommandError("--rows и --users должны быть положительными, --days — неотрицательным")
+
+        rng = random.Random(options["seed"])
+        owners = self.get_owners(options["users"])
+        statuses = self.get_statuses()
+        leaves = self.get_leaves()
+        weights = [1 / (rank ** options["skew"]) for rank in range(1, len(leaves) + 1)]
+        today = timezone.localdate()
+
+        last_id = CashFlow.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        created = 0
+        while created < options["rows"]:
+            size = min(options["batch_size"], options["rows"] - created)
+            batch = []
+            for subcategory, category, operation_type in rng.choices(leaves, weights, k=size):
+                batch.append(
+                    CashFlow(
+                        owner=rng.choice(owners),
+                        date=today - timedelta(days=rng.randint(0, options["days"])),
+                        status=rng.choice(statuses),
+                        operation_type_id=operation_type,
+                        category_id=category,
+                        subcategory_id=subcategory,
+                        amount=Decimal(str(round(rng.lognormvariate(8, 1.2), 2) or "0.01")),
+                        comment=rng.choice(COMMENTS),
+                    )
+                )
+            with transaction.atomic():
+                CashFlow.objects.bulk_create(batch, batch_size=options["batch_size"])
+            created += size
+            self.stdout.write(f"Создано записей: {created} из {options['rows']}")
+
+        # Производные данные считаются одним проходом по таблице, а не на каждую пачку
+        CashFlow.objects.filter(pk__gt=last_id).update_search_vectors()
+        buckets = CashFlowDailyRollup.objects.rebuild()
+        CashFlowDailyBalance.objects.rebuild()
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(CashFlow._meta.db_table)}")
+        bump_version("cashflow")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано записей: {created} для {len(owners)} пользователей; дневных итогов: {buckets}. "
+                f"Владельцы: {', '.join(owner.email for owner in owners[:3])}{'...' if len(owners) > 3 else ''}"
+            )
+        )
+
+    def get_owners(self, count):
+        User = get_user_model()
+        owners = []
+        for number in range(1, count + 1):
+            owner, created = User.objects.get_or_create(email=f"bench{number}@example.com")
+            if created:
+                owner.set_unusable_password()
+                owner.save(update_fields=["password"])
+            owners.append(owner)
+        return owners
+
+    def get_statuses(self):
+        if not Status.objects.exists():
+            for name in DEFAULT_STATUSES:
+                Status.objects.create(name=name)
+        return list(Status.objects.all())
+
+    def get_leaves(self):
+        """Подкатегории с полной иерархией: [(подкатегория, категория, тип операции)]"""
+
+        leaves = list(
+            Subcategory.objects.filter(category__operation_type__isnull=False)
+            .order_by("pk")
+            .values_list("pk", "category_id", "category__operation_type_id")
+        )
+        if leaves:
+            return leaves
+
+        for operation_type_name, categories in DEFAULT_REFERENCES.items():
+            operation_type, _ = OperationType.objects.get_or_create(name=operation_type_name)
+            for category_name, subcategories in categories.items():
+                category, _ = Category.objects.get_or_create(name=category_name, operation_type=operation_type)
+                for subcategory_name in subcategories:
+                    Subcategory.objects.get_or_create(name=subcategory_name, category=category)
+        return self.get_leaves()
@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.importers import CashFlowImporter, ImportFormatError, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    """Потоковый импорт записей ДДС из CSV или XLSX"""
+
+    help = "Импортирует записи ДДС из CSV/XLSX пачками через bulk_create"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу CSV или XLSX")
+        parser.add_argument("--owner", required=True, help="Электронная почта пользователя-владельца записей")
+        parser.add_argument("--format", choices=["csv", "xlsx"], help="Формат файла (по умолчанию — по расширению)")
+        parser.add_argument(
+            "--encoding", help="Кодировка CSV (по умолчанию UTF-8, если файл в ней не читается — cp1251)"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Размер пачки вставки")
+        parser.add_argument("--dry-run", action="store_true", help="Только проверить строки, ничего не сохранять")
+        parser.add_argument("--max-errors", type=int, default=50, help="Сколько ошибок по строкам вывести")
+
+    def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(email=options["owner"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+
+        importer = CashFlowImporter(owner, batch_size=options["batch_size"], dry_run=options["dry_run"])
+        try:
+            with open(options["path"], "rb") as file:
+                rows = read_rows(file, options["format"] or detect_format(options["path"]), options["encoding"])
+                result = importer.run(rows)
+        except (OSError, ImportFormatError) as error:
+            raise CommandError(str(error))
+
+        for line, message in result.errors[: options["max_errors"]]:
+            self.stdout.write(self.style.ERROR(f"Строка {line}: {message}"))
+        if len(result.errors) > options["max_errors"]:
+            self.stdout.write(self.style.ERROR(f"... и еще {len(result.errors) - options['max_errors']} ошибок"))
+
+        action = "Проверено без сохранения" if options["dry_run"] else "Импортировано"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{action}: {result.created} из {result.total} строк, ошибок: {len(result.errors)}, "
+                f"{result.elapsed:.2f} с ({result.rows_per_second:.0f} строк/с)"
+            )
+        )
@@ -0,0 +1,96 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from cash_flow.benchmarks import run_asgi_load, run_wsgi_load, save_results
+from cash_flow.models import Subcategory
+
+SCENARIOS = ("lookups", "list", "report", "mixed")
+
+
+class Command(BaseCommand):
+    """Нагрузочный тест: пропускная способность одного воркера под WSGI (потоки) и ASGI (цикл событий)"""
+
+    help = (
+        "Прогоняет одинаковые GET-запросы через WSGI- и ASGI-обработчики Django в этом процессе "
+        "и сравнивает запросы в секунду и перцентили времени ответа"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", help="Email пользователя (по умолчанию — первый)")
+        parser.add_argument("--scenario", choices=SCENARIOS, default="mixed", help="Набор адресов")
+        parser.add_argument("--requests", type=int, default=500, help="Число запросов на каждый режим")
+        parser.add_argument("--concurrency", type=int, default=20, help="Одновременных запросов (потоков WSGI)")
+        parser.add_argument("--mode", choices=("wsgi", "asgi", "both"), default="both")
+        parser.add_argument("--output", help="Файл JSON для результатов")
+
+    def handle(self, *args, **options):
+        if options["requests"] <= 0 or options["concurrency"] <= 0:
+            raise CommandError("--requests и --concurrency должны быть положительными")
+
+        User = get_user_model()
+        owner = User.objects.filter(email=options["owner"]) if options["owner"] else User.objects.order_by("pk")
+        owner = owner.first()
+        if owner is None:
+            raise CommandError("Пользователь не найден")
+
+        urls = self.get_urls(options["scenario"])
+        # Сессия в БД: оба обработчика проходят обычную проверку входа
+        client = Client()
+        client.force_login(owner)
+        headers = {"cookie": f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"}
+        connections.close_all()
+
+        modes = ["wsgi", "asgi"] if options["mode"] == "both" else [options["mode"]]
+        runners = {
+            "wsgi": lambda: run_wsgi_load(
+                get_wsgi_application(), urls, options["requests"], options["concurrency"], headers
+            ),
+            "asgi": lambda: run_asgi_load(
+                get_asgi_application(), urls, options["requests"], options["concurrency"], headers
+            ),
+        }
+        results = {}
+        try:
+            for mode in modes:
+                results[mode] = result = runners[mode]()
+                self.stdout.write(
+                    f"{mode.upper()}: {result['throughput_rps']} запросов/с, p50 {result['p50_ms']} мс, "
+                    f"p95 {result['p95_ms']} мс, p99 {result['p99_ms']} мс, ошибок {result['errors']}"
+                )
+        finally:
+            client.logout()
+
+        if len(results) == 2 and results["wsgi"]["throughput_rps"]:
+            ratio = results["asgi"]["throughput_rps"] / results["wsgi"]["throughput_rps"]
+            self.stdout.write(f"ASGI/WSGI по пропускной способности: {ratio:.2f}")
+        if options["output"]:
+            save_results(options["output"], {"scenario": options["scenario"], "urls": urls, "results": results})
+            self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+    def get_urls(self, scenario):
+        subcategory = Subcategory.objects.select_related("category").filter(category__operation_type__isnull=False)
+        subcategory = subcategory.first()
+        if subcategory is None:
+            raise CommandError("Нужна подкатегория с категорией и типом операции")
+
+        category = subcategory.category
+        lookups = [
+            f"{reverse('cash_flow:get_categories')}?{urlencode({'operation_type_id': category.operation_type_id})}",
+            f"{reverse('cash_flow:get_subcategories')}?{urlencode({'category_id': category.pk})}",
+        ]
+        pages = [reverse("cash_flow:cashflow_list"), f"{reverse('cash_flow:cashflow_list')}?pagination=keyset"]
+        reports = [f"{reverse('cash_flow:cashflow_report_data')}?{urlencode({'group_by': 'category'})}"]
+        return {
+            "lookups": lookups,
+            "list": pages,
+            "report": reports,
+            "mixed": lookups * 3 + pages + reports,
+        }[scenario]
@@ -0,0 +1,61 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cash_flow import partitions
+
+
+class Command(BaseCommand):
+    """Секционирование таблицы записей ДДС по диапазонам дат (PostgreSQL)"""
+
+    help = (
+        "convert — перевести таблицу на секции по месяцам/годам; create — создать секции наперед "
+        "(запускать по расписанию); detach — отсоединить старые секции; status — список секций"
+    )
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest="action", required=True)
+
+        convert_parser = actions.add_parser("convert", help="Перевести таблицу на секции")
+        convert_parser.add_argument("--interval", choices=partitions.INTERVALS, default="month", help="Шаг секций")
+        convert_parser.add_argument("--ahead", type=int, default=3, help="Сколько будущих секций создать")
+
+        create_parser = actions.add_parser("create", help="Создать будущие секции")
+        create_parser.add_argument("--ahead", type=int, default=3, help="На сколько периодов вперед")
+
+        detach_parser = actions.add_parser("detach", help="Отсоединить секции раньше даты")
+        detach_parser.add_argument("--before", type=date.fromisoformat, required=True, help="Дата ГГГГ-ММ-ДД")
+        detach_parser.add_argument("--drop", action="store_true", help="Удалить отсоединенные таблицы")
+
+        actions.add_parser("status", help="Показать секции")
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        if action == "convert":
+            try:
+                partitions.convert(options["interval"], options["ahead"])
+            except partitions.PartitioningError as error:
+                raise CommandError(str(error))
+            self.stdout.write(
+                self.style.SUCCESS(f"Таблица секционирована, секций: {len(partitions.list_partitions())}")
+            )
+            return
+
+        if not partitions.is_partitioned():
+            raise CommandError("Таблица записей ДДС не секционирована: сначала выполните convert")
+
+        if action == "create":
+            interval = partitions.detect_interval(partitions.list_partitions()) or "month"
+            until = partitions.period_start(timezone.localdate(), interval)
+            for _ in range(options["ahead"]):
+                until = partitions.next_period(until, interval)
+            created = partitions.ensure_partitions(until, interval)
+            self.stdout.write(self.style.SUCCESS(f"Создано секций: {len(created)} {', '.join(created)}"))
+        elif action == "detach":
+            detached = partitions.detach_partitions(options["before"], drop=options["drop"])
+            verb = "Удалено" if options["drop"] else "Отсоединено (оставлено как архив)"
+            self.stdout.write(self.style.SUCCESS(f"{verb} секций: {len(detached)} {', '.join(detached)}"))
+        else:
+            for name, start, end in partitions.list_partitions():
+                self.stdout.write(f"{name}: {start} — {end}")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from cash_flow.models import CashFlowDailyBalance, CashFlowDailyRollup
+from cash_flow.versions import bump_version
+
+
+class Command(BaseCommand):
+    """Пересборка дневных итогов и остатков записей ДДС по исходным записям"""
+
+    help = "Полностью пересобирает таблицы дневных итогов и остатков ДДС"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Размер пакета вставки")
+
+    def handle(self, *args, **options):
+        created = CashFlowDailyRollup.objects.rebuild(batch_size=options["batch_size"])
+        days = CashFlowDailyBalance.objects.rebuild(batch_size=options["batch_size"])
+        # Отчеты и кадры аналитики, построенные по старым итогам, устаревают
+        bump_version("cashflow")
+        self.stdout.write(self.style.SUCCESS(f"Дневные итоги пересобраны, корзин: {created}; дней остатков: {days}"))
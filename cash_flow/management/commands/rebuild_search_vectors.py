@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from cash_flow.models import CashFlow
+from cash_flow.versions import bump_version
+
+
+class Command(BaseCommand):
+    """Пересчет поисковых векторов записей ДДС"""
+
+    help = "Пересчитывает search_vector всех записей ДДС (например, после loaddata)"
+
+    def handle(self, *args, **options):
+        updated = CashFlow.objects.update_search_vectors()
+        bump_version("cashflow")
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано записей: {updated}"))
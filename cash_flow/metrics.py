@@ -0,0 +1,255 @@
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+
+# Границы корзин гистограммы времени ответа, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Метрика → (тип Prometheus, описание)
+METRICS = {
+    "cashflow_http_requests_total": ("counter", "HTTP-запросы по имени URL, методу и статусу ответа"),
+    "cashflow_http_request_duration_seconds": ("histogram", "Время ответа по имени URL"),
+    "cashflow_db_queries_total": ("counter", "SQL-запросы, выполненные при обработке запросов, по имени URL"),
+    "cashflow_cache_requests_total": ("counter", "Обращения к кешу приложения: попадания (hit) и промахи (miss)"),
+    "cashflow_records_changes_total": ("counter", "Созданные, измененные и удаленные записи ДДС"),
+    "cashflow_metrics_processes": ("gauge", "Число процессов, чьи метрики вошли в ответ"),
+}
+
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+FILE_PREFIX = "metrics-"
+
+# Счетчики завершившихся процессов: их файлы удаляются, а значения переносятся сюда, чтобы счетчики не убывали
+ARCHIVE_FILE = "archive.json"
+LOCK_FILE = ".lock"
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы процесса; изменения защищены блокировкой (потоки WSGI/ASGI)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed_at = time.monotonic()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(DURATION_BUCKETS, value)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(DURATION_BUCKETS) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        """Копия значений в виде, пригодном для JSON"""
+
+        with self.lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [
+                    [name, list(labels), list(buckets), total, count]
+                    for (name, labels), (buckets, total, count) in self.histograms.items()
+                ],
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+def record_request(view, method, status, duration, queries):
+    method = method if method in HTTP_METHODS else "other"
+    registry.inc("cashflow_http_requests_total", view=view, method=method, status=str(status))
+    registry.observe("cashflow_http_request_duration_seconds", duration, view=view)
+    registry.inc("cashflow_db_queries_total", queries, view=view)
+    flush()
+
+
+def record_cache(cache_name, hit):
+    registry.inc("cashflow_cache_requests_total", cache=cache_name, result="hit" if hit else "miss")
+
+
+def record_change(action, count=1):
+    registry.inc("cashflow_records_changes_total", count, action=action)
+
+
+def flush(force=False):
+    """Сохраняет снимок метрик процесса в CASH_FLOW_METRICS_DIR (не чаще раза в интервал).
+
+    Каждый процесс пишет свой файл, а /metrics суммирует файлы всех процессов, поэтому
+    ответ не зависит от того, какой воркер принял запрос сборщика.
+    """
+
+    directory = settings.CASH_FLOW_METRICS_DIR
+    if not directory:
+        return
+    with registry.lock:
+        now = time.monotonic()
+        if not force and now - registry.flushed_at < settings.CASH_FLOW_METRICS_FLUSH_INTERVAL:
+            return
+        registry.flushed_at = now
+
+    write_snapshot(Path(directory) / f"{FILE_PREFIX}{os.getpid()}.json", registry.snapshot())
+
+
+def write_snapshot(path, snapshot):
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temporary.write_text(json.dumps(snapshot))
+    os.replace(temporary, path)
+
+
+def read_snapshot(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        # Файл процесса мог исчезнуть или быть недописан: пропускаем до следующего сбора
+        return None
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def mark_process_dead(pid, directory=None):
+    """Переносит метрики завершившегося процесса в архив каталога и удаляет его файл.
+
+    collect() вызывает ее сам для файлов процессов, которых уже нет; сервер может вызывать ее
+    и сразу при выходе воркера (хук child_exit в gunicorn), как multiprocess.mark_process_dead
+    в prometheus_client.
+    """
+
+    directory = Path(directory or settings.CASH_FLOW_METRICS_DIR)
+    path = directory / f"{FILE_PREFIX}{pid}.json"
+    with open(directory / LOCK_FILE, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not path.exists():
+            return
+        snapshots = [read_snapshot(directory / ARCHIVE_FILE), read_snapshot(path)]
+        counters, histograms = merge(snapshot for snapshot in snapshots if snapshot)
+        archive = {
+            "archived": True,
+            "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+            "histograms": [
+                [name, list(labels), buckets, total, count]
+                for (name, labels), (buckets, total, count) in histograms.items()
+            ],
+        }
+        write_snapshot(directory / ARCHIVE_FILE, archive)
+        path.unlink()
+
+
+def collect():
+    """Снимки метрик живых процессов и архив завершившихся (или только текущего процесса без общего каталога)"""
+
+    directory = settings.CASH_FLOW_METRICS_DIR
+    if not directory:
+        return [registry.snapshot()]
+
+    flush(force=True)
+    for path in Path(directory).glob(f"{FILE_PREFIX}*.json"):
+        pid = path.stem.removeprefix(FILE_PREFIX)
+        if pid.isdigit() and int(pid) > 0 and not process_alive(int(pid)):
+            mark_process_dead(int(pid), directory)
+
+    paths = [*Path(directory).glob(f"{FILE_PREFIX}*.json"), Path(directory) / ARCHIVE_FILE]
+    return [snapshot for snapshot in map(read_snapshot, paths) if snapshot]
+
+
+def merge(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, buckets, total, count in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+    return counters, histograms
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render(snapshots):
+    """Текстовый формат экспозиции Prometheus"""
+
+    counters, histograms = merge(snapshots)
+    counters[("cashflow_metrics_processes", ())] = sum(1 for snapshot in snapshots if not snapshot.get("archived"))
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        if kind == "histogram":
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip((*DURATION_BUCKETS, "+Inf"), buckets):
+                    cumulative += bucket
+                    lines.append(f"{name}_bucket{format_labels((*labels, ('le', str(bound))))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        else:
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+@never_cache
+def metrics_view(request):
+    """Метрики в формате Prometheus; при заданном CASH_FLOW_METRICS_TOKEN нужен заголовок Authorization: Bearer"""
+
+    if not settings.CASH_FLOW_METRICS:
+        raise Http404
+    token = settings.CASH_FLOW_METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse("Unauthorized", status=401, content_type="text/plain")
+    return HttpResponse(render(collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Последние значения процесса не должны теряться при перезапуске воркера
+atexit.register(flush, force=True)
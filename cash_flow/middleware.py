@@ -0,0 +1,219 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics
+
+logger = logging.getLogger("cash_flow.instrumentation")
+
+# Сколько повторяющихся запросов выводить в лог и длина SQL в нем
+DUPLICATES_LOGGED = 5
+SQL_LOG_LENGTH = 300
+
+# Наблюдатели SQL-запросов текущего HTTP-запроса. Контекстная переменная переходит в потоки
+# sync_to_async, поэтому запросы асинхронных представлений учитываются так же, как синхронных
+query_observers = ContextVar("cash_flow_query_observers", default=())
+
+
+def observe_queries(execute, sql, params, many, context):
+    observers = query_observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for observer in observers:
+            observer.record(sql, elapsed)
+
+
+def install_query_observer(connection):
+    """Подключает observe_queries к соединению с БД (один раз на объект соединения потока)"""
+
+    if observe_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(observe_queries)
+
+
+class ObservedRequestMiddleware:
+    """Основа middleware, которые наблюдают SQL-запросы обработки запроса в синхронном и асинхронном режимах.
+
+    Наследник реализует start(request) → наблюдатель (или None, чтобы пропустить запрос)
+    и finish(request, response, observer) → response.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        observer = self.start(request)
+        if observer is None:
+            return self.get_response(request)
+        token = query_observers.set((*query_observers.get(), observer))
+        try:
+            response = self.get_response(request)
+        finally:
+            query_observers.reset(token)
+        return self.finish(request, response, observer)
+
+    async def __acall__(self, request):
+        observer = self.start(request)
+        if observer is None:
+            return await self.get_response(request)
+        token = query_observers.set((*query_observers.get(), observer))
+        try:
+            response = await self.get_response(request)
+        finally:
+            query_observers.reset(token)
+        return self.finish(request, response, observer)
+
+    def start(self, request):
+        raise NotImplementedError
+
+    def finish(self, request, response, observer):
+        raise NotImplementedError
+
+
+def loaded_user_id(request):
+    """Пользователь запроса, только если обработка его уже загрузила: лог не добавляет своих запросов"""
+
+    # request.user кеширует пользователя в _cached_user, request.auser() — в _acached_user
+    for user in (getattr(request, "_cached_user", None), getattr(request, "_acached_user", None)):
+        if user is not None:
+            return user.pk
+    return None
+
+
+class RequestMetrics:
+    """Замеры одного запроса: SQL-запросы и время рендеринга шаблона"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+
+    def record(self, sql, elapsed):
+        self.db_time += elapsed
+        self.queries += 1
+        # SQL без параметров: один и тот же запрос в цикле (N+1) дает одинаковый текст
+        self.statements[sql] += 1
+
+    def duplicates(self, threshold):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+class InstrumentationMiddleware(ObservedRequestMiddleware):
+    """Время запроса, число и время SQL-запросов, время рендеринга и повторяющиеся запросы.
+
+    Включается настройкой CASH_FLOW_INSTRUMENTATION; доля замеряемых запросов задается
+    CASH_FLOW_INSTRUMENTATION_SAMPLE_RATE, остальные проходят без накладных расходов.
+    Результат отдается заголовком Server-Timing и строкой JSON в логгер cash_flow.instrumentation.
+    """
+
+    def __init__(self, get_response):
+        if not settings.CASH_FLOW_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.sample_rate = settings.CASH_FLOW_INSTRUMENTATION_SAMPLE_RATE
+        self.duplicate_threshold = settings.CASH_FLOW_INSTRUMENTATION_DUPLICATE_THRESHOLD
+
+    def start(self, request):
+        if random.random() >= self.sample_rate:
+            return None
+        request._instrumentation = RequestMetrics()
+        return request._instrumentation
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.started
+        duplicates = metrics.duplicates(self.duplicate_threshold)
+        response["Server-Timing"] = ", ".join(
+            [
+                f'total;dur={total * 1000:.1f};desc="Total"',
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'render;dur={metrics.render_time * 1000:.1f};desc="Template"',
+                f'dup;desc="{sum(count for _, count in duplicates)} duplicated queries"',
+            ]
+        )
+        self.log(request, response, metrics, total, duplicates)
+        return response
+
+    def process_template_response(self, request, response):
+        # Middleware стоит первым, поэтому этот обработчик вызывается последним, прямо перед render()
+        metrics = getattr(request, "_instrumentation", None)
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def record_render_time(response):
+                metrics.render_time += time.perf_counter() - started
+
+            response.add_post_render_callback(record_render_time)
+        return response
+
+    def log(self, request, response, metrics, total, duplicates):
+        match = request.resolver_match
+        data = {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "user": loaded_user_id(request),
+            "total_ms": round(total * 1000, 1),
+            "db_ms": round(metrics.db_time * 1000, 1),
+            "queries": metrics.queries,
+            "render_ms": round(metrics.render_time * 1000, 1),
+            "duplicates": [
+                {"sql": sql[:SQL_LOG_LENGTH], "count": count} for sql, count in duplicates[:DUPLICATES_LOGGED]
+            ],
+        }
+        level = logging.WARNING if duplicates else logging.INFO
+        logger.log(level, json.dumps(data, ensure_ascii=False))
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов обработки одного запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+
+    def record(self, sql, elapsed):
+        self.count += 1
+
+
+class MetricsMiddleware(ObservedRequestMiddleware):
+    """Число запросов, время ответа и число SQL-запросов по имени URL для /metrics.
+
+    Включается настройкой CASH_FLOW_METRICS. Запросы без совпадения с URL учитываются
+    под именем unmatched, чтобы произвольные адреса не раздували число рядов метрик.
+    """
+
+    def __init__(self, get_response):
+        if not settings.CASH_FLOW_METRICS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def start(self, request):
+        return QueryCounter()
+
+    def finish(self, request, response, queries):
+        duration = time.perf_counter() - queries.started
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        metrics.record_request(view, request.method, response.status_code, duration, queries.count)
+        return response
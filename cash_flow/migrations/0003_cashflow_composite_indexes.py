@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0002_alter_cashflow_category_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="cashflow",
+            name="category",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="cash_flow.category",
+                verbose_name="Категория",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="cashflow",
+            name="operation_type",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="cash_flow.operationtype",
+                verbose_name="Тип операции",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="cashflow",
+            name="status",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="cash_flow.status",
+                verbose_name="Статус",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="cashflow",
+            name="subcategory",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="cash_flow.subcategory",
+                verbose_name="Подкатегория",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["-date", "-created_at"], name="cashflow_date_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["status", "-date"], name="cashflow_status_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["operation_type", "-date"], name="cashflow_optype_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["category", "-date"], name="cashflow_category_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["subcategory", "-date"], name="cashflow_subcat_date_idx"),
+        ),
+    ]
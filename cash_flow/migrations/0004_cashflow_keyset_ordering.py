@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0003_cashflow_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="cashflow",
+            options={
+                "ordering": ["-date", "-created_at", "-id"],
+                "verbose_name": "Запись ДДС",
+                "verbose_name_plural": "Записи ДДС",
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name="cashflow",
+            name="cashflow_date_created_idx",
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["-date", "-created_at", "-id"], name="cashflow_date_created_id_idx"),
+        ),
+    ]
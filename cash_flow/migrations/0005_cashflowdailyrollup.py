@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+BUCKET_FIELDS = ("date", "status_id", "operation_type_id", "category_id", "subcategory_id")
+
+
+def build_rollups(apps, schema_editor):
+    """Заполняет дневные итоги по уже существующим записям ДДС"""
+
+    CashFlow = apps.get_model("cash_flow", "CashFlow")
+    CashFlowDailyRollup = apps.get_model("cash_flow", "CashFlowDailyRollup")
+    totals = (
+        CashFlow.objects.order_by()
+        .values_list(*BUCKET_FIELDS)
+        .annotate(records_count=Count("id"), amount_sum=Sum("amount"))
+    )
+    CashFlowDailyRollup.objects.bulk_create(
+        [
+            CashFlowDailyRollup(**dict(zip(BUCKET_FIELDS, bucket)), records_count=count, amount_sum=amount)
+            for *bucket, count, amount in totals.iterator(chunk_size=5000)
+        ],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0004_cashflow_keyset_ordering"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CashFlowDailyRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField(verbose_name="Дата")),
+                ("records_count", models.IntegerField(default=0, verbose_name="Количество записей")),
+                ("amount_sum", models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name="Сумма")),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="cash_flow.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+                (
+                    "operation_type",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="cash_flow.operationtype",
+                        verbose_name="Тип операции",
+                    ),
+                ),
+                (
+                    "status",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="cash_flow.status",
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "subcategory",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="cash_flow.subcategory",
+                        verbose_name="Подкатегория",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Дневной итог ДДС",
+                "verbose_name_plural": "Дневные итоги ДДС",
+                "indexes": [
+                    models.Index(
+                        fields=["date", "status", "operation_type", "category", "subcategory"],
+                        name="rollup_bucket_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
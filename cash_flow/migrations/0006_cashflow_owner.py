@@ -0,0 +1,128 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+BUCKET_FIELDS = ("owner_id", "date", "status_id", "operation_type_id", "category_id", "subcategory_id")
+
+
+def assign_owner(apps, schema_editor):
+    """Передает существующие записи первому суперпользователю (или первому пользователю)"""
+
+    CashFlow = apps.get_model("cash_flow", "CashFlow")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    owner = User.objects.order_by("-is_superuser", "pk").first()
+    if owner is not None:
+        CashFlow.objects.filter(owner__isnull=True).update(owner=owner)
+
+
+def rebuild_rollups(apps, schema_editor):
+    """Пересобирает дневные итоги: владелец стал частью корзины"""
+
+    CashFlow = apps.get_model("cash_flow", "CashFlow")
+    CashFlowDailyRollup = apps.get_model("cash_flow", "CashFlowDailyRollup")
+    CashFlowDailyRollup.objects.all().delete()
+    totals = (
+        CashFlow.objects.order_by()
+        .values_list(*BUCKET_FIELDS)
+        .annotate(records_count=Count("id"), amount_sum=Sum("amount"))
+    )
+    CashFlowDailyRollup.objects.bulk_create(
+        [
+            CashFlowDailyRollup(**dict(zip(BUCKET_FIELDS, bucket)), records_count=count, amount_sum=amount)
+            for *bucket, count, amount in totals.iterator(chunk_size=5000)
+        ],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0005_cashflowdailyrollup"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="cashflow",
+            name="cashflow_status_date_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="cashflow",
+            name="cashflow_optype_date_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="cashflow",
+            name="cashflow_category_date_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="cashflow",
+            name="cashflow_subcat_date_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="cashflow",
+            name="cashflow_date_created_id_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="cashflowdailyrollup",
+            name="rollup_bucket_idx",
+        ),
+        migrations.AddField(
+            model_name="cashflow",
+            name="owner",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="cashflows",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Владелец",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashflowdailyrollup",
+            name="owner",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Владелец",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["owner", "-date", "-created_at", "-id"], name="cashflow_owner_keyset_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["owner", "status", "-date"], name="cashflow_owner_status_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["owner", "operation_type", "-date"], name="cashflow_owner_optype_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["owner", "category", "-date"], name="cashflow_owner_cat_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["owner", "subcategory", "-date"], name="cashflow_owner_subcat_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowdailyrollup",
+            index=models.Index(
+                fields=["owner", "date", "status", "operation_type", "category", "subcategory"],
+                name="rollup_owner_bucket_idx",
+            ),
+        ),
+        migrations.RunPython(assign_owner, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_rollups, migrations.RunPython.noop),
+    ]
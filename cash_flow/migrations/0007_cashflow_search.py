@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:49
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+REFERENCES = (
+    ("status", "Status"),
+    ("operation_type", "OperationType"),
+    ("category", "Category"),
+    ("subcategory", "Subcategory"),
+)
+
+
+TRIGRAM_INDEXES = (
+    ("category_name_trgm_idx", "cash_flow_category"),
+    ("subcategory_name_trgm_idx", "cash_flow_subcategory"),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Триграммные индексы по названиям для поиска по части названия (ILIKE '%...%').
+
+    pg_trgm входит в contrib и есть не на каждом сервере: без него поиск работает
+    по тем же запросам, но без индексов на небольших таблицах справочников.
+    """
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (name gin_trgm_ops)")
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    for name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def fill_search_vectors(apps, schema_editor):
+    """Заполняет поисковые векторы существующих записей одним UPDATE"""
+
+    CashFlow = apps.get_model("cash_flow", "CashFlow")
+    names = [
+        Subquery(apps.get_model("cash_flow", model).objects.filter(pk=OuterRef(f"{field}_id")).values("name")[:1])
+        for field, model in REFERENCES
+    ]
+    CashFlow.objects.update(
+        search_vector=SearchVector("comment", config="russian", weight="A")
+        + SearchVector(*names, config="russian", weight="B")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0006_cashflow_owner"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cashflow",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый вектор"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_vector"], name="cashflow_search_idx"),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+
+BALANCE_SIGNS = {"Пополнение": 1, "Списание": -1}
+
+
+def build_balances(apps, schema_editor):
+    """Заполняет остатки по уже существующим записям ДДС"""
+
+    CashFlow = apps.get_model("cash_flow", "CashFlow")
+    CashFlowDailyBalance = apps.get_model("cash_flow", "CashFlowDailyBalance")
+    signed = Case(
+        *[When(operation_type__name=name, then=F("amount") * sign) for name, sign in BALANCE_SIGNS.items()],
+        default=Value(0),
+        output_field=DecimalField(max_digits=18, decimal_places=2),
+    )
+    daily = (
+        CashFlow.objects.order_by("owner_id", "status_id", "date")
+        .values_list("owner_id", "status_id", "date")
+        .annotate(net=Sum(signed))
+    )
+    batch, series, balance = [], None, 0
+    for owner_id, status_id, day, net in daily.iterator(chunk_size=5000):
+        if (owner_id, status_id) != series:
+            series, balance = (owner_id, status_id), 0
+        if net:
+            balance += net
+            batch.append(
+                CashFlowDailyBalance(owner_id=owner_id, status_id=status_id, date=day, net=net, balance=balance)
+            )
+    CashFlowDailyBalance.objects.bulk_create(batch, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0007_cashflow_search"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CashFlowDailyBalance",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField(verbose_name="Дата")),
+                (
+                    "net",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name="Оборот за день"),
+                ),
+                (
+                    "balance",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=18, verbose_name="Остаток на конец дня"
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+                (
+                    "status",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="cash_flow.status",
+                        verbose_name="Статус",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Остаток ДДС",
+                "verbose_name_plural": "Остатки ДДС",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("owner", "status", "date"), name="balance_owner_status_date_uniq", nulls_distinct=False
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_balances, migrations.RunPython.noop),
+    ]
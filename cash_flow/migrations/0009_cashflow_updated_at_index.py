@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0008_cashflowdailybalance"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(fields=["updated_at"], name="cashflow_updated_at_idx"),
+        ),
+    ]
@@ -1,7 +1,22 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchVector, SearchVectorField
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
 from django.utils import timezone
 
+from .references import get_references, hierarchy_errors
+
+# Конфигурация полнотекстового поиска PostgreSQL
+SEARCH_CONFIG = "russian"
+
+# Знак суммы записи в остатке по названию типа операции; записи других типов остаток не меняют
+BALANCE_SIGNS = {"Пополнение": 1, "Списание": -1}
+
 
 class Status(models.Model):
     """Модель статусов (Бизнес, Личное, Налог)"""
@@ -77,49 +92,727 @@ class Subcategory(models.Model):
         return f"{self.name} ({self.category})"
 
 
+class CashFlowFilterQuerySet(models.QuerySet):
+    """Фильтры списка записей ДДС для моделей с полями date, status, operation_type, category, subcategory"""
+
+    FILTER_PARAMS = ("start_date", "end_date", "status", "operation_type", "category", "subcategory")
+
+    REFERENCE_RELATED = (
+        "status",
+        "operation_type",
+        "category__operation_type",
+        "subcategory__category__operation_type",
+    )
+
+    LIST_FIELDS = (
+        "date",
+        "amount",
+        "comment",
+        "created_at",
+        "status__name",
+        "operation_type__name",
+        "category__name",
+        "category__operation_type__name",
+        "subcategory__name",
+        "subcategory__category__name",
+        "subcategory__category__operation_type__name",
+    )
+
+    def owned_by(self, user):
+        """Данные одного пользователя; у анонимного пользователя данных нет"""
+
+        if user.pk is None:
+            return self.none()
+        return self.filter(owner_id=user.pk)
+
+    def filter_by_params(self, params):
+        """Фильтрация по GET-параметрам списка записей"""
+
+        queryset = self
+
+        start_date = params.get("start_date")
+        end_date = params.get("end_date")
+        if start_date:
+            queryset = queryset.filter(date__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(date__lte=end_date)
+
+        # Фильтрация по справочникам: статус, тип операции, категория, подкатегория
+        for name in ("status", "operation_type", "category", "subcategory"):
+            value = params.get(name)
+            if value:
+                queryset = queryset.filter(**{f"{name}_id": value})
+
+        return queryset
+
+
+class CashFlowQuerySet(CashFlowFilterQuerySet):
+    """Набор запросов для записей ДДС с фильтрами, поиском и проекциями для списков"""
+
+    FILTER_PARAMS = (*CashFlowFilterQuerySet.FILTER_PARAMS, "search")
+
+    def filter_by_params(self, params):
+        return super().filter_by_params(params).search(params.get("search"))
+
+    def search(self, query):
+        """Полнотекстовый поиск по комментарию и названиям справочников (search_vector, GIN).
+
+        Части названий категорий и подкатегорий («Ави» → «Avito») находятся через ILIKE,
+        который ускоряют триграммные индексы по названиям (миграция 0007, если есть pg_trgm).
+        """
+
+        query = (query or "").strip()
+        if not query:
+            return self
+        names = Q(name__icontains=query)
+        return self.filter(
+            Q(search_vector=SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch"))
+            | Q(category_id__in=Category.objects.filter(names).values("pk"))
+            | Q(subcategory_id__in=Subcategory.objects.filter(names).values("pk"))
+        )
+
+    def update_search_vectors(self, **changes):
+        """Пересчитывает поисковые векторы записей набора одним UPDATE.
+
+        changes — новые значения полей (status_id, category_id...), которые записывает тот же
+        UPDATE: названия их справочников берутся из кеша, остальные — подзапросами.
+        """
+
+        references = get_references() if changes else None
+        names = []
+        for field, model in CashFlow.SEARCH_REFERENCES:
+            if f"{field}_id" in changes:
+                item = getattr(references, f"{field}_by_id").get(changes[f"{field}_id"])
+                names.append(Value(item.name if item else ""))
+            else:
+                names.append(Subquery(model.objects.filter(pk=OuterRef(f"{field}_id")).values("name")[:1]))
+        return self.update(
+            **changes,
+            search_vector=SearchVector("comment", config=SEARCH_CONFIG, weight="A")
+            + SearchVector(*names, config=SEARCH_CONFIG, weight="B"),
+        )
+
+    def report_aggregates(self):
+        """Агрегаты для сводных отчетов по исходным записям"""
+
+        return {"count": Count("id"), "total": Sum("amount")}
+
+    def with_references(self):
+        """Подтягивает справочники одним JOIN-запросом вместо запроса на каждую строку"""
+
+        return self.select_related(*self.REFERENCE_RELATED)
+
+    def for_list(self):
+        """Проекция для таблицы записей: только отображаемые колонки и справочники"""
+
+        return self.with_references().only(*self.LIST_FIELDS)
+
+
 class CashFlow(models.Model):
     """Записи движения денежных средств"""
 
+    # Одиночные индексы по внешним ключам заменены составными (владелец, ключ, -date) из Meta.indexes
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name="Владелец",
+        related_name="cashflows",
+        blank=True,
+        null=True,
+        db_index=False,
+    )
     date = models.DateField(default=timezone.now, verbose_name="Дата операции")
-    status = models.ForeignKey(Status, on_delete=models.SET_NULL, verbose_name="Статус", blank=True, null=True)
+    status = models.ForeignKey(
+        Status, on_delete=models.SET_NULL, verbose_name="Статус", blank=True, null=True, db_index=False
+    )
     operation_type = models.ForeignKey(
-        OperationType, on_delete=models.SET_NULL, verbose_name="Тип операции", blank=True, null=True
+        OperationType, on_delete=models.SET_NULL, verbose_name="Тип операции", blank=True, null=True, db_index=False
+    )
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, verbose_name="Категория", blank=True, null=True, db_index=False
     )
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, verbose_name="Категория", blank=True, null=True)
     subcategory = models.ForeignKey(
-        Subcategory, on_delete=models.SET_NULL, verbose_name="Подкатегория", blank=True, null=True
+        Subcategory, on_delete=models.SET_NULL, verbose_name="Подкатегория", blank=True, null=True, db_index=False
     )
     amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма")
     comment = models.TextField(blank=True, verbose_name="Комментарий")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания записи")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+    # Комментарий (вес A) и названия справочников (вес B); пересчитывается в save()
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name="Поисковый вектор")
+
+    REFERENCE_FIELDS = ("status", "operation_type", "category", "subcategory")
+    SEARCH_REFERENCES = (
+        ("status", Status),
+        ("operation_type", OperationType),
+        ("category", Category),
+        ("subcategory", Subcategory),
+    )
+
+    objects = CashFlowQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Запись ДДС"
         verbose_name_plural = "Записи ДДС"
-        ordering = ["-date", "-created_at"]
+        ordering = ["-date", "-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["owner", "-date", "-created_at", "-id"], name="cashflow_owner_keyset_idx"),
+            models.Index(fields=["owner", "status", "-date"], name="cashflow_owner_status_date_idx"),
+            models.Index(fields=["owner", "operation_type", "-date"], name="cashflow_owner_optype_date_idx"),
+            models.Index(fields=["owner", "category", "-date"], name="cashflow_owner_cat_date_idx"),
+            models.Index(fields=["owner", "subcategory", "-date"], name="cashflow_owner_subcat_date_idx"),
+            # Инкрементальная выгрузка снимка выбирает записи, измененные после прошлого запуска
+            models.Index(fields=["updated_at"], name="cashflow_updated_at_idx"),
+            GinIndex(fields=["search_vector"], name="cashflow_search_idx"),
+        ]
+
+    def clean_fields(self, exclude=None):
+        """Ссылки на справочники проверяются в clean() по кешу, без запроса к БД на каждое поле.
+
+        Владелец задается кодом (текущий пользователь), его существование гарантирует внешний ключ БД.
+        """
+
+        super().clean_fields(exclude={*(exclude or ()), *self.REFERENCE_FIELDS, "owner"})
 
     def clean(self):
         """Валидация логических зависимостей"""
 
-        if (
-            self.operation_type_id
-            and self.category_id
-            and hasattr(self, "category")
-            and hasattr(self, "operation_type")
-        ):
-            if self.category.operation_type_id != self.operation_type_id:
-                raise ValidationError({"category": "Выбранная категория не принадлежит выбранному типу операции"})
+        errors = hierarchy_errors(self.operation_type_id, self.category_id, self.subcategory_id, self.status_id)
+        if errors:
+            raise ValidationError(errors)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rollup_bucket = instance.get_rollup_bucket()
+        return instance
+
+    def get_rollup_bucket(self):
+        """Корзина дневных итогов записи и ее сумма; None, если нужные поля не загружены"""
+
+        deferred = self.get_deferred_fields()
+        if any(field in deferred for field in ("amount", *CashFlowDailyRollup.BUCKET_FIELDS)):
+            return None
+        return tuple(getattr(self, field) for field in CashFlowDailyRollup.BUCKET_FIELDS), self.amount
+
+    def get_stored_rollup_bucket(self):
+        """Корзина записи в том виде, в каком она сохранена в БД"""
+
+        bucket = getattr(self, "_rollup_bucket", None)
+        if bucket is None and self.pk is not None:
+            stored = (
+                CashFlow.objects.filter(pk=self.pk).values_list(*CashFlowDailyRollup.BUCKET_FIELDS, "amount").first()
+            )
+            if stored is not None:
+                bucket = stored[:-1], stored[-1]
+        return bucket
+
+    def build_search_vector(self):
+        """Выражение поискового вектора по комментарию и названиям справочников из кеша"""
+
+        references = get_references()
+        names = []
+        for field, _ in self.SEARCH_REFERENCES:
+            item = getattr(references, f"{field}_by_id").get(getattr(self, f"{field}_id"))
+            names.append(Value(item.name if item else ""))
+        return SearchVector(Value(self.comment or ""), config=SEARCH_CONFIG, weight="A") + SearchVector(
+            *names, config=SEARCH_CONFIG, weight="B"
+        )
+
+    def save(self, *args, validate=True, **kwargs):
+        """Переопределяем save для вызова валидации, обновления дневных итогов и поискового вектора.
+
+        validate=False пропускает валидацию модели, когда запись уже проверена формой.
+        """
+
+        if validate:
+            # Уникальных полей, кроме первичного ключа, у записи нет
+            self.full_clean(validate_unique=False)
+        update_fields = kwargs.get("update_fields")
+        search_fields = {"comment", *self.REFERENCE_FIELDS, *(f"{field}_id" for field in self.REFERENCE_FIELDS)}
+        if update_fields is None or search_fields & set(update_fields):
+            self.search_vector = self.build_search_vector()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "search_vector"}
+        old_bucket = None if self._state.adding else self.get_stored_rollup_bucket()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            new_bucket = self.get_rollup_bucket()
+            CashFlowDailyRollup.objects.apply_deltas(CashFlowDailyRollup.bucket_deltas(old_bucket, new_bucket))
+        self._rollup_bucket = new_bucket
+        # Вектор посчитан в БД: поле становится отложенным и при обращении загрузится заново
+        vars(self).pop("search_vector", None)
+
+    def delete(self, *args, **kwargs):
+        old_bucket = self.get_stored_rollup_bucket()
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            CashFlowDailyRollup.objects.apply_deltas(CashFlowDailyRollup.bucket_deltas(old_bucket, None))
+        self._rollup_bucket = None
+        return result
+
+    def __str__(self):
+        return f"{self.date} - {self.operation_type} - {self.amount} руб."
+
+
+class CashFlowRollupQuerySet(CashFlowFilterQuerySet):
+    """Набор запросов для дневных итогов с инкрементальным обновлением и пересборкой"""
+
+    def report_aggregates(self):
+        """Агрегаты для сводных отчетов по дневным итогам"""
+
+        return {"count": Sum("records_count"), "total": Sum("amount_sum")}
+
+    # Больше корзин, чем затрагивает изменение одной записи, обновляются набором запросов
+    SINGLE_RECORD_BUCKETS = 2
+
+    def apply_deltas(self, deltas):
+        """Прибавляет к корзинам изменения вида {корзина: (количество, сумма)}.
+
+        Корзина — кортеж значений BUCKET_FIELDS. Если корзины еще нет, она создается.
+        """
+
+        deltas = {bucket: delta for bucket, delta in deltas.items() if delta[0] or delta[1]}
+        if len(deltas) > self.SINGLE_RECORD_BUCKETS:
+            self.apply_bulk_deltas(deltas)
+        else:
+            for bucket, (count, amount) in deltas.items():
+                lookup = dict(zip(CashFlowDailyRollup.BUCKET_FIELDS, bucket))
+                target = self.filter(**lookup).order_by("pk").values("pk")[:1]
+                updated = self.filter(pk__in=target).update(
+                    records_count=F("records_count") + count, amount_sum=F("amount_sum") + amount
+                )
+                if not updated:
+                    self.create(**lookup, records_count=count, amount_sum=amount)
+        # Остатки меняются вместе с итогами: все пути записи (save, импорт, массовые действия) проходят здесь
+        CashFlowDailyBalance.objects.apply_rollup_deltas(deltas)
+
+    def apply_bulk_deltas(self, deltas):
+        """apply_deltas для многих корзин: один SELECT существующих корзин, один UPDATE и один INSERT.
+
+        Суммы прибавляются выражениями F() в CASE по первичному ключу, а не записываются
+        прочитанными значениями, поэтому параллельные изменения тех же корзин не теряются.
+        """
+
+        owners = {bucket[0] for bucket in deltas}
+        owner_filter = Q(owner_id__in=owners - {None})
+        if None in owners:
+            owner_filter |= Q(owner__isnull=True)
+        existing = {}
+        candidates = self.filter(owner_filter, date__in={bucket[1] for bucket in deltas}).order_by("-pk")
+        for rollup in candidates.only("pk", *CashFlowDailyRollup.BUCKET_FIELDS):
+            # По убыванию pk: при дубликатах корзины остается первая, как в обновлении по одной корзине
+            existing[tuple(getattr(rollup, field) for field in CashFlowDailyRollup.BUCKET_FIELDS)] = rollup
+
+        changed, created = [], []
+        for bucket, (count, amount) in deltas.items():
+            rollup = existing.get(bucket)
+            if rollup is None:
+                lookup = dict(zip(CashFlowDailyRollup.BUCKET_FIELDS, bucket))
+                created.append(CashFlowDailyRollup(**lookup, records_count=count, amount_sum=amount))
+                continue
+            rollup.records_count = F("records_count") + count
+            rollup.amount_sum = F("amount_sum") + amount
+            changed.append(rollup)
+        self.bulk_update(changed, ["records_count", "amount_sum"])
+        self.bulk_create(created)
+
+    def raw_totals(self, cashflows=None):
+        """Итоги по корзинам, посчитанные по исходным записям ДДС (всем или из набора cashflows)"""
+
+        return (
+            (CashFlow.objects.all() if cashflows is None else cashflows)
+            .order_by()
+            .values_list(*CashFlowDailyRollup.BUCKET_FIELDS)
+            .annotate(records_count=Count("id"), amount_sum=Sum("amount"))
+        )
+
+    def rebuild(self, batch_size=5000):
+        """Полностью пересобирает дневные итоги по исходным записям; возвращает число корзин"""
+
+        with transaction.atomic():
+            self.all().delete()
+            batch = []
+            created = 0
+            for *bucket, count, amount in self.raw_totals().iterator(chunk_size=batch_size):
+                lookup = dict(zip(CashFlowDailyRollup.BUCKET_FIELDS, bucket))
+                batch.append(CashFlowDailyRollup(**lookup, records_count=count, amount_sum=amount))
+                if len(batch) >= batch_size:
+                    created += len(self.bulk_create(batch))
+                    batch = []
+            created += len(self.bulk_create(batch))
+        return created
+
+    def find_mismatches(self):
+        """Сверяет дневные итоги с исходными записями; возвращает [(корзина, ожидаемое, фактическое)]"""
+
+        expected = {tuple(bucket): (count, amount) for *bucket, count, amount in self.raw_totals()}
+        actual = {
+            tuple(bucket): (count, amount)
+            for *bucket, count, amount in self.order_by()
+            .values_list(*CashFlowDailyRollup.BUCKET_FIELDS)
+            .annotate(count=Sum("records_count"), amount=Sum("amount_sum"))
+            if count or amount
+        }
+        empty = (0, Decimal("0.00"))
+        return [
+            (bucket, expected.get(bucket, empty), actual.get(bucket, empty))
+            for bucket in sorted(expected.keys() | actual.keys(), key=str)
+            if expected.get(bucket, empty) != actual.get(bucket, empty)
+        ]
+
+
+class CashFlowDailyRollup(models.Model):
+    """Дневные итоги записей ДДС по владельцу, статусу, типу операции, категории и подкатегории"""
+
+    BUCKET_FIELDS = ("owner_id", "date", "status_id", "operation_type_id", "category_id", "subcategory_id")
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name="Владелец",
+        blank=True,
+        null=True,
+        db_index=False,
+        related_name="+",
+    )
+    date = models.DateField(verbose_name="Дата")
+    status = models.ForeignKey(
+        Status,
+        on_delete=models.SET_NULL,
+        verbose_name="Статус",
+        blank=True,
+        null=True,
+        db_index=False,
+        related_name="+",
+    )
+    operation_type = models.ForeignKey(
+        OperationType,
+        on_delete=models.SET_NULL,
+        verbose_name="Тип операции",
+        blank=True,
+        null=True,
+        db_index=False,
+        related_name="+",
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        verbose_name="Категория",
+        blank=True,
+        null=True,
+        db_index=False,
+        related_name="+",
+    )
+    subcategory = models.ForeignKey(
+        Subcategory,
+        on_delete=models.SET_NULL,
+        verbose_name="Подкатегория",
+        blank=True,
+        null=True,
+        db_index=False,
+        related_name="+",
+    )
+    records_count = models.IntegerField(default=0, verbose_name="Количество записей")
+    amount_sum = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name="Сумма")
 
-        if self.category_id and self.subcategory_id and hasattr(self, "subcategory") and hasattr(self, "category"):
-            if self.subcategory.category_id != self.category_id:
-                raise ValidationError({"subcategory": "Выбранная подкатегория не принадлежит выбранной категории"})
+    objects = CashFlowRollupQuerySet.as_manager()
 
-    def save(self, *args, **kwargs):
-        """Переопределяем save для вызова валидации"""
+    class Meta:
+        verbose_name = "Дневной итог ДДС"
+        verbose_name_plural = "Дневные итоги ДДС"
+        indexes = [
+            models.Index(
+                fields=["owner", "date", "status", "operation_type", "category", "subcategory"],
+                name="rollup_owner_bucket_idx",
+            ),
+        ]
+
+    @staticmethod
+    def bucket_deltas(old_bucket, new_bucket):
+        """Изменения корзин при переходе записи из old_bucket в new_bucket (любая может быть None)"""
+
+        deltas = {}
+        if old_bucket is not None:
+            bucket, amount = old_bucket
+            count, total = deltas.get(bucket, (0, 0))
+            deltas[bucket] = (count - 1, total - amount)
+        if new_bucket is not None:
+            bucket, amount = new_bucket
+            count, total = deltas.get(bucket, (0, 0))
+            deltas[bucket] = (count + 1, total + amount)
+        return deltas
 
-        self.full_clean()
-        super().save(*args, **kwargs)
+    def __str__(self):
+        return f"{self.date}: {self.records_count} записей, {self.amount_sum} руб."
+
+
+class CashFlowBalanceQuerySet(models.QuerySet):
+    """Набор запросов для остатков: инкрементальное обновление, пересборка и выборки на дату"""
+
+    def series_condition(self, owner_id, status_id):
+        """Условие SQL на ряд остатков (владелец, статус) с учетом NULL"""
+
+        parts, params = [], []
+        for column, value in (("owner_id", owner_id), ("status_id", status_id)):
+            if value is None:
+                parts.append(f"{column} IS NULL")
+            else:
+                parts.append(f"{column} = %s")
+                params.append(value)
+        return " AND ".join(parts), params
+
+    def apply_rollup_deltas(self, deltas):
+        """Переносит изменения дневных итогов {корзина: (количество, сумма)} в ряды остатков"""
+
+        references = get_references()
+        if not all(references.knows(operation_type_id=bucket[3]) for bucket in deltas):
+            references = get_references(refresh=True)
+
+        series = {}
+        for (owner_id, day, status_id, operation_type_id, *_), (count, amount) in deltas.items():
+            operation_type = references.operation_type_by_id.get(operation_type_id)
+            sign = BALANCE_SIGNS.get(operation_type.name) if operation_type else None
+            if sign:
+                changes = series.setdefault((owner_id, status_id), {})
+                changes[day] = changes.get(day, 0) + sign * amount
+
+        self.apply_changes(series)
+
+    def apply_changes(self, series):
+        """Прибавляет обороты {(владелец, статус): {дата: сумма}} к рядам остатков, по shift на ряд"""
+
+        for (owner_id, status_id), changes in series.items():
+            changes = {day: amount for day, amount in changes.items() if amount}
+            if changes:
+                self.shift(owner_id, status_id, changes)
+
+    def operation_type_changes(self, operation_type_id, sign):
+        """Обороты записей типа операции по рядам и дням, умноженные на sign (по дневным итогам)"""
+
+        series = {}
+        rows = (
+            CashFlowDailyRollup.objects.filter(operation_type_id=operation_type_id)
+            .order_by()
+            .values_list("owner_id", "status_id", "date")
+            .annotate(amount=Sum("amount_sum"))
+        )
+        for owner_id, status_id, day, amount in rows:
+            series.setdefault((owner_id, status_id), {})[day] = sign * amount
+        return series
+
+    def status_changes(self, status_id):
+        """Обороты рядов статуса, которые при его удалении переходят в ряды без статуса"""
+
+        series = {}
+        for owner_id, day, net in self.filter(status_id=status_id).values_list("owner_id", "date", "net"):
+            series.setdefault((owner_id, None), {})[day] = net
+        return series
+
+    def discard_range(self, start, end):
+        """Убирает из рядов дни [start, end): остатки следующих дней уменьшаются на их обороты"""
+
+        days = self.filter(date__gte=start, date__lt=end)
+        series = {}
+        for owner_id, status_id, day, net in days.values_list("owner_id", "status_id", "date", "net"):
+            series.setdefault((owner_id, status_id), {})[day] = -net
+        self.apply_changes(series)
+        days.delete()
+
+    def shift(self, owner_id, status_id, changes):
+        """Прибавляет {дата: сумма} к оборотам дней ряда и пересчитывает остатки начиная с самой ранней даты.
+
+        Два запроса на ряд при любом числе дат: вставка или увеличение оборотов дней
+        (INSERT ... ON CONFLICT) и один UPDATE нарастающего итога оконной функцией.
+        Обновляются только дни ряда не раньше изменения — O(дней), а не O(записей).
+        """
+
+        table = connections[self.db].ops.quote_name(CashFlowDailyBalance._meta.db_table)
+        condition, series_params = self.series_condition(owner_id, status_id)
+        values, params = [], []
+        for day, amount in changes.items():
+            values.append("(%s, %s, %s, %s, 0)")
+            params += [owner_id, status_id, day, amount]
+        start = min(changes)
+
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (owner_id, status_id, date, net, balance)
+                VALUES {", ".join(values)}
+                ON CONFLICT (owner_id, status_id, date) DO UPDATE SET net = {table}.net + EXCLUDED.net
+                """,
+                params,
+            )
+            cursor.execute(
+                f"""
+                UPDATE {table} AS target SET balance = running.balance
+                FROM (
+                    SELECT id, COALESCE(
+                        (SELECT balance FROM {table} WHERE {condition} AND date < %s ORDER BY date DESC LIMIT 1), 0
+                    ) + SUM(net) OVER (ORDER BY date) AS balance
+                    FROM {table}
+                    WHERE {condition} AND date >= %s
+                ) AS running
+                WHERE target.id = running.id AND target.balance <> running.balance
+                """,
+                [*series_params, start, *series_params, start],
+            )
+
+    def expected(self):
+        """Обороты и остатки по исходным записям ДДС: [(владелец, статус, дата, оборот, остаток)]"""
+
+        signed = Case(
+            *[When(operation_type__name=name, then=F("amount") * sign) for name, sign in BALANCE_SIGNS.items()],
+            default=Value(0),
+            output_field=DecimalField(max_digits=18, decimal_places=2),
+        )
+        daily = (
+            CashFlow.objects.order_by("owner_id", "status_id", "date")
+            .values_list("owner_id", "status_id", "date")
+            .annotate(net=Sum(signed))
+        )
+        series, balance = None, 0
+        for owner_id, status_id, day, net in daily.iterator(chunk_size=5000):
+            if (owner_id, status_id) != series:
+                series, balance = (owner_id, status_id), 0
+            # День без оборота не меняет остаток, строка ряда для него не нужна
+            if net:
+                balance += net
+                yield owner_id, status_id, day, net, balance
+
+    def rebuild(self, batch_size=5000):
+        """Полностью пересобирает остатки по исходным записям; возвращает число дней в рядах"""
+
+        with transaction.atomic():
+            self.all().delete()
+            batch = []
+            created = 0
+            for owner_id, status_id, day, net, balance in self.expected():
+                batch.append(
+                    CashFlowDailyBalance(owner_id=owner_id, status_id=status_id, date=day, net=net, balance=balance)
+                )
+                if len(batch) >= batch_size:
+                    created += len(self.bulk_create(batch))
+                    batch = []
+            created += len(self.bulk_create(batch))
+        return created
+
+    def find_mismatches(self):
+        """Сверяет остатки с исходными записями; возвращает [(ряд и дата, ожидаемое, фактическое)]"""
+
+        expected = {
+            (owner_id, status_id, day): (net, balance) for owner_id, status_id, day, net, balance in self.expected()
+        }
+        actual = {
+            (owner_id, status_id, day): (net, balance)
+            for owner_id, status_id, day, net, balance in self.order_by().values_list(
+                "owner_id", "status_id", "date", "net", "balance"
+            )
+        }
+        # Строка дня, все записи которого удалены, остается с нулевым оборотом: она равна отсутствующей
+        actual = {key: value for key, value in actual.items() if value[0]}
+        empty = (None, None)
+        return [
+            (key, expected.get(key, empty), actual.get(key, empty))
+            for key in sorted(expected.keys() | actual.keys(), key=str)
+            if expected.get(key, empty) != actual.get(key, empty)
+        ]
+
+    def balances_on(self, day):
+        """Остатки на конец дня по статусам: {статус: остаток}; без фильтра по владельцу — сумма по владельцам"""
+
+        latest = (
+            self.filter(date__lte=day)
+            .order_by("owner_id", "status_id", "-date")
+            .distinct("owner_id", "status_id")
+            .values_list("status_id", "balance")
+        )
+        balances = {}
+        for status_id, balance in latest:
+            balances[status_id] = balances.get(status_id, 0) + balance
+        return balances
+
+    def curve(self, start, end):
+        """Остаток на конец каждого дня периода по статусам: {статус: [(дата, остаток), ...]}"""
+
+        opening = {}
+        latest = (
+            self.filter(date__lt=start)
+            .order_by("owner_id", "status_id", "-date")
+            .distinct("owner_id", "status_id")
+            .values_list("owner_id", "status_id", "balance")
+        )
+        for owner_id, status_id, balance in latest:
+            opening[(owner_id, status_id)] = balance
+
+        changes = {}
+        for owner_id, status_id, day, balance in (
+            self.filter(date__gte=start, date__lte=end)
+            .order_by("date")
+            .values_list("owner_id", "status_id", "date", "balance")
+        ):
+            changes.setdefault(day, []).append(((owner_id, status_id), balance))
+
+        current = dict(opening)
+        statuses = {status_id for _, status_id in current} | {
+            series[1] for rows in changes.values() for series, _ in rows
+        }
+        result = {status_id: [] for status_id in statuses}
+        day = start
+        while day <= end:
+            for series, balance in changes.get(day, ()):
+                current[series] = balance
+            totals = {}
+            for (_, status_id), balance in current.items():
+                totals[status_id] = totals.get(status_id, 0) + balance
+            for status_id in statuses:
+                result[status_id].append((day, totals.get(status_id, Decimal("0.00"))))
+            day += timedelta(days=1)
+        return result
+
+
+class CashFlowDailyBalance(models.Model):
+    """Нарастающий остаток по владельцу и статусу на конец каждого дня с движением.
+
+    Остаток на любую дату — последняя строка ряда не позже этой даты, поэтому для ответа
+    не нужно суммировать записи ДДС с начала времен.
+    """
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name="Владелец",
+        blank=True,
+        null=True,
+        db_index=False,
+        related_name="+",
+    )
+    status = models.ForeignKey(
+        Status,
+        # Удаление статуса пересобирает остатки (записи переходят в ряд без статуса)
+        on_delete=models.CASCADE,
+        verbose_name="Статус",
+        blank=True,
+        null=True,
+        db_index=False,
+        related_name="+",
+    )
+    date = models.DateField(verbose_name="Дата")
+    net = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name="Оборот за день")
+    balance = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name="Остаток на конец дня")
+
+    objects = CashFlowBalanceQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Остаток ДДС"
+        verbose_name_plural = "Остатки ДДС"
+        constraints = [
+            # Одна строка на день ряда; NULL-владелец и NULL-статус — тоже ряды
+            models.UniqueConstraint(
+                fields=["owner", "status", "date"], name="balance_owner_status_date_uniq", nulls_distinct=False
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.date} - {self.operation_type} - {self.amount} руб."
+        return f"{self.date}: остаток {self.balance} руб."
@@ -0,0 +1,306 @@
+import base64
+import hashlib
+import json
+from datetime import date, datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from . import metrics
+from .versions import aget_version, get_version
+
+KEYSET_ORDERING = ("-date", "-created_at", "-id")
+
+
+class InvalidCursor(ValueError):
+    """Курсор не удалось разобрать"""
+
+
+def keyset_key(row):
+    """Ключ (date, created_at, id) записи ДДС или словаря из values()"""
+
+    if isinstance(row, dict):
+        return row["date"], row["created_at"], row["id"]
+    return row.date, row.created_at, row.pk
+
+
+def encode_cursor(direction, row):
+    """Упаковывает направление и ключ строки (date, created_at, id) в непрозрачную строку"""
+
+    row_date, created_at, pk = keyset_key(row)
+    payload = [direction, row_date.isoformat(), created_at.isoformat(), pk]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Возвращает направление и ключ (date, created_at, id) из строки курсора"""
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, row_date, created_at, pk = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ("next", "prev"):
+            raise InvalidCursor(cursor)
+        return direction, (date.fromisoformat(row_date), datetime.fromisoformat(created_at), int(pk))
+    except (ValueError, TypeError) as error:
+        raise InvalidCursor(cursor) from error
+
+
+class KeysetPage:
+    """Страница курсорной пагинации"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+
+def keyset_window(queryset, per_page, cursor=None):
+    """Запрос строк страницы после ключа курсора; возвращает (направление, ключ, срез набора)"""
+
+    direction, key = decode_cursor(cursor) if cursor else ("next", None)
+
+    if key is None:
+        return direction, key, queryset.order_by(*KEYSET_ORDERING)[: per_page + 1]
+
+    row_date, created_at, pk = key
+    if direction == "next":
+        window = queryset.filter(date__lte=row_date).filter(
+            Q(date__lt=row_date)
+            | Q(date=row_date, created_at__lt=created_at)
+            | Q(date=row_date, created_at=created_at, id__lt=pk)
+        )
+        return direction, key, window.order_by(*KEYSET_ORDERING)[: per_page + 1]
+
+    window = queryset.filter(date__gte=row_date).filter(
+        Q(date__gt=row_date)
+        | Q(date=row_date, created_at__gt=created_at)
+        | Q(date=row_date, created_at=created_at, id__gt=pk)
+    )
+    return direction, key, window.order_by("date", "created_at", "id")[: per_page + 1]
+
+
+def keyset_page(rows, per_page, direction, key):
+    """Страница и курсоры соседних страниц по строкам окна (на одну больше размера страницы)"""
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == "prev":
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage(rows)
+
+    if direction == "next":
+        has_next, has_previous = has_more, key is not None
+    else:
+        has_next, has_previous = True, has_more
+
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor("next", rows[-1]) if has_next else None,
+        previous_cursor=encode_cursor("prev", rows[0]) if has_previous else None,
+    )
+
+
+def paginate_keyset(queryset, per_page, cursor=None):
+    """Курсорная пагинация по (date, created_at, id) по убыванию.
+
+    Вместо OFFSET строки отбираются условием «после ключа курсора», поэтому глубокие
+    страницы стоят столько же, сколько первая, и общий COUNT(*) не нужен. Работает и с
+    values(), если в проекцию входят date, created_at и id.
+    """
+
+    direction, key, window = keyset_window(queryset, per_page, cursor)
+    return keyset_page(list(window), per_page, direction, key)
+
+
+async def apaginate_keyset(queryset, per_page, cursor=None):
+    """Асинхронная версия paginate_keyset (строки читаются асинхронным ORM)"""
+
+    direction, key, window = keyset_window(queryset, per_page, cursor)
+    return keyset_page([row async for row in window], per_page, direction, key)
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по статистике планировщика PostgreSQL; None, если оценка недоступна"""
+
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples = -1, пока таблица ни разу не анализировалась
+        if row and row[0] >= 0:
+            return int(row[0])
+        return None
+
+    plan = json.loads(queryset.order_by().values("pk").explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_cache_key(queryset, version):
+    sql, params = queryset.order_by().query.sql_with_params()
+    signature = hashlib.md5(f"{sql}{params!r}".encode()).hexdigest()
+    return f"cash_flow:count:{version}:{signature}"
+
+
+def use_estimate(estimate):
+    """Подходит ли оценка планировщика вместо точного COUNT при текущем CASH_FLOW_COUNT_MODE"""
+
+    mode = settings.CASH_FLOW_COUNT_MODE
+    return estimate is not None and (mode == "estimate" or estimate >= settings.CASH_FLOW_COUNT_ESTIMATE_THRESHOLD)
+
+
+def count_queryset(queryset):
+    """Число строк с кешем по сигнатуре фильтров; возвращает (count, is_estimate).
+
+    Ключ кеша строится из SQL запроса и версии таблицы записей ДДС, поэтому любая запись
+    в таблицу делает ранее посчитанные значения неактуальными.
+    """
+
+    key = count_cache_key(queryset, get_version("cashflow"))
+    cached = cache.get(key)
+    metrics.record_cache("count", hit=cached is not None)
+    if cached is not None:
+        return cached
+
+    estimate = estimate_count(queryset) if settings.CASH_FLOW_COUNT_MODE in ("estimate", "auto") else None
+    result = (estimate, True) if use_estimate(estimate) else (queryset.count(), False)
+    cache.set(key, result, settings.CASH_FLOW_COUNT_CACHE_TIMEOUT)
+    return result
+
+
+async def acount_queryset(queryset):
+    """Асинхронная версия count_queryset"""
+
+    key = count_cache_key(queryset, await aget_version("cashflow"))
+    cached = await cache.aget(key)
+    metrics.record_cache("count", hit=cached is not None)
+    if cached is not None:
+        return cached
+
+    estimate = None
+    if settings.CASH_FLOW_COUNT_MODE in ("estimate", "auto"):
+        estimate = await sync_to_async(estimate_count)(queryset)
+    result = (estimate, True) if use_estimate(estimate) else (await queryset.acount(), False)
+    await cache.aset(key, result, settings.CASH_FLOW_COUNT_CACHE_TIMEOUT)
+    return result
+
+
+class CountedPage(Page):
+    """Страница, строки которой загружаются отдельно (асинхронным ORM) и передаются в set_object_list"""
+
+    def set_object_list(self, rows):
+        self.object_list = rows
+
+
+class OpenEndedPage(CountedPage):
+    """Страница при оценке числа строк: следующая страница определяется лишней строкой выборки.
+
+    Оценка планировщика может быть больше или меньше настоящего числа строк, поэтому номера
+    страниц и их наличие по ней не вычисляются.
+    """
+
+    has_more = False
+
+    def set_object_list(self, rows):
+        per_page = self.paginator.per_page
+        self.has_more = len(rows) > per_page
+        self.object_list = rows[:per_page]
+
+    def has_next(self):
+        return self.has_more
+
+    def next_page_number(self):
+        if not self.has_more:
+            raise EmptyPage(self.paginator.error_messages["no_results"])
+        return self.number + 1
+
+    def previous_page_number(self):
+        if self.number <= 1:
+            raise EmptyPage(self.paginator.error_messages["min_page"])
+        return self.number - 1
+
+    def start_index(self):
+        return (self.number - 1) * self.paginator.per_page + 1 if self.object_list else 0
+
+    def end_index(self):
+        return (self.number - 1) * self.paginator.per_page + len(self.object_list)
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор, который считает строки один раз на сигнатуру фильтров и умеет давать оценку.
+
+    Оценка только выводится как «≈ всего»: при ней num_pages равно None, а страницы открытые
+    (OpenEndedPage), так что несуществующие номера не проходят проверку по неточному числу.
+    """
+
+    @cached_property
+    def _count(self):
+        return count_queryset(self.object_list)
+
+    @cached_property
+    def count(self):
+        return self._count[0]
+
+    @property
+    def count_is_estimate(self):
+        return self._count[1]
+
+    @cached_property
+    def num_pages(self):
+        if self.count_is_estimate:
+            return None
+        return super().num_pages
+
+    def page(self, number):
+        if not self.count_is_estimate:
+            return super().page(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page + 1
+        return OpenEndedPage(self.object_list[bottom:top], number, self)
+
+    def _get_page(self, *args, **kwargs):
+        return CountedPage(*args, **kwargs)
+
+    async def acount_objects(self):
+        """Считает строки заранее асинхронно, чтобы count не обращался к БД из синхронного кода"""
+
+        self._count = await acount_queryset(self.object_list)
+
+    async def acount_exact(self):
+        """Точный COUNT вместо оценки: нужен номер последней страницы"""
+
+        if self.count_is_estimate:
+            self._count = (await self.object_list.acount(), False)
+            self.__dict__.pop("count", None)
+            self.__dict__.pop("num_pages", None)
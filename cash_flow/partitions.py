@@ -0,0 +1,212 @@
+import re
+from datetime import date
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CashFlow, CashFlowDailyBalance, CashFlowDailyRollup
+from .versions import bump_version
+
+INTERVALS = ("month", "year")
+
+BOUND_RE = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+
+class PartitioningError(Exception):
+    """Операцию секционирования нельзя выполнить"""
+
+
+def parent_table():
+    return CashFlow._meta.db_table
+
+
+def default_partition():
+    return f"{parent_table()}_default"
+
+
+def period_start(day, interval):
+    return date(day.year, day.month, 1) if interval == "month" else date(day.year, 1, 1)
+
+
+def next_period(start, interval):
+    if interval == "year":
+        return date(start.year + 1, 1, 1)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start, interval):
+    suffix = f"p{start.year}_{start.month:02d}" if interval == "month" else f"p{start.year}"
+    return f"{parent_table()}_{suffix}"
+
+
+def is_partitioned():
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [parent_table()])
+        return cursor.fetchone()[0] == "p"
+
+
+def list_partitions():
+    """Секции таблицы записей ДДС: [(имя, начало, конец)], без секции по умолчанию"""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [parent_table()],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_RE.search(bound)
+        if match:
+            partitions.append((name, date.fromisoformat(match[1]), date.fromisoformat(match[2])))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def detect_interval(partitions):
+    """Шаг секционирования по границам уже созданных секций"""
+
+    if not partitions:
+        return None
+    _, start, end = partitions[0]
+    return "year" if next_period(start, "month") < end else "month"
+
+
+def create_partition(cursor, start, interval):
+    """Создает секцию [start, следующий период) и переносит в нее строки из секции по умолчанию"""
+
+    name = partition_name(start, interval)
+    end = next_period(start, interval)
+    quote = connection.ops.quote_name
+    cursor.execute(
+        f"CREATE TABLE {quote(name)} (LIKE {quote(parent_table())} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    )
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {quote(default_partition())} WHERE date >= %s AND date < %s RETURNING *) "
+        f"INSERT INTO {quote(name)} SELECT * FROM moved",
+        [start, end],
+    )
+    cursor.execute(
+        f"ALTER TABLE {quote(parent_table())} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+    return name
+
+
+def ensure_partitions(until, interval=None, since=None):
+    """Создает недостающие секции, чтобы непрерывно покрыть период до даты until включительно.
+
+    Строки за пределами секций попадают в секцию по умолчанию и переносятся при создании
+    нужной секции, поэтому вставка записи с любой датой не падает.
+    """
+
+    partitions = list_partitions()
+    interval = interval or detect_interval(partitions) or "month"
+    existing = {start for _, start, _ in partitions}
+    start = period_start(since or (partitions[-1][2] if partitions else until), interval)
+
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        while start <= until:
+            if start not in existing:
+                created.append(create_partition(cursor, start, interval))
+            start = next_period(start, interval)
+    return created
+
+
+def convert(interval, ahead=3):
+    """Превращает таблицу записей ДДС в секционированную по диапазонам date (PostgreSQL).
+
+    Таблица пересоздается с первичным ключом (id, date): данные копируются в новые секции,
+    внешние ключи, индексы модели и последовательность id переносятся. Таблица блокируется
+    на все время копирования, поэтому команду нужно запускать в окно обслуживания.
+    """
+
+    if connection.vendor != "postgresql":
+        raise PartitioningError("Секционирование поддерживается только в PostgreSQL")
+    if interval not in INTERVALS:
+        raise PartitioningError(f"Неизвестный интервал: {interval}")
+    if is_partitioned():
+        raise PartitioningError("Таблица записей ДДС уже секционирована")
+
+    quote = connection.ops.quote_name
+    table = parent_table()
+    legacy = f"{table}_legacy"
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Отложенные проверки внешних ключей не дают удалить старую таблицу в этой же транзакции
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(f"LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE")
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = 'f'",
+                [table],
+            )
+            foreign_keys = cursor.fetchall()
+            cursor.execute(f"SELECT min(date), max(date), max(id) FROM {quote(table)}")
+            first_date, last_date, last_id = cursor.fetchone()
+
+            cursor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}")
+            cursor.execute(
+                f"CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS "
+                f"INCLUDING IDENTITY) PARTITION BY RANGE (date)"
+            )
+            cursor.execute(f"CREATE TABLE {quote(default_partition())} PARTITION OF {quote(table)} DEFAULT")
+
+            today = timezone.localdate()
+            until = period_start(today, interval)
+            for _ in range(ahead):
+                until = next_period(until, interval)
+            start = period_start(min(first_date or today, today), interval)
+            until = max(until, last_date or until)
+            while start <= until:
+                create_partition(cursor, start, interval)
+                start = next_period(start, interval)
+
+            cursor.execute(f"INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}")
+            # Имена ограничений и индексов освобождаются вместе со старой таблицей
+            cursor.execute(f"DROP TABLE {quote(legacy)}")
+            cursor.execute(
+                f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + '_pkey')} PRIMARY KEY (id, date)"
+            )
+            if last_id:
+                cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [table, last_id])
+            for name, definition in foreign_keys:
+                cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}")
+
+        with connection.schema_editor() as schema_editor:
+            for index in CashFlow._meta.indexes:
+                schema_editor.add_index(CashFlow, index)
+
+
+def detach_partitions(before, drop=False):
+    """Отсоединяет секции, целиком лежащие раньше даты before; возвращает их имена.
+
+    Отсоединенная таблица остается в БД как архив (или удаляется при drop=True). Дневные
+    итоги и остатки за эти даты удаляются, а остатки следующих дней уменьшаются на их
+    обороты, чтобы отчеты совпадали с оставшимися записями.
+    """
+
+    quote = connection.ops.quote_name
+    detached = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name, start, end in list_partitions():
+            if end > before:
+                continue
+            cursor.execute(f"ALTER TABLE {quote(parent_table())} DETACH PARTITION {quote(name)}")
+            if drop:
+                cursor.execute(f"DROP TABLE {quote(name)}")
+            CashFlowDailyRollup.objects.filter(date__gte=start, date__lt=end).delete()
+            CashFlowDailyBalance.objects.discard_range(start, end)
+            detached.append(name)
+        if detached:
+            bump_version("cashflow")
+    return detached
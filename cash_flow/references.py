@@ -0,0 +1,173 @@
+import hashlib
+import json
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+
+from . import metrics
+from .versions import aget_version, get_version
+
+REFERENCES_KEY = "cash_flow:references:{}"
+
+Reference = namedtuple("Reference", ["id", "name", "parent_id"])
+
+
+class ReferenceSnapshot:
+    """Снимок справочников: статусы, типы операций, категории и подкатегории с иерархией"""
+
+    def __init__(self, version, data):
+        self.version = version
+        self.statuses = [Reference(*item) for item in data["statuses"]]
+        self.operation_types = [Reference(*item) for item in data["operation_types"]]
+        self.categories = [Reference(*item) for item in data["categories"]]
+        self.subcategories = [Reference(*item) for item in data["subcategories"]]
+
+        self.status_by_id = {item.id: item for item in self.statuses}
+        self.operation_type_by_id = {item.id: item for item in self.operation_types}
+        self.category_by_id = {item.id: item for item in self.categories}
+        self.subcategory_by_id = {item.id: item for item in self.subcategories}
+
+    def categories_for(self, operation_type_id):
+        return [item for item in self.categories if item.parent_id == operation_type_id]
+
+    def subcategories_for(self, category_id):
+        return [item for item in self.subcategories if item.parent_id == category_id]
+
+    def category_label(self, category):
+        """Подпись категории как в Category.__str__"""
+
+        operation_type = self.operation_type_by_id.get(category.parent_id)
+        return f"{category.name} ({operation_type.name if operation_type else None})"
+
+    def subcategory_label(self, subcategory):
+        """Подпись подкатегории как в Subcategory.__str__"""
+
+        category = self.category_by_id.get(subcategory.parent_id)
+        return f"{subcategory.name} ({self.category_label(category) if category else None})"
+
+    @cached_property
+    def tree(self):
+        """Дерево тип операции → категория → подкатегория для фильтрации списков на клиенте.
+
+        hash зависит только от содержимого дерева, поэтому одинаков во всех процессах.
+        """
+
+        operation_types = [
+            {
+                "id": operation_type.id,
+                "name": operation_type.name,
+                "categories": [
+                    {
+                        "id": category.id,
+                        "name": category.name,
+                        "subcategories": [
+                            {"id": subcategory.id, "name": subcategory.name}
+                            for subcategory in self.subcategories_for(category.id)
+                        ],
+                    }
+                    for category in self.categories_for(operation_type.id)
+                ],
+            }
+            for operation_type in self.operation_types
+        ]
+        payload = json.dumps(operation_types, ensure_ascii=False, separators=(",", ":"))
+        return {"hash": hashlib.md5(payload.encode()).hexdigest(), "operation_types": operation_types}
+
+    def knows(self, operation_type_id=None, category_id=None, subcategory_id=None, status_id=None):
+        """Есть ли все переданные идентификаторы в снимке"""
+
+        return (
+            (not status_id or status_id in self.status_by_id)
+            and (not operation_type_id or operation_type_id in self.operation_type_by_id)
+            and (not category_id or category_id in self.category_by_id)
+            and (not subcategory_id or subcategory_id in self.subcategory_by_id)
+        )
+
+
+_local = {"snapshot": None}
+
+
+def load_references():
+    """Читает справочники из БД в виде простых структур, пригодных для кеша"""
+
+    Status = apps.get_model("cash_flow", "Status")
+    OperationType = apps.get_model("cash_flow", "OperationType")
+    Category = apps.get_model("cash_flow", "Category")
+    Subcategory = apps.get_model("cash_flow", "Subcategory")
+    return {
+        "statuses": [(pk, name, None) for pk, name in Status.objects.order_by("pk").values_list("pk", "name")],
+        "operation_types": [
+            (pk, name, None) for pk, name in OperationType.objects.order_by("pk").values_list("pk", "name")
+        ],
+        "categories": list(Category.objects.order_by("pk").values_list("pk", "name", "operation_type_id")),
+        "subcategories": list(Subcategory.objects.order_by("pk").values_list("pk", "name", "category_id")),
+    }
+
+
+def get_references(refresh=False):
+    """Снимок справочников из локальной памяти процесса, общего кеша Django или БД.
+
+    Актуальность проверяется по версии справочников в общем кеше, которую сигналы
+    повышают при каждом сохранении или удалении элемента справочника.
+    """
+
+    version = get_version("references")
+    snapshot = _local["snapshot"]
+    if not refresh and snapshot is not None and snapshot.version == version:
+        metrics.record_cache("references", hit=True)
+        return snapshot
+
+    key = REFERENCES_KEY.format(version)
+    data = None if refresh else cache.get(key)
+    metrics.record_cache("references", hit=data is not None)
+    if data is None:
+        data = load_references()
+        cache.set(key, data, settings.CASH_FLOW_REFERENCE_CACHE_TIMEOUT)
+
+    snapshot = ReferenceSnapshot(version, data)
+    _local["snapshot"] = snapshot
+    return snapshot
+
+
+def hierarchy_errors(operation_type_id, category_id, subcategory_id, status_id=None):
+    """Проверяет по идентификаторам существование справочников и согласованность
+    тип операции → категория → подкатегория"""
+
+    references = get_references()
+    if not references.knows(operation_type_id, category_id, subcategory_id, status_id):
+        references = get_references(refresh=True)
+
+    errors = {}
+    for field, value, known in (
+        ("status", status_id, references.status_by_id),
+        ("operation_type", operation_type_id, references.operation_type_by_id),
+        ("category", category_id, references.category_by_id),
+        ("subcategory", subcategory_id, references.subcategory_by_id),
+    ):
+        if value and value not in known:
+            errors[field] = "Выбранный элемент справочника не существует"
+
+    category = references.category_by_id.get(category_id)
+    if operation_type_id and category is not None and category.parent_id != operation_type_id:
+        errors["category"] = "Выбранная категория не принадлежит выбранному типу операции"
+
+    subcategory = references.subcategory_by_id.get(subcategory_id)
+    if category_id and subcategory is not None and subcategory.parent_id != category_id:
+        errors["subcategory"] = "Выбранная подкатегория не принадлежит выбранной категории"
+
+    return errors
+
+
+async def aget_references():
+    """Асинхронный get_references: пока снимок процесса актуален, обходится без потоков и БД"""
+
+    version = await aget_version("references")
+    snapshot = _local["snapshot"]
+    if snapshot is not None and snapshot.version == version:
+        metrics.record_cache("references", hit=True)
+        return snapshot
+    return await sync_to_async(get_references)()
@@ -0,0 +1,365 @@
+import hashlib
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import partial
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from . import metrics
+from .models import CashFlow, CashFlowDailyRollup
+from .partitions import next_period
+from .references import get_references
+from .versions import get_version
+
+GROUP_FIELDS = {
+    "status": ("status_id", "status__name"),
+    "operation_type": ("operation_type_id", "operation_type__name"),
+    "category": ("category_id", "category__name"),
+    "subcategory": ("subcategory_id", "subcategory__name"),
+}
+
+PERIODS = {
+    "day": TruncDay,
+    "week": TruncWeek,
+    "month": TruncMonth,
+    "year": TruncYear,
+}
+
+
+class ReportParamsError(ValueError):
+    """Некорректные параметры отчета"""
+
+
+def parse_report_params(params):
+    """Разбирает группировки (?group_by=status,category) и период (?period=month) из GET-параметров"""
+
+    group_by = [name for name in ",".join(params.getlist("group_by")).split(",") if name]
+    unknown = [name for name in group_by if name not in GROUP_FIELDS]
+    if unknown:
+        raise ReportParamsError(f"Неизвестная группировка: {', '.join(unknown)}")
+
+    period = params.get("period") or None
+    if period is not None and period not in PERIODS:
+        raise ReportParamsError(f"Неизвестный период: {period}")
+
+    return list(dict.fromkeys(group_by)), period
+
+
+def summary_query(queryset, group_by=(), period=None):
+    """Запрос сводки: values() с GROUP BY / date_trunc или None, если группировки нет.
+
+    Вторым значением возвращаются агрегаты report_aggregates() набора.
+    """
+
+    annotations = {"period": PERIODS[period]("date")} if period else {}
+    fields = [field for name in group_by for field in GROUP_FIELDS[name]]
+    aggregates = queryset.report_aggregates()
+    if not annotations and not fields:
+        return None, aggregates
+
+    rows = (
+        queryset.order_by()
+        .values(*fields, **annotations)
+        .annotate(**aggregates)
+        .exclude(count=0)
+        .order_by(*annotations, *fields)
+    )
+    return rows, aggregates
+
+
+def format_summary_row(row, group_by=(), period=None):
+    item = {"period": row["period"]} if period else {}
+    for name in group_by:
+        id_field, name_field = GROUP_FIELDS[name]
+        item[name] = row[id_field]
+        item[f"{name}_name"] = row[name_field]
+    item["count"] = row["count"]
+    item["total"] = row["total"]
+    return item
+
+
+def summarize(queryset, group_by=(), period=None):
+    """Суммы и количество записей ДДС с группировкой на стороне БД (GROUP BY / date_trunc).
+
+    Принимает набор записей ДДС или дневных итогов: агрегаты берутся из report_aggregates().
+    Возвращает список словарей: period (если задан), <группа> и <группа>_name для каждой
+    группировки, count и total.
+    """
+
+    rows, aggregates = summary_query(queryset, group_by, period)
+    if rows is None:
+        return [queryset.order_by().aggregate(**aggregates)]
+    return [format_summary_row(row, group_by, period) for row in rows]
+
+
+async def asummarize(queryset, group_by=(), period=None):
+    """Асинхронная версия summarize"""
+
+    rows, aggregates = summary_query(queryset, group_by, period)
+    if rows is None:
+        return [await queryset.order_by().aaggregate(**aggregates)]
+    return [format_summary_row(row, group_by, period) async for row in rows]
+
+
+def report_data(group_by, period, rows):
+    return {
+        "group_by": group_by,
+        "period": period,
+        "rows": rows,
+        "totals": {
+            "count": sum(row["count"] or 0 for row in rows),
+            "total": sum((row["total"] or 0 for row in rows), Decimal("0.00")),
+        },
+    }
+
+
+def report_queryset(params, owner):
+    """Набор для отчета с фильтрами списка записей: дневные итоги или, при поиске, исходные записи.
+
+    Все фильтры списка, кроме поиска по тексту, — измерения дневных итогов. Комментария в
+    дневных итогах нет, поэтому отчет по найденным записям агрегирует таблицу записей ДДС.
+    """
+
+    if params.get("search"):
+        return CashFlow.objects.owned_by(owner).filter_by_params(params)
+    return CashFlowDailyRollup.objects.owned_by(owner).filter_by_params(params)
+
+
+def build_report(params, owner):
+    """Отчет по записям ДДС пользователя с теми же фильтрами, что и у списка записей.
+
+    Отчет строится по набору report_queryset: GROUP BY в БД или, при CASH_FLOW_REPORT_BACKEND="numpy"
+    и без поиска по тексту, группировка кадра дневных итогов в памяти процесса (analytics.CashFlowFrame).
+    """
+
+    group_by, period = parse_report_params(params)
+    if settings.CASH_FLOW_REPORT_BACKEND == "numpy" and not params.get("search"):
+        from .analytics import get_frame
+
+        rows = get_frame(owner, params).summarize(group_by, period)
+    else:
+        rows = summarize(report_queryset(params, owner), group_by, period)
+    return report_data(group_by, period, rows)
+
+
+async def abuild_report(params, owner):
+    """Асинхронная версия build_report"""
+
+    if settings.CASH_FLOW_REPORT_BACKEND == "numpy" and not params.get("search"):
+        return await sync_to_async(build_report)(params, owner)
+
+    group_by, period = parse_report_params(params)
+    rows = await asummarize(report_queryset(params, owner), group_by, period)
+    return report_data(group_by, period, rows)
+
+
+# Не больше десяти лет по месяцам: столбец — одно условное SUM в запросе сводной таблицы
+PIVOT_MAX_MONTHS = 120
+
+ZERO = Decimal("0.00")
+
+EMPTY_NAMES = {
+    "operation_type": "Без типа операции",
+    "category": "Без категории",
+    "subcategory": "Без подкатегории",
+}
+
+
+def parse_pivot_period(params):
+    """Период сводной таблицы: (начало, конец); по умолчанию — календарный год конца периода или текущий"""
+
+    try:
+        start = date.fromisoformat(params["start_date"]) if params.get("start_date") else None
+        end = date.fromisoformat(params["end_date"]) if params.get("end_date") else None
+    except ValueError:
+        raise ReportParamsError("Некорректная дата периода")
+
+    if end is None:
+        end = date((start or timezone.localdate()).year, 12, 31)
+    if start is None:
+        start = date(end.year, 1, 1)
+    if start > end:
+        raise ReportParamsError("Начало периода позже конца")
+    if (end.year - start.year) * 12 + end.month - start.month >= PIVOT_MAX_MONTHS:
+        raise ReportParamsError(f"Сводная таблица строится не больше чем за {PIVOT_MAX_MONTHS} месяцев")
+    return start, end
+
+
+def pivot_months(start, end):
+    """Столбцы-месяцы периода: (начало месяца, первый и последний день месяца внутри периода)"""
+
+    months = []
+    month = start.replace(day=1)
+    while month <= end:
+        following = next_period(month, "month")
+        months.append((month, max(month, start), min(following - timedelta(days=1), end)))
+        month = following
+    return months
+
+
+def column_sums(lines):
+    return [sum(column, ZERO) for column in zip(*(line["amounts"] for line in lines))]
+
+
+def pivot_query(queryset, months):
+    """Один запрос с условной агрегацией: SUM(...) FILTER (WHERE дата в месяце) на каждый месяц.
+
+    Суммируется то же поле, что и в report_aggregates() набора: дневные итоги или записи ДДС.
+    """
+
+    aggregates = queryset.report_aggregates()
+    columns = {
+        f"month_{index}": Sum(
+            aggregates["total"].get_source_expressions()[0],
+            filter=Q(date__gte=month, date__lt=next_period(month, "month")),
+            default=ZERO,
+        )
+        for index, (month, *_) in enumerate(months)
+    }
+    return (
+        queryset.order_by()
+        .values("operation_type_id", "category_id", "subcategory_id")
+        .annotate(**columns, count=aggregates["count"])
+        .exclude(count=0)
+    )
+
+
+class PivotBuilder:
+    """Сводная таблица: категории и подкатегории по строкам, месяцы по столбцам, разделы по типам операций.
+
+    Суммы ячеек считаются одним запросом по дневным итогам; названия справочников берутся из кеша
+    справочников, а не JOIN. Каждая ячейка с суммой ссылается на список записей с фильтрами ячейки.
+    """
+
+    def __init__(self, params, start, end):
+        self.filters = {
+            name: params.get(name) or "" for name in ("status", "operation_type", "category", "subcategory", "search")
+        }
+        self.start = start
+        self.end = end
+        self.months = pivot_months(start, end)
+        self.references = get_references()
+
+    def name(self, kind, pk, empty):
+        if pk is None:
+            return empty
+        by_id = getattr(self.references, f"{kind}_by_id")
+        if pk not in by_id:
+            self.references = get_references(refresh=True)
+            by_id = getattr(self.references, f"{kind}_by_id")
+        return by_id[pk].name if pk in by_id else empty
+
+    def order(self, kind, pk):
+        """Порядок строк по названию справочника; пустой справочник — последним"""
+
+        return pk is None, self.name(kind, pk, "")
+
+    def query(self, start, end, **references):
+        """Параметры списка записей для ячейки: фильтры отчета, уточненные справочниками ячейки"""
+
+        params = {**self.filters, **{name: pk for name, pk in references.items() if pk is not None}}
+        params.update(start_date=start.isoformat(), end_date=end.isoformat())
+        return urlencode({name: value for name, value in params.items() if value})
+
+    def line(self, kind, pk, amounts, **references):
+        """Строка таблицы: название, ячейки (сумма, параметры ссылки или None) и итог за период.
+
+        Строки без справочника (пустые после удаления элемента) не ссылаются на список: фильтра
+        «без категории» у списка нет.
+        """
+
+        linked = pk is not None
+        cells = [
+            (amount, self.query(first, last, **references) if linked and amount else None)
+            for amount, (_, first, last) in zip(amounts, self.months)
+        ]
+        total = sum(amounts, ZERO)
+        return {
+            "name": self.name(kind, pk, EMPTY_NAMES[kind]),
+            "amounts": amounts,
+            "cells": cells,
+            "total": total,
+            "query": self.query(self.start, self.end, **references) if linked and total else None,
+        }
+
+    def build(self, rows):
+        tree = {}
+        for row in rows:
+            amounts = [row[f"month_{index}"] for index in range(len(self.months))]
+            categories = tree.setdefault(row["operation_type_id"], {})
+            categories.setdefault(row["category_id"], {})[row["subcategory_id"]] = amounts
+
+        sections = []
+        for operation_type_id in sorted(tree, key=partial(self.order, "operation_type")):
+            categories = []
+            for category_id in sorted(tree[operation_type_id], key=partial(self.order, "category")):
+                references = {"operation_type": operation_type_id, "category": category_id}
+                subcategories = [
+                    self.line("subcategory", subcategory_id, amounts, **references, subcategory=subcategory_id)
+                    for subcategory_id, amounts in sorted(
+                        tree[operation_type_id][category_id].items(),
+                        key=lambda item: self.order("subcategory", item[0]),
+                    )
+                ]
+                category = self.line("category", category_id, column_sums(subcategories), **references)
+                categories.append({**category, "subcategories": subcategories})
+
+            section = self.line(
+                "operation_type", operation_type_id, column_sums(categories), operation_type=operation_type_id
+            )
+            sections.append({**section, "categories": categories})
+
+        return {
+            "start": self.start,
+            "end": self.end,
+            "months": [month for month, *_ in self.months],
+            "sections": sections,
+        }
+
+
+def frame_pivot_rows(frame, months):
+    """Строки сводной таблицы в виде результата pivot_query по кадру NumPy (analytics.CashFlowFrame)"""
+
+    pivot = frame.pivot(["operation_type", "category", "subcategory"], ["period"], "month")
+    positions = {month: index for index, (month, *_) in enumerate(months)}
+    rows = []
+    for key, values in zip(pivot["rows"], pivot["values"]):
+        row = {f"{name}_id": pk for name, (pk, _) in zip(("operation_type", "category", "subcategory"), key)}
+        row.update((f"month_{index}", ZERO) for index in range(len(months)))
+        for (month,), amount in zip(pivot["columns"], values):
+            row[f"month_{positions[month]}"] = amount
+        rows.append(row)
+    return rows
+
+
+def build_pivot(params, owner):
+    """Сводная таблица записей ДДС пользователя: категории × месяцы по типам операций.
+
+    Результат кешируется по владельцу, периоду и фильтрам вместе с версиями записей и
+    справочников, поэтому повторный показ той же таблицы не обращается к БД. При
+    CASH_FLOW_REPORT_BACKEND="numpy" ячейки считаются по кадру дневных итогов в памяти процесса.
+    """
+
+    start, end = parse_pivot_period(params)
+    builder = PivotBuilder(params, start, end)
+    signature = hashlib.md5(repr((owner.pk, start, end, sorted(builder.filters.items()))).encode()).hexdigest()
+    key = f"cash_flow:pivot:{get_version('cashflow')}:{builder.references.version}:{signature}"
+    pivot = cache.get(key)
+    metrics.record_cache("pivot", hit=pivot is not None)
+    if pivot is None:
+        filters = {**builder.filters, "start_date": start.isoformat(), "end_date": end.isoformat()}
+        if settings.CASH_FLOW_REPORT_BACKEND == "numpy" and not filters["search"]:
+            from .analytics import get_frame
+
+            rows = frame_pivot_rows(get_frame(owner, filters), builder.months)
+        else:
+            rows = pivot_query(report_queryset(filters, owner), builder.months)
+        pivot = builder.build(rows)
+        cache.set(key, pivot, settings.CASH_FLOW_PIVOT_CACHE_TIMEOUT)
+    return pivot
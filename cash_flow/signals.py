@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import metrics
+from .middleware import install_query_observer
+from .models import BALANCE_SIGNS, CashFlow, CashFlowDailyBalance, Category, OperationType, Status, Subcategory
+from .versions import bump_version
+
+
+@receiver(post_save, sender=CashFlow)
+@receiver(post_delete, sender=CashFlow)
+def cashflow_changed(sender, signal, created=False, **kwargs):
+    """Изменение записи ДДС сбрасывает кешированные счетчики списка и учитывается в метриках"""
+
+    bump_version("cashflow")
+    metrics.record_change("delete" if signal is post_delete else "create" if created else "update")
+
+
+@receiver(pre_save, sender=Status)
+@receiver(pre_save, sender=OperationType)
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Subcategory)
+def reference_saving(sender, instance, **kwargs):
+    """Запоминает прежнее название элемента справочника и изменилось ли оно"""
+
+    old_name = sender.objects.filter(pk=instance.pk).values_list("name", flat=True).first() if instance.pk else None
+    instance._old_name = old_name
+    instance._name_changed = old_name is not None and old_name != instance.name
+
+
+@receiver(post_save, sender=Status)
+@receiver(post_save, sender=OperationType)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Subcategory)
+def reference_saved(sender, instance, **kwargs):
+    """Изменение справочника сбрасывает кеш справочников во всех процессах.
+
+    При переименовании пересчитываются поисковые векторы записей ДДС с этим элементом, а для типа
+    операции — и ряды остатков с его записями: знак суммы в остатке зависит от названия.
+    """
+
+    bump_version("references")
+    if getattr(instance, "_name_changed", False):
+        field = dict((model, name) for name, model in CashFlow.SEARCH_REFERENCES)[sender]
+        with transaction.atomic():
+            CashFlow.objects.filter(**{f"{field}_id": instance.pk}).update_search_vectors()
+            if sender is OperationType:
+                sign = BALANCE_SIGNS.get(instance.name, 0) - BALANCE_SIGNS.get(instance._old_name, 0)
+                if sign:
+                    balances = CashFlowDailyBalance.objects
+                    balances.apply_changes(balances.operation_type_changes(instance.pk, sign))
+        bump_version("cashflow")
+
+
+@receiver(pre_delete, sender=Status)
+@receiver(pre_delete, sender=OperationType)
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Subcategory)
+def reference_deleting(sender, instance, **kwargs):
+    """Обнуляет ссылки записей ДДС на удаляемый элемент справочника вместе с их поисковыми векторами.
+
+    SET_NULL выполняется после этого сигнала и уже не находит записей, а его UPDATE не пересчитал бы векторы.
+    """
+
+    field = dict((model, name) for name, model in CashFlow.SEARCH_REFERENCES)[sender]
+    CashFlow.objects.filter(**{f"{field}_id": instance.pk}).update_search_vectors(**{f"{field}_id": None})
+
+    # Обороты, которые после удаления переходят в ряды без статуса или перестают учитываться в остатках
+    balances = CashFlowDailyBalance.objects
+    if sender is Status:
+        instance._balance_changes = balances.status_changes(instance.pk)
+    elif sender is OperationType and BALANCE_SIGNS.get(instance.name):
+        instance._balance_changes = balances.operation_type_changes(instance.pk, -BALANCE_SIGNS[instance.name])
+
+
+@receiver(post_delete, sender=Status)
+@receiver(post_delete, sender=OperationType)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Subcategory)
+def reference_deleted(sender, instance, **kwargs):
+    """Удаление справочника обнуляет ссылки в записях ДДС без вызова их сигналов (см. reference_deleting).
+
+    Обороты записей удаленного статуса переносятся в ряды без статуса (его ряды удаляются каскадно),
+    а обороты удаленного типа операции вычитаются из рядов, где они были учтены.
+    """
+
+    CashFlowDailyBalance.objects.apply_changes(getattr(instance, "_balance_changes", {}))
+    bump_version("references")
+    bump_version("cashflow")
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """Учет SQL-запросов для middleware инструментирования и метрик; без наблюдателей он ничего не делает"""
+
+    install_query_observer(connection)
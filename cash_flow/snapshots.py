@@ -0,0 +1,238 @@
+import json
+import shutil
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .exports import reference_names
+from .models import CashFlow
+from .partitions import next_period
+from .references import get_references
+
+SNAPSHOT_FORMATS = {"parquet": "parquet", "arrow": "arrow"}
+
+# Колонки снимка: идентификаторы справочников и их названия рядом, как после JOIN
+SNAPSHOT_FIELDS = (
+    "id",
+    "owner_id",
+    "date",
+    "status_id",
+    "operation_type_id",
+    "category_id",
+    "subcategory_id",
+    "amount",
+    "comment",
+    "created_at",
+    "updated_at",
+)
+
+REFERENCE_COLUMNS = ("status", "operation_type", "category", "subcategory")
+
+STATE_FILE = "_state.json"
+
+
+class SnapshotError(Exception):
+    """Снимок нельзя выгрузить"""
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise SnapshotError("Для выгрузки Parquet/Arrow установите pyarrow: poetry install -E parquet")
+    return pyarrow
+
+
+def snapshot_schema(pa):
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("owner_id", pa.int64()),
+            ("date", pa.date32()),
+            ("status_id", pa.int64()),
+            ("status", pa.string()),
+            ("operation_type_id", pa.int64()),
+            ("operation_type", pa.string()),
+            ("category_id", pa.int64()),
+            ("category", pa.string()),
+            ("subcategory_id", pa.int64()),
+            ("subcategory", pa.string()),
+            ("amount", pa.decimal128(12, 2)),
+            ("comment", pa.string()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+            ("updated_at", pa.timestamp("us", tz="UTC")),
+        ]
+    )
+
+
+class SnapshotExporter:
+    """Денормализованный снимок записей ДДС в Parquet или Arrow IPC, по файлу на месяц в каталоге month=YYYY-MM.
+
+    Строки читаются серверным курсором порциями по batch_size и пишутся в файлы потоком,
+    месяц за месяцем, поэтому открыт только файл текущего месяца. Названия справочников
+    берутся из кеша справочников вместо JOIN четырех таблиц.
+
+    Инкрементальный запуск выгружает только записи, у которых updated_at больше отметки
+    предыдущего запуска с тем же набором записей (scope, например владелец), в новые файлы
+    тех же месяцев; при чтении берется последняя версия каждой записи по (id, updated_at).
+    Удаления так не видны — их учитывает полная выгрузка. Она пишет месяцы во временный
+    каталог и подменяет им прежний только после успешной записи, а отметки других наборов
+    сбрасывает: их следующий запуск выгрузит свои записи заново.
+    """
+
+    def __init__(self, output, snapshot_format="parquet", batch_size=None, overlap=60):
+        self.pa = import_pyarrow()
+        self.output = Path(output)
+        self.format = snapshot_format
+        self.batch_size = batch_size or settings.CASH_FLOW_EXPORT_CHUNK_SIZE
+        # Транзакции, начатые до отметки, могут зафиксироваться позже: окно перекрывается
+        self.overlap = timedelta(seconds=overlap)
+        self.schema = snapshot_schema(self.pa)
+
+    def read_state(self):
+        path = self.output / STATE_FILE
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text())
+
+    def write_state(self, state):
+        path = self.output / STATE_FILE
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(state, indent=2))
+        temporary.replace(path)
+
+    def run(self, full=False, queryset=None, scope="all"):
+        """Выгружает снимок набора записей scope; возвращает {"rows", "files", "since", "until"}"""
+
+        if full and scope != "all":
+            # Полная выгрузка подменяет весь каталог cashflows/ и сбрасывает отметки остальных наборов
+            raise SnapshotError("Полная выгрузка возможна только для всех записей, без владельца")
+        state = {} if full else self.read_state()
+        if state and state.get("format") != self.format:
+            raise SnapshotError(f"Каталог уже содержит снимок в формате {state.get('format')}; нужна полная выгрузка")
+
+        until = timezone.now()
+        watermark = state.get("watermarks", {}).get(scope, {}).get("watermark")
+        since = datetime.fromisoformat(watermark) - self.overlap if watermark else None
+        queryset = CashFlow.objects.all() if queryset is None else queryset
+        queryset = queryset.filter(updated_at__lte=until)
+        if since is not None:
+            queryset = queryset.filter(updated_at__gt=since)
+
+        self.output.mkdir(parents=True, exist_ok=True)
+        run_id = until.strftime("%Y%m%dT%H%M%S%f")
+        target = self.output / "cashflows"
+        if full:
+            # Каталоги с точкой в начале читатели наборов (pyarrow, DuckDB) пропускают
+            staging = self.output / f".cashflows-{run_id}"
+            try:
+                rows, files = self.write_months(queryset, run_id, staging)
+                self.replace_directory(staging, target, run_id)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        else:
+            rows, files = self.write_months(queryset, run_id, target)
+
+        self.write_references()
+        watermarks = state.get("watermarks", {})
+        watermarks[scope] = {"watermark": until.isoformat(), "last_run": run_id}
+        self.write_state({"format": self.format, "watermarks": watermarks})
+        return {"rows": rows, "files": files, "since": since, "until": until}
+
+    @staticmethod
+    def replace_directory(staging, target, run_id):
+        """Подменяет target полностью записанным каталогом staging двумя переименованиями"""
+
+        staging.mkdir(parents=True, exist_ok=True)
+        previous = target.with_name(f".{target.name}-previous-{run_id}")
+        if target.exists():
+            target.rename(previous)
+        staging.rename(target)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    def iter_batches(self, queryset):
+        """Порции строк (кортежи SNAPSHOT_FIELDS) по месяцам: [(месяц, порция)].
+
+        Каждый месяц читается отдельным запросом по диапазону дат без сортировки, поэтому
+        секционированная таблица читает только свою секцию, а сортировать всю таблицу не нужно.
+        """
+
+        for month in queryset.dates("date", "month"):
+            rows = (
+                queryset.filter(date__gte=month, date__lt=next_period(month, "month"))
+                .order_by()
+                .values_list(*SNAPSHOT_FIELDS)
+                .iterator(chunk_size=self.batch_size)
+            )
+            while batch := list(islice(rows, self.batch_size)):
+                yield month.strftime("%Y-%m"), batch
+
+    def record_batch(self, rows, names):
+        columns = dict(zip(SNAPSHOT_FIELDS, zip(*rows)))
+        data = {name: columns[name] for name in ("id", "owner_id", "date")}
+        for name, by_id in zip(REFERENCE_COLUMNS, names):
+            ids = columns[f"{name}_id"]
+            data[f"{name}_id"] = ids
+            data[name] = [by_id[value].name if value in by_id else None for value in ids]
+        for name in ("amount", "comment", "created_at", "updated_at"):
+            data[name] = columns[name]
+        return self.pa.record_batch(
+            [self.pa.array(data[field.name], field.type) for field in self.schema], self.schema
+        )
+
+    def open_writer(self, path):
+        if self.format == "arrow":
+            return self.pa.ipc.new_file(str(path), self.schema)
+        return self.pa.parquet.ParquetWriter(str(path), self.schema, compression="zstd")
+
+    def write_months(self, queryset, run_id, root):
+        names = reference_names(get_references())
+        extension = SNAPSHOT_FORMATS[self.format]
+        writer, month, rows, files = None, None, 0, 0
+        try:
+            for batch_month, batch in self.iter_batches(queryset):
+                if batch_month != month:
+                    if writer is not None:
+                        writer.close()
+                    month = batch_month
+                    directory = root / f"month={month}"
+                    directory.mkdir(parents=True, exist_ok=True)
+                    writer = self.open_writer(directory / f"part-{run_id}.{extension}")
+                    files += 1
+                writer.write_batch(self.record_batch(batch, names))
+                rows += len(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows, files
+
+    def write_references(self):
+        """Справочники целиком — небольшая таблица измерений для переименований после выгрузки строк"""
+
+        references = get_references()
+        collections = (
+            ("status", references.statuses),
+            ("operation_type", references.operation_types),
+            ("category", references.categories),
+            ("subcategory", references.subcategories),
+        )
+        items = [(kind, *item) for kind, collection in collections for item in collection]
+        pa = self.pa
+        schema = pa.schema(
+            [("kind", pa.string()), ("id", pa.int64()), ("name", pa.string()), ("parent_id", pa.int64())]
+        )
+        columns = list(zip(*items)) or [[] for _ in schema]
+        table = pa.Table.from_arrays(
+            [pa.array(column, field.type) for field, column in zip(schema, columns)], schema=schema
+        )
+        path = self.output / f"references.{SNAPSHOT_FORMATS[self.format]}"
+        if self.format == "arrow":
+            with pa.ipc.new_file(str(path), schema) as writer:
+                writer.write_table(table)
+        else:
+            pa.parquet.write_table(table, str(path))
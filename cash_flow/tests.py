@@ -0,0 +1,1277 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+from pathlib import Path
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import escape
+
+from users.models import User
+
+from . import analytics, metrics, partitions
+from .benchmarks import percentile
+from .forms import CashFlowForm
+from .importers import COLUMNS, CashFlowImporter, ImportFormatError, normalize_header, read_csv, read_rows
+from .middleware import RequestMetrics
+from .models import CashFlow, CashFlowDailyBalance, CashFlowDailyRollup, Category, OperationType, Status, Subcategory
+from .references import get_references
+from .reports import build_pivot, summarize
+from .snapshots import SnapshotExporter
+
+
+class CashFlowTestMixin:
+    """Общие справочники, пользователь и генерация записей для тестов"""
+
+    # Запросы сессии и пользователя при каждом запросе вошедшего пользователя
+    AUTH_QUERIES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email="owner@example.com")
+        cls.other_user = User.objects.create(email="other@example.com")
+        cls.status = Status.objects.create(name="Бизнес")
+        cls.income = OperationType.objects.create(name="Пополнение")
+        cls.expense = OperationType.objects.create(name="Списание")
+        cls.category = Category.objects.create(name="Маркетинг", operation_type=cls.expense)
+        cls.subcategory = Subcategory.objects.create(name="Avito", category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def create_cashflows(self, count, start=date(2025, 1, 1), owner=None):
+        return [
+            CashFlow.objects.create(
+                owner=owner or self.user,
+                date=start + timedelta(days=i),
+                status=self.status,
+                operation_type=self.expense,
+                category=self.category,
+                subcategory=self.subcategory,
+                amount=100 + i,
+            )
+            for i in range(count)
+        ]
+
+
+@override_settings(CASH_FLOW_COUNT_MODE="exact")
+class CashFlowListQueriesTest(CashFlowTestMixin, TestCase):
+    """Количество SQL-запросов страницы списка не зависит от числа строк"""
+
+    # Сессия, пользователь, COUNT и строки страницы; справочники для фильтров берутся из кеша
+    LIST_PAGE_QUERIES = CashFlowTestMixin.AUTH_QUERIES + 2
+
+    def test_query_count_small_page(self):
+        self.create_cashflows(2)
+        with self.assertNumQueries(self.LIST_PAGE_QUERIES):
+            response = self.client.get(reverse("cash_flow:cashflow_list"))
+        self.assertEqual(len(response.context["cashflows"]), 2)
+
+    def test_query_count_full_page(self):
+        self.create_cashflows(25)
+        with self.assertNumQueries(self.LIST_PAGE_QUERIES):
+            response = self.client.get(reverse("cash_flow:cashflow_list"))
+        self.assertEqual(len(response.context["cashflows"]), 20)
+        self.assertEqual(response.context["paginator"].count, 25)
+
+    def test_count_is_cached_until_write(self):
+        self.create_cashflows(3)
+        url = reverse("cash_flow:cashflow_list")
+        self.client.get(url)
+        with self.assertNumQueries(self.LIST_PAGE_QUERIES - 1):
+            self.client.get(url)
+
+        self.create_cashflows(1)
+        response = self.client.get(url)
+        self.assertEqual(response.context["paginator"].count, 4)
+
+    @override_settings(CASH_FLOW_COUNT_MODE="estimate")
+    def test_estimated_count(self):
+        self.create_cashflows(3)
+        response = self.client.get(reverse("cash_flow:cashflow_list"), {"category": self.category.pk})
+        self.assertTrue(response.context["paginator"].count_is_estimate)
+        self.assertContains(response, "≈")
+
+    @override_settings(CASH_FLOW_COUNT_MODE="estimate")
+    def test_estimated_count_pages(self):
+        self.create_cashflows(25)
+        url = reverse("cash_flow:cashflow_list")
+        response = self.client.get(url, {"category": self.category.pk})
+        self.assertIsNone(response.context["paginator"].num_pages)
+        self.assertTrue(response.context["page_obj"].has_next())
+
+        # Наличие страниц определяется строками, а не оценкой планировщика
+        response = self.client.get(url, {"category": self.category.pk, "page": 2})
+        self.assertEqual(len(response.context["cashflows"]), 5)
+        self.assertFalse(response.context["page_obj"].has_next())
+        self.assertEqual(self.client.get(url, {"category": self.category.pk, "page": 3}).status_code, 404)
+
+        response = self.client.get(url, {"category": self.category.pk, "page": "last"})
+        self.assertEqual(response.context["page_obj"].number, 2)
+        self.assertFalse(response.context["paginator"].count_is_estimate)
+
+    def test_filters(self):
+        self.create_cashflows(5)
+        response = self.client.get(reverse("cash_flow:cashflow_list"), {"start_date": "2025-01-04"})
+        self.assertEqual(len(response.context["cashflows"]), 2)
+
+
+class CashFlowKeysetPaginationTest(CashFlowTestMixin, TestCase):
+    """Курсорная пагинация списка записей"""
+
+    def test_walk_forward_and_back(self):
+        cashflows = self.create_cashflows(45)
+        expected = sorted(cashflows, key=lambda cashflow: (cashflow.date, cashflow.created_at, cashflow.pk))[::-1]
+        url = reverse("cash_flow:cashflow_list")
+
+        pages = []
+        params = {"pagination": "keyset", "category": self.category.pk}
+        while True:
+            response = self.client.get(url, params)
+            page = response.context["page_obj"]
+            pages.append([cashflow.pk for cashflow in page])
+            if not page.has_next():
+                break
+            params["cursor"] = page.next_cursor
+
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), [cashflow.pk for cashflow in expected])
+
+        response = self.client.get(url, {"cursor": page.previous_cursor})
+        self.assertEqual([cashflow.pk for cashflow in response.context["page_obj"]], pages[1])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("cash_flow:cashflow_list"), {"cursor": "broken"})
+        self.assertEqual(response.status_code, 404)
+
+
+class CashFlowReportTest(CashFlowTestMixin, TestCase):
+    """Сводный отчет по записям ДДС"""
+
+    def test_group_by_category_and_month(self):
+        self.create_cashflows(40)
+        response = self.client.get(
+            reverse("cash_flow:cashflow_report_data"),
+            {"group_by": "category", "period": "month", "end_date": "2025-02-05"},
+        )
+        report = response.json()
+        self.assertEqual(
+            [(row["period"], row["category_name"], row["count"], row["total"]) for row in report["rows"]],
+            [
+                ("2025-01-01", "Маркетинг", 31, "3565.00"),
+                ("2025-02-01", "Маркетинг", 5, "665.00"),
+            ],
+        )
+        self.assertEqual(report["totals"], {"count": 36, "total": "4230.00"})
+
+    def test_unknown_group(self):
+        response = self.client.get(reverse("cash_flow:cashflow_report_data"), {"group_by": "owner"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_report_page(self):
+        self.create_cashflows(3)
+        response = self.client.get(reverse("cash_flow:cashflow_report"), {"group_by": ["status", "subcategory"]})
+        self.assertContains(response, "Avito")
+
+    def test_invalid_filters(self):
+        for params in ({"status": "abc"}, {"start_date": "2025-13-01"}):
+            response = self.client.get(reverse("cash_flow:cashflow_report_data"), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["error"], "Некорректные параметры фильтрации")
+            response = self.client.get(reverse("cash_flow:cashflow_report"), params)
+            self.assertContains(response, "Некорректные параметры фильтрации")
+
+
+class CashFlowDailyRollupTest(CashFlowTestMixin, TestCase):
+    """Инкрементальное обновление дневных итогов"""
+
+    def test_rollups_follow_create_update_delete(self):
+        first, second, third = self.create_cashflows(3)
+        other_category = Category.objects.create(name="Реклама", operation_type=self.expense)
+
+        second.date = first.date
+        second.amount = 500
+        second.save()
+
+        third = CashFlow.objects.get(pk=third.pk)
+        third.category = other_category
+        third.subcategory = None
+        third.save()
+
+        first.delete()
+
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+        totals = CashFlowDailyRollup.objects.filter(records_count__gt=0).values_list("date", "category", "amount_sum")
+        self.assertCountEqual(
+            totals,
+            [(second.date, self.category.pk, Decimal("500.00")), (third.date, other_category.pk, Decimal("102.00"))],
+        )
+
+    def test_rebuild(self):
+        self.create_cashflows(5)
+        CashFlowDailyRollup.objects.update(amount_sum=0)
+        self.assertEqual(len(CashFlowDailyRollup.objects.find_mismatches()), 5)
+
+        self.assertEqual(CashFlowDailyRollup.objects.rebuild(), 5)
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+
+
+class ReferenceCacheTest(CashFlowTestMixin, TestCase):
+    """Кеш справочников и его сброс сигналами"""
+
+    def test_lookups_are_served_from_cache(self):
+        url = reverse("cash_flow:get_categories")
+        self.client.get(url, {"operation_type_id": self.expense.pk})
+        with self.assertNumQueries(self.AUTH_QUERIES):
+            response = self.client.get(url, {"operation_type_id": self.expense.pk})
+        self.assertEqual(response.json(), [{"id": self.category.pk, "name": "Маркетинг"}])
+
+    def test_cache_invalidated_on_save(self):
+        url = reverse("cash_flow:get_subcategories")
+        self.client.get(url, {"category_id": self.category.pk})
+        Subcategory.objects.create(name="Яндекс", category=self.category)
+        response = self.client.get(url, {"category_id": self.category.pk})
+        self.assertEqual([item["name"] for item in response.json()], ["Avito", "Яндекс"])
+
+    def test_hierarchy_validation(self):
+        other_category = Category.objects.create(name="Зарплата", operation_type=self.income)
+        cashflow = CashFlow(
+            status=self.status,
+            operation_type=self.expense,
+            category=other_category,
+            subcategory=self.subcategory,
+            amount=10,
+        )
+        with self.assertRaises(ValidationError) as error:
+            cashflow.full_clean()
+        self.assertEqual(set(error.exception.message_dict), {"category", "subcategory"})
+
+
+class CashFlowSaveQueriesTest(CashFlowTestMixin, TestCase):
+    """Сохранение записи не перепроверяет справочники запросами к БД"""
+
+    def test_model_save(self):
+        self.create_cashflows(1)
+        cashflow = CashFlow(
+            owner=self.user,
+            date=date(2025, 1, 1),
+            status=self.status,
+            operation_type=self.expense,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=100,
+        )
+        get_references()
+        # SAVEPOINT, INSERT, обновление существующего дневного итога, оборот дня и пересчет остатков, RELEASE SAVEPOINT
+        with self.assertNumQueries(6):
+            cashflow.save()
+
+    def test_form_save_validates_once(self):
+        cashflow = self.create_cashflows(1)[0]
+        data = {
+            "date": "2025-01-01",
+            "status": self.status.pk,
+            "operation_type": self.expense.pk,
+            "category": self.category.pk,
+            "subcategory": self.subcategory.pk,
+            "amount": "150.00",
+            "comment": "",
+        }
+        # 4 запроса полей выбора формы; SAVEPOINT, UPDATE записи, обновление дневного итога,
+        # оборот дня и пересчет остатков, RELEASE SAVEPOINT
+        with self.assertNumQueries(4 + 6):
+            form = CashFlowForm(data=data, instance=cashflow)
+            self.assertTrue(form.is_valid())
+            form.save()
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+
+    def test_form_edit_moves_to_other_operation_type(self):
+        cashflow = self.create_cashflows(1)[0]
+        salary = Category.objects.create(name="Зарплата", operation_type=self.income)
+        bonus = Subcategory.objects.create(name="Премия", category=salary)
+        data = {
+            "date": "2025-01-01",
+            "status": self.status.pk,
+            "operation_type": self.income.pk,
+            "category": salary.pk,
+            "subcategory": bonus.pk,
+            "amount": "150.00",
+        }
+        form = CashFlowForm(data=data, instance=cashflow)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(CashFlow.objects.get(pk=cashflow.pk).category, salary)
+
+        # Категория другого типа операции отклоняется проверкой иерархии, а не как несуществующий вариант
+        form = CashFlowForm(data={**data, "category": self.category.pk, "subcategory": self.subcategory.pk})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(list(form.errors), ["category"])
+        self.assertNotIn("invalid_choice", [error.code for error in form.errors.as_data()["category"]])
+
+
+class CashFlowAdminTest(CashFlowTestMixin, TestCase):
+    """Админка записей ДДС поддерживает дневные итоги и остатки"""
+
+    def test_delete_selected_updates_rollups_and_balances(self):
+        admin = User.objects.create(email="admin@example.com", is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        first, second, _ = self.create_cashflows(3)
+        response = self.client.post(
+            reverse("admin:cash_flow_cashflow_changelist"),
+            {"action": "delete_selected", "_selected_action": [first.pk, second.pk], "post": "yes"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(CashFlow.objects.count(), 1)
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+        # Остаток оставшегося дня больше не включает удаленные записи предыдущих дней
+        self.assertEqual(CashFlowDailyBalance.objects.find_mismatches(), [])
+        self.assertEqual(
+            CashFlowDailyBalance.objects.filter(owner=self.user).balances_on(date(2025, 1, 3)),
+            {self.status.pk: Decimal("-102.00")},
+        )
+
+
+class CashFlowImportTest(CashFlowTestMixin, TestCase):
+    """Импорт CSV пачками с ошибками по строкам и согласованными дневными итогами"""
+
+    CSV = (
+        "Дата;Статус;Тип операции;Категория;Подкатегория;Сумма;Комментарий\n"
+        "01.02.2025;Бизнес;Списание;Маркетинг;Avito;1 500,50;первая\n"
+        "2025-02-02;Бизнес;Списание;Маркетинг;Avito;200;\n"
+        "2025-02-03;Бизнес;Пополнение;Маркетинг;Avito;300;чужая категория\n"
+        "2025-02-04;Бизнес;Списание;Маркетинг;Avito;-5;\n"
+    )
+
+    def run_import(self, **kwargs):
+        importer = CashFlowImporter(self.user, batch_size=2, **kwargs)
+        return importer.run(read_csv(io.BytesIO(self.CSV.encode())))
+
+    def test_import(self):
+        result = self.run_import()
+        self.assertEqual((result.total, result.created), (4, 2))
+        self.assertEqual([line for line, _ in result.errors], [4, 5])
+        self.assertEqual(CashFlow.objects.count(), 2)
+        self.assertEqual(CashFlow.objects.get(comment="первая").amount, Decimal("1500.50"))
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+
+    def test_dry_run(self):
+        result = self.run_import(dry_run=True)
+        self.assertEqual(result.created, 2)
+        self.assertFalse(CashFlow.objects.exists())
+
+    def test_non_finite_amounts(self):
+        content = "Дата;Статус;Тип операции;Категория;Подкатегория;Сумма\n" + "".join(
+            f"2025-02-01;Бизнес;Списание;Маркетинг;Avito;{amount}\n" for amount in ("NaN", "sNaN", "Infinity", "-inf")
+        )
+        result = CashFlowImporter(self.user).run(read_csv(io.BytesIO(content.encode())))
+        self.assertEqual((result.total, result.created), (4, 0))
+        self.assertEqual([message for _, message in result.errors][0], "Некорректная сумма: NaN")
+
+    def test_cp1251_fallback(self):
+        importer = CashFlowImporter(self.user, batch_size=2)
+        result = importer.run(read_csv(io.BytesIO(self.CSV.encode("cp1251"))))
+        self.assertEqual((result.total, result.created), (4, 2))
+
+    def test_bad_bytes_roll_back_batches(self):
+        content = self.CSV.encode() + "2025-02-05;Бизнес;Списание;Маркетинг;Avito;5;".encode("cp1251") + b"\n"
+        importer = CashFlowImporter(self.user, batch_size=2)
+        with self.assertRaises(ImportFormatError):
+            importer.run(read_csv(io.BytesIO(content), encoding="utf-8"))
+        self.assertFalse(CashFlow.objects.exists())
+        self.assertFalse(CashFlowDailyRollup.objects.exists())
+
+    @skipUnless(find_spec("openpyxl"), "Для импорта XLSX нужен openpyxl")
+    def test_not_xlsx(self):
+        with self.assertRaises(ImportFormatError):
+            CashFlowImporter(self.user).run(read_rows(io.BytesIO(self.CSV.encode()), "xlsx"))
+
+
+class CashFlowExportTest(CashFlowTestMixin, TestCase):
+    """Потоковая выгрузка с фильтрами списка"""
+
+    def export(self, **params):
+        response = self.client.get(reverse("cash_flow:cashflow_export"), params)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_roundtrip_headers(self):
+        self.create_cashflows(3)
+        lines = self.export(format="csv", start_date="2025-01-02").lstrip("\ufeff").splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(normalize_header(lines[0].split(","))[:7], ["id", *COLUMNS[:6]])
+        self.assertIn("2025-01-03,Бизнес,Списание,Маркетинг,Avito,102.00", lines[1])
+
+    def test_ndjson(self):
+        self.create_cashflows(2)
+        rows = [json.loads(line) for line in self.export(format="ndjson").splitlines()]
+        self.assertEqual([row["amount"] for row in rows], ["101.00", "100.00"])
+        self.assertEqual(rows[0]["category"], "Маркетинг")
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse("cash_flow:cashflow_export"), {"format": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_filters(self):
+        for params in ({"status": "abc"}, {"start_date": "2025-13-01"}):
+            response = self.client.get(reverse("cash_flow:cashflow_export"), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.streaming)
+
+
+class CashFlowApiTest(CashFlowTestMixin, TestCase):
+    """JSON API: проекции values(), выбор полей и курсорная пагинация"""
+
+    url = reverse("cash_flow:api_cashflow_list")
+
+    def test_fields_and_pages(self):
+        self.create_cashflows(5)
+        response = self.client.get(self.url, {"fields": "date,amount", "limit": 2})
+        data = response.json()
+        self.assertEqual(
+            data["results"], [{"date": "2025-01-05", "amount": "104.00"}, {"date": "2025-01-04", "amount": "103.00"}]
+        )
+        self.assertIsNone(data["previous"])
+
+        seen = [row["date"] for row in data["results"]]
+        with self.assertNumQueries(self.AUTH_QUERIES + 1):
+            data = self.client.get(data["next"]).json()
+        seen += [row["date"] for row in data["results"]]
+        data = self.client.get(data["next"]).json()
+        seen += [row["date"] for row in data["results"]]
+        self.assertEqual(len(set(seen)), 5)
+        self.assertIsNone(data["next"])
+
+    def test_ids_by_default_and_expand(self):
+        self.create_cashflows(1)
+        row = self.client.get(self.url).json()["results"][0]
+        self.assertEqual(row["category"], self.category.pk)
+        self.assertNotIn("category_name", row)
+
+        row = self.client.get(self.url, {"expand": "category"}).json()["results"][0]
+        self.assertEqual(row["category_name"], "Маркетинг")
+
+    def test_bad_params(self):
+        for params in ({"fields": "password"}, {"cursor": "garbage"}, {"category": "x"}, {"limit": "0"}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+    def test_references(self):
+        response = self.client.get(reverse("cash_flow:api_reference_list", args=["categories"]))
+        self.assertEqual(
+            response.json()["results"],
+            [{"id": self.category.pk, "name": "Маркетинг", "operation_type": self.expense.pk}],
+        )
+        self.assertEqual(self.client.get(reverse("cash_flow:api_reference_list", args=["users"])).status_code, 404)
+
+
+class ConditionalGetTest(CashFlowTestMixin, TestCase):
+    """304 по версиям таблиц без запросов к данным (только к сессии и пользователю)"""
+
+    def test_list_not_modified_until_write(self):
+        self.create_cashflows(2)
+        url = reverse("cash_flow:cashflow_list")
+        response = self.client.get(url)
+        self.assertIn("no-cache", response["Cache-Control"])
+        etag = response["ETag"]
+
+        with self.assertNumQueries(self.AUTH_QUERIES):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.create_cashflows(1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etag_changes_with_csrf_token(self):
+        url = reverse("cash_flow:cashflow_list")
+        response = self.client.get(url)
+        self.assertIn("Cookie", response["Vary"])
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Новый секрет CSRF (например, после повторного входа) — форма массовых действий рендерится заново
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "x" * 32
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_lookup_depends_on_references_only(self):
+        url = reverse("cash_flow:get_categories")
+        params = {"operation_type_id": self.expense.pk}
+        response = self.client.get(url, params)
+        self.assertIn("max-age=60", response["Cache-Control"])
+        etag = response["ETag"]
+
+        self.create_cashflows(1)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Category.objects.create(name="Реклама", operation_type=self.expense)
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.json()), 2)
+
+
+class ReferenceTreeTest(CashFlowTestMixin, TestCase):
+    """Дерево справочников встраивается в форму и отдается одним запросом"""
+
+    def test_form_embeds_tree(self):
+        response = self.client.get(reverse("cash_flow:cashflow_create"))
+        self.assertContains(response, '<script id="reference-tree" type="application/json">')
+        self.assertNotContains(response, reverse("cash_flow:get_categories"))
+
+    def test_endpoint(self):
+        data = self.client.get(reverse("cash_flow:api_reference_tree")).json()
+        expense = next(item for item in data["operation_types"] if item["id"] == self.expense.pk)
+        self.assertEqual(expense["categories"][0]["subcategories"], [{"id": self.subcategory.pk, "name": "Avito"}])
+
+        Subcategory.objects.create(name="Яндекс", category=self.category)
+        self.assertNotEqual(self.client.get(reverse("cash_flow:api_reference_tree")).json()["hash"], data["hash"])
+
+
+class CashFlowOwnershipTest(CashFlowTestMixin, TestCase):
+    """Каждый пользователь видит и меняет только свои записи"""
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse("cash_flow:cashflow_list"))
+        self.assertRedirects(response, f"{reverse('users:login')}?next={reverse('cash_flow:cashflow_list')}")
+        self.assertEqual(self.client.get(reverse("cash_flow:api_cashflow_list")).status_code, 401)
+
+    def test_scoped_views(self):
+        own = self.create_cashflows(1)[0]
+        other = self.create_cashflows(2, owner=self.other_user)[0]
+
+        response = self.client.get(reverse("cash_flow:cashflow_list"))
+        self.assertEqual([item.pk for item in response.context["cashflows"]], [own.pk])
+        self.assertEqual(len(self.client.get(reverse("cash_flow:api_cashflow_list")).json()["results"]), 1)
+        self.assertEqual(self.client.get(reverse("cash_flow:cashflow_report_data")).json()["totals"]["count"], 1)
+        self.assertEqual(self.client.get(reverse("cash_flow:cashflow_edit", args=[other.pk])).status_code, 404)
+        self.assertEqual(self.client.post(reverse("cash_flow:cashflow_delete", args=[other.pk])).status_code, 404)
+
+    def test_create_sets_owner(self):
+        data = {
+            "date": "2025-01-01",
+            "status": self.status.pk,
+            "operation_type": self.expense.pk,
+            "category": self.category.pk,
+            "subcategory": self.subcategory.pk,
+            "amount": "150.00",
+            "comment": "",
+        }
+        self.client.post(reverse("cash_flow:cashflow_create"), data)
+        self.assertEqual(CashFlow.objects.get().owner, self.user)
+        self.assertEqual(CashFlowDailyRollup.objects.get().owner, self.user)
+
+
+@skipUnless(connection.vendor == "postgresql", "Секционирование есть только в PostgreSQL")
+class CashFlowPartitioningTest(CashFlowTestMixin, TestCase):
+    """Перевод таблицы записей на секции, создание будущих и отсоединение старых секций"""
+
+    def test_convert_create_detach(self):
+        old, recent = self.create_cashflows(2, start=date(2020, 1, 31))[0], self.create_cashflows(1)[0]
+        partitions.convert("year", ahead=1)
+
+        self.assertTrue(partitions.is_partitioned())
+        names = [name for name, _, _ in partitions.list_partitions()]
+        self.assertIn("cash_flow_cashflow_p2020", names)
+        self.assertEqual(CashFlow.objects.count(), 3)
+        self.assertGreater(self.create_cashflows(1)[0].pk, recent.pk)
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+
+        # Запись вне секций попадает в секцию по умолчанию и переносится при создании секции
+        far = self.create_cashflows(1, start=date(2100, 5, 1))[0]
+        self.assertEqual(
+            partitions.ensure_partitions(date(2100, 1, 1), since=date(2100, 1, 1)), ["cash_flow_cashflow_p2100"]
+        )
+        self.assertTrue(CashFlow.objects.filter(pk=far.pk).exists())
+
+        self.assertEqual(partitions.detach_partitions(date(2021, 1, 1)), ["cash_flow_cashflow_p2020"])
+        self.assertFalse(CashFlow.objects.filter(pk=old.pk).exists())
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+        self.assertEqual(CashFlowDailyBalance.objects.find_mismatches(), [])
+
+
+class CashFlowSearchTest(CashFlowTestMixin, TestCase):
+    """Полнотекстовый поиск по комментарию и названиям справочников"""
+
+    def setUp(self):
+        super().setUp()
+        self.first, self.second = self.create_cashflows(2)
+        self.first.comment = "Оплата рекламы на январь"
+        self.first.save()
+
+    def search(self, **params):
+        response = self.client.get(reverse("cash_flow:cashflow_list"), params)
+        return {item.pk for item in response.context["cashflows"]}
+
+    def test_comment_morphology(self):
+        self.assertEqual(self.search(search="реклама"), {self.first.pk})
+
+    def test_partial_reference_name(self):
+        self.assertEqual(self.search(search="Avi"), {self.first.pk, self.second.pk})
+        self.assertEqual(self.search(search="Avi", start_date="2025-01-02"), {self.second.pk})
+
+    def test_rename_updates_vectors(self):
+        self.status.name = "Предприятие"
+        self.status.save()
+        self.assertEqual(self.search(search="предприятия"), {self.first.pk, self.second.pk})
+        self.assertEqual(self.search(search="Бизнес"), set())
+
+    def test_report_and_pivot_apply_search(self):
+        params = {"search": "реклама", "start_date": "2025-01-01", "end_date": "2025-01-31"}
+        for backend in ("sql", "numpy"):
+            with self.settings(CASH_FLOW_REPORT_BACKEND=backend):
+                cache.clear()
+                report = self.client.get(reverse("cash_flow:cashflow_report_data"), params).json()
+                self.assertEqual(report["totals"], {"count": 1, "total": "100.00"})
+                pivot = build_pivot(params, self.user)
+                self.assertEqual(pivot["sections"][0]["total"], Decimal("100.00"))
+                self.assertIn("search=", pivot["sections"][0]["query"])
+
+    def test_pagination_links_keep_encoded_search(self):
+        self.create_cashflows(25, start=date(2025, 2, 1))
+        response = self.client.get(reverse("cash_flow:cashflow_list"), {"search": "Avito & Маркетинг"})
+        self.assertTrue(response.context["page_obj"].has_next())
+        next_url = "?" + urlencode({"search": "Avito & Маркетинг", "page": 2})
+        self.assertContains(response, f'href="{escape(next_url)}"')
+
+    def test_delete_clears_reference_name(self):
+        self.subcategory.delete()
+        self.assertEqual(self.search(search="Avi"), set())
+        self.assertEqual(self.search(search="Маркетинг"), {self.first.pk, self.second.pk})
+        self.category.delete()
+        self.assertEqual(self.search(search="Маркетинг"), set())
+        self.assertFalse(CashFlow.objects.filter(category__isnull=False).exists())
+
+
+class CashFlowBenchmarkTest(CashFlowTestMixin, TestCase):
+    """Генерация синтетического журнала и набор замеров"""
+
+    def test_generate_ledger(self):
+        call_command("generate_ledger", rows=50, days=30, users=2, batch_size=20, seed=1, stdout=io.StringIO())
+
+        owners = User.objects.filter(email__in=["bench1@example.com", "bench2@example.com"])
+        self.assertEqual(CashFlow.objects.filter(owner__in=owners).count(), 50)
+        self.assertFalse(CashFlow.objects.filter(search_vector__isnull=True).exists())
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+
+    def test_benchmark_results(self):
+        self.create_cashflows(5)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark_cashflow",
+                owner=self.user.email,
+                iterations=2,
+                warmup=0,
+                output=output,
+                stdout=io.StringIO(),
+            )
+            with open(output, encoding="utf-8") as file:
+                data = json.load(file)
+
+        self.assertEqual(data["metadata"]["owner_rows"], 5)
+        self.assertIn("list_keyset_deep_page", data["results"])
+        self.assertEqual(data["results"]["delete"]["iterations"], 2)
+        self.assertLessEqual({"p50_ms", "p95_ms", "p99_ms", "queries_max"}, set(data["results"]["list"]))
+        # Записи, созданные сценариями, откатываются
+        self.assertEqual(CashFlow.objects.count(), 5)
+
+    def test_percentile(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertEqual(percentile([1, 2, 3, 4], 100), 4)
+
+
+@override_settings(CASH_FLOW_INSTRUMENTATION=True, CASH_FLOW_INSTRUMENTATION_SAMPLE_RATE=1.0)
+class InstrumentationMiddlewareTest(CashFlowTestMixin, TestCase):
+    """Server-Timing и структурированный лог запроса"""
+
+    def test_server_timing_and_log(self):
+        self.create_cashflows(3)
+        with self.assertLogs("cash_flow.instrumentation", "INFO") as logs:
+            response = self.client.get(reverse("cash_flow:cashflow_list"))
+
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r"total;dur=[\d.]+")
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(data["view"], "cash_flow:cashflow_list")
+        self.assertEqual(data["user"], self.user.pk)
+        # Запросы асинхронного представления выполняются в потоках sync_to_async и тоже учитываются
+        self.assertGreater(data["queries"], self.AUTH_QUERIES)
+        self.assertGreater(data["render_ms"], 0)
+        self.assertEqual(data["duplicates"], [])
+
+    @override_settings(CASH_FLOW_INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.client.get(reverse("cash_flow:cashflow_list"))
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(CASH_FLOW_INSTRUMENTATION=False)
+    def test_disabled(self):
+        response = self.client.get(reverse("cash_flow:cashflow_list"))
+        self.assertNotIn("Server-Timing", response)
+
+    def test_duplicate_queries(self):
+        metrics = RequestMetrics()
+        for _ in range(3):
+            metrics.record("SELECT * FROM status WHERE id = %s", 0.001)
+        metrics.record("SELECT 1", 0.001)
+
+        self.assertEqual(metrics.queries, 4)
+        self.assertEqual(metrics.duplicates(2), [("SELECT * FROM status WHERE id = %s", 3)])
+
+
+@override_settings(CASH_FLOW_METRICS=True, CASH_FLOW_METRICS_DIR="", CASH_FLOW_METRICS_TOKEN="")
+class MetricsTest(CashFlowTestMixin, TestCase):
+    """Метрики Prometheus на /metrics"""
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+
+    def scrape(self, **headers):
+        response = self.client.get("/metrics", headers=headers)
+        return response, response.content.decode()
+
+    def test_requests_and_changes(self):
+        first, _ = self.create_cashflows(2)
+        first.delete()
+        self.client.get(reverse("cash_flow:cashflow_list"))
+
+        response, text = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('cashflow_http_requests_total{method="GET",status="200",view="cash_flow:cashflow_list"} 1', text)
+        self.assertIn(
+            'cashflow_http_request_duration_seconds_bucket{view="cash_flow:cashflow_list",le="+Inf"} 1', text
+        )
+        self.assertIn('cashflow_records_changes_total{action="create"} 2', text)
+        self.assertIn('cashflow_records_changes_total{action="delete"} 1', text)
+        self.assertIn('cashflow_cache_requests_total{cache="count",result="miss"} 1', text)
+        self.assertIn("cashflow_metrics_processes 1", text)
+
+    def test_multiprocess_directory(self):
+        other_process = {
+            "counters": [["cashflow_records_changes_total", [["action", "update"]], 5]],
+            "histograms": [],
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "metrics-1.json"), "w") as file:
+                json.dump(other_process, file)
+            metrics.record_change("update", 2)
+            with self.settings(CASH_FLOW_METRICS_DIR=directory):
+                _, text = self.scrape()
+
+        self.assertIn('cashflow_records_changes_total{action="update"} 7', text)
+        self.assertIn("cashflow_metrics_processes 2", text)
+
+    def test_dead_process_archived(self):
+        finished = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True)
+        dead_pid = int(finished.stdout)
+        dead_process = {
+            "counters": [["cashflow_records_changes_total", [["action", "delete"]], 3]],
+            "histograms": [],
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            for name in (f"metrics-{dead_pid}.json", "metrics-1.json"):
+                with open(os.path.join(directory, name), "w") as file:
+                    json.dump(dead_process, file)
+            with self.settings(CASH_FLOW_METRICS_DIR=directory):
+                self.scrape()
+                _, text = self.scrape()
+            self.assertFalse(os.path.exists(os.path.join(directory, f"metrics-{dead_pid}.json")))
+
+        # Счетчики завершившегося процесса остаются в сумме, но процесс больше не считается
+        self.assertIn('cashflow_records_changes_total{action="delete"} 6', text)
+        self.assertIn("cashflow_metrics_processes 2", text)
+
+    @override_settings(CASH_FLOW_METRICS_TOKEN="secret")
+    def test_token(self):
+        self.assertEqual(self.scrape()[0].status_code, 401)
+        self.assertEqual(self.scrape(authorization="Bearer secret")[0].status_code, 200)
+
+    @override_settings(CASH_FLOW_METRICS=False)
+    def test_disabled(self):
+        self.assertEqual(self.scrape()[0].status_code, 404)
+
+
+class AsyncViewsTest(CashFlowTestMixin, TestCase):
+    """Асинхронные представления под ASGI (AsyncClient)"""
+
+    def setUp(self):
+        super().setUp()
+        self.create_cashflows(3)
+
+    async def test_lookups(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse("cash_flow:get_subcategories"), {"category_id": self.category.pk}
+        )
+        self.assertEqual(response.json(), [{"id": self.subcategory.pk, "name": "Avito"}])
+        self.assertIn("ETag", response)
+
+        response = await self.async_client.get(
+            reverse("cash_flow:get_categories"), {"operation_type_id": self.expense.pk}
+        )
+        self.assertEqual(response.json(), [{"id": self.category.pk, "name": "Маркетинг"}])
+
+    async def test_list_and_report(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("cash_flow:cashflow_list"), {"pagination": "keyset"})
+        self.assertEqual(len(response.context["cashflows"]), 3)
+
+        response = await self.async_client.get(reverse("cash_flow:cashflow_list"), {"page": "last"})
+        self.assertEqual(response.context["paginator"].count, 3)
+
+        response = await self.async_client.get(reverse("cash_flow:cashflow_report_data"))
+        self.assertEqual(response.json()["totals"]["count"], 3)
+
+    async def test_export_streams_asynchronously(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("cash_flow:cashflow_export"), {"format": "ndjson"})
+        self.assertTrue(response.is_async)
+        lines = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(lines), 3)
+
+    async def test_login_required(self):
+        response = await self.async_client.get(reverse("cash_flow:cashflow_list"))
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CASH_FLOW_COUNT_MODE="exact")
+class CashFlowBulkTest(CashFlowTestMixin, TestCase):
+    """Массовое изменение и удаление записей набором UPDATE/DELETE"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_category = Category.objects.create(name="Реклама", operation_type=self.expense)
+        self.other_subcategory = Subcategory.objects.create(name="Баннеры", category=self.other_category)
+        self.salary = Category.objects.create(name="Зарплата", operation_type=self.income)
+        self.cashflows = self.create_cashflows(6)
+        self.foreign = self.create_cashflows(2, owner=self.other_user)
+
+    def test_reassign_by_filter(self):
+        url = f"{reverse('cash_flow:cashflow_bulk')}?start_date=2025-01-03&page=2"
+        data = {"action": "reassign", "scope": "filter", "subcategory": self.other_subcategory.pk}
+        # Блокировка, итоги по корзинам, UPDATE записей, чтение, UPDATE и INSERT дневных итогов, точка сохранения
+        with self.assertNumQueries(self.AUTH_QUERIES + 8):
+            response = self.client.post(url, data)
+        self.assertRedirects(response, f"{reverse('cash_flow:cashflow_list')}?start_date=2025-01-03", 302, 200)
+
+        changed = CashFlow.objects.filter(subcategory=self.other_subcategory)
+        self.assertEqual(changed.count(), 4)
+        self.assertEqual(set(changed.values_list("category", "owner")), {(self.other_category.pk, self.user.pk)})
+        self.assertEqual(CashFlow.objects.search("Баннеры").count(), 4)
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+
+    def test_reassign_selected_moves_operation_type(self):
+        selected = [self.cashflows[0].pk, self.cashflows[1].pk, self.foreign[0].pk]
+        response = self.client.post(
+            reverse("cash_flow:api_cashflow_bulk"),
+            {"action": "reassign", "ids": selected, "category": self.salary.pk, "status": self.status.pk},
+            content_type="application/json",
+        )
+        self.assertEqual(response.json(), {"action": "reassign", "count": 2})
+        self.assertEqual(
+            set(CashFlow.objects.filter(category=self.salary).values_list("operation_type", "subcategory")),
+            {(self.income.pk, None)},
+        )
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+        self.assertEqual(CashFlowDailyBalance.objects.find_mismatches(), [])
+
+    def test_hierarchy_checked_once(self):
+        response = self.client.post(
+            reverse("cash_flow:api_cashflow_bulk"),
+            {"action": "reassign", "scope": "filter", "category": self.salary.pk, "subcategory": self.subcategory.pk},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("subcategory", response.json()["errors"])
+        self.assertFalse(CashFlow.objects.filter(category=self.salary).exists())
+
+        response = self.client.post(reverse("cash_flow:api_cashflow_bulk"), {"action": "reassign"}, "application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete(self):
+        self.client.get(reverse("cash_flow:cashflow_list"))
+        response = self.client.post(
+            f"{reverse('cash_flow:cashflow_bulk')}?end_date=2025-01-02", {"action": "delete", "scope": "filter"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(CashFlow.objects.filter(owner=self.user).count(), 4)
+        self.assertEqual(CashFlow.objects.filter(owner=self.other_user).count(), 2)
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+        self.assertContains(self.client.get(reverse("cash_flow:cashflow_list")), "Всего: 4")
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command(
+            "bulk_cashflows",
+            "reassign",
+            owner=self.user.email,
+            ids=f"{self.cashflows[0].pk},{self.cashflows[1].pk}",
+            set_category=self.other_category.pk,
+            batch_size=1,
+            stdout=out,
+        )
+        self.assertIn("Изменено записей: 2", out.getvalue())
+        self.assertEqual(CashFlow.objects.filter(category=self.other_category).count(), 2)
+        self.assertEqual(CashFlowDailyRollup.objects.find_mismatches(), [])
+
+        call_command("bulk_cashflows", "delete", owner=self.other_user.email, stdout=out)
+        self.assertFalse(CashFlow.objects.filter(owner=self.other_user).exists())
+
+
+class CashFlowBalanceTest(CashFlowTestMixin, TestCase):
+    """Нарастающие остатки по статусам: инкрементальное обновление и выборки на дату"""
+
+    def setUp(self):
+        super().setUp()
+        self.personal = Status.objects.create(name="Личное")
+        self.salary = Category.objects.create(name="Зарплата", operation_type=self.income)
+
+    def add(self, day, amount, income=False, status=None):
+        return CashFlow.objects.create(
+            owner=self.user,
+            date=day,
+            status=status or self.status,
+            operation_type=self.income if income else self.expense,
+            category=self.salary if income else self.category,
+            amount=amount,
+        )
+
+    def test_past_dated_changes(self):
+        self.add(date(2025, 1, 1), 1000, income=True)
+        self.add(date(2025, 1, 10), 300)
+        self.add(date(2025, 1, 20), 200, status=self.personal)
+        # Запись задним числом сдвигает остатки всех следующих дней ряда
+        backdated = self.add(date(2025, 1, 5), 100)
+        balances = CashFlowDailyBalance.objects.filter(owner=self.user)
+        self.assertEqual(balances.balances_on(date(2025, 1, 9)), {self.status.pk: Decimal("900.00")})
+        self.assertEqual(
+            balances.balances_on(date(2025, 2, 1)),
+            {self.status.pk: Decimal("600.00"), self.personal.pk: Decimal("-200.00")},
+        )
+
+        backdated.date = date(2025, 1, 15)
+        backdated.amount = 50
+        backdated.save()
+        self.assertEqual(balances.balances_on(date(2025, 1, 10)), {self.status.pk: Decimal("700.00")})
+        backdated.delete()
+        self.assertEqual(balances.balances_on(date(2025, 1, 31))[self.status.pk], Decimal("700.00"))
+        self.assertEqual(balances.balances_on(date(2024, 12, 31)), {})
+        self.assertEqual(CashFlowDailyBalance.objects.find_mismatches(), [])
+
+    def test_rebuild_and_rename(self):
+        self.create_cashflows(3)
+        self.add(date(2025, 1, 2), 500, income=True)
+        CashFlowDailyBalance.objects.update(balance=0)
+        self.assertEqual(len(CashFlowDailyBalance.objects.find_mismatches()), 3)
+        self.assertEqual(CashFlowDailyBalance.objects.rebuild(), 3)
+        self.assertEqual(CashFlowDailyBalance.objects.find_mismatches(), [])
+
+        # Переименованный тип операции больше не считается списанием
+        self.expense.name = "Перевод"
+        self.expense.save()
+        balances = CashFlowDailyBalance.objects.filter(owner=self.user)
+        self.assertEqual(balances.balances_on(date(2025, 12, 31)), {self.status.pk: Decimal("500.00")})
+        self.assertEqual(CashFlowDailyBalance.objects.find_mismatches(), [])
+
+    def test_reference_delete_moves_series(self):
+        self.add(date(2025, 1, 1), 1000, income=True)
+        self.add(date(2025, 1, 3), 300)
+        self.add(date(2025, 1, 2), 200, status=self.personal)
+        self.personal.delete()
+        balances = CashFlowDailyBalance.objects.filter(owner=self.user)
+        self.assertEqual(
+            balances.balances_on(date(2025, 1, 31)), {self.status.pk: Decimal("700.00"), None: Decimal("-200.00")}
+        )
+        self.assertEqual(CashFlowDailyBalance.objects.find_mismatches(), [])
+
+        # Записи удаленного типа операции больше не меняют остатки
+        self.expense.delete()
+        self.assertEqual(
+            balances.balances_on(date(2025, 1, 31)), {self.status.pk: Decimal("1000.00"), None: Decimal("0.00")}
+        )
+        self.assertEqual(CashFlowDailyBalance.objects.find_mismatches(), [])
+
+    def test_api(self):
+        self.add(date(2025, 1, 1), 1000, income=True)
+        self.add(date(2025, 1, 3), 300)
+        self.add(date(2025, 1, 3), 100, status=self.personal)
+
+        data = self.client.get(reverse("cash_flow:api_balance"), {"date": "2025-01-02"}).json()
+        self.assertEqual(data["results"], [{"status": self.status.pk, "status_name": "Бизнес", "balance": "1000.00"}])
+        self.assertEqual(self.client.get(reverse("cash_flow:api_balance")).json()["total"], "600.00")
+
+        url = reverse("cash_flow:api_balance_curve")
+        with self.assertNumQueries(self.AUTH_QUERIES + 2):
+            data = self.client.get(url, {"start": "2025-01-02", "end": "2025-01-04"}).json()
+        points = {item["status_name"]: [point["balance"] for point in item["points"]] for item in data["results"]}
+        self.assertEqual(points, {"Бизнес": ["1000.00", "700.00", "700.00"], "Личное": ["0.00", "-100.00", "-100.00"]})
+        self.assertEqual(self.client.get(url, {"start": "2025-01-04", "end": "2025-01-01"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("cash_flow:api_balance"), {"date": "x"}).status_code, 400)
+
+
+@skipUnless(find_spec("pyarrow"), "Для снимков нужен pyarrow")
+class SnapshotExportTest(CashFlowTestMixin, TestCase):
+    """Снимок записей в Parquet/Arrow и инкрементальная догрузка изменений"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = Path(directory.name)
+
+    def export(self, *args):
+        stdout = io.StringIO()
+        call_command("export_snapshot", "--output", str(self.output), "--overlap", "0", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def read(self, pattern="cashflows/*/*.parquet"):
+        import pyarrow.parquet
+
+        rows = []
+        for path in sorted(self.output.glob(pattern)):
+            rows += pyarrow.parquet.read_table(path).to_pylist()
+        # Порядок строк внутри файла не задан: читатели снимка упорядочивают по (id, updated_at)
+        return sorted(rows, key=lambda row: (row["id"], row.get("updated_at")))
+
+    def test_full_and_incremental(self):
+        cashflows = self.create_cashflows(3, start=date(2025, 1, 30))
+        self.assertIn("Выгружено записей: 3 в 2 файлах", self.export())
+        self.assertEqual(
+            sorted(path.name for path in (self.output / "cashflows").iterdir()), ["month=2025-01", "month=2025-02"]
+        )
+        rows = self.read()
+        self.assertEqual(sorted(row["id"] for row in rows), [cashflow.pk for cashflow in cashflows])
+        self.assertEqual(rows[0]["category"], "Маркетинг")
+        self.assertEqual(rows[0]["amount"], Decimal("100.00"))
+        self.assertEqual(len(self.read("references.parquet")), 5)
+
+        changed = cashflows[2]
+        changed.amount = 500
+        changed.save()
+        self.assertIn("Выгружено записей: 1 в 1 файлах", self.export())
+        rows = self.read("cashflows/month=2025-02/*.parquet")
+        self.assertEqual([row["amount"] for row in rows], [Decimal("102.00"), Decimal("500.00")])
+        latest = max(rows, key=lambda row: row["updated_at"])
+        self.assertEqual(latest["id"], changed.pk)
+
+        changed.delete()
+        self.assertIn("Выгружено записей: 2 в 1 файлах", self.export("--full"))
+        self.assertEqual(len(self.read()), 2)
+
+    def test_watermark_per_owner(self):
+        self.create_cashflows(2)
+        self.export("--owner", self.user.email)
+        self.create_cashflows(1, owner=self.other_user)
+        # У другого владельца своей отметки еще нет: выгружаются все его записи
+        self.assertIn(
+            "Выгружено записей: 1 в 1 файлах (изменения с начала)", self.export("--owner", "other@example.com")
+        )
+        self.assertIn("Выгружено записей: 0 в 0 файлах", self.export("--owner", self.user.email))
+        state = json.loads((self.output / "_state.json").read_text())
+        self.assertEqual(set(state["watermarks"]), {f"owner={self.user.pk}", f"owner={self.other_user.pk}"})
+
+    def test_full_rejects_owner(self):
+        self.create_cashflows(2)
+        self.create_cashflows(1, owner=self.other_user)
+        self.export()
+        with self.assertRaisesMessage(CommandError, "только для всех записей"):
+            self.export("--full", "--owner", self.user.email)
+        # Записи других владельцев остаются в снимке
+        self.assertEqual(
+            sorted(row["owner_id"] for row in self.read()), sorted([self.user.pk] * 2 + [self.other_user.pk])
+        )
+
+    def test_failed_full_export_keeps_snapshot(self):
+        self.create_cashflows(2)
+        self.export()
+        with mock.patch.object(SnapshotExporter, "record_batch", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                self.export("--full")
+        self.assertEqual(len(self.read()), 2)
+        self.assertEqual([path.name for path in self.output.iterdir() if path.name.startswith(".")], [])
+
+    def test_arrow_format(self):
+        import pyarrow.ipc
+
+        self.create_cashflows(2)
+        self.export("--format", "arrow", "--owner", self.user.email)
+        (path,) = self.output.glob("cashflows/month=2025-01/*.arrow")
+        table = pyarrow.ipc.open_file(str(path)).read_all()
+        self.assertEqual(table.column("subcategory").to_pylist(), ["Avito", "Avito"])
+
+        with self.assertRaises(CommandError):
+            self.export("--format", "parquet")
+
+
+@skipUnless(find_spec("numpy"), "Для аналитики в памяти нужен numpy")
+class AnalyticsFrameTest(CashFlowTestMixin, TestCase):
+    """Группировки кадра NumPy совпадают с GROUP BY, кадр кешируется и устаревает при записи"""
+
+    def setUp(self):
+        super().setUp()
+        analytics.frames.clear()
+        self.create_cashflows(40, start=date(2024, 12, 20))
+        self.salary = Category.objects.create(name="Зарплата", operation_type=self.income)
+        CashFlow.objects.create(
+            owner=self.user,
+            date=date(2025, 1, 5),
+            status=self.status,
+            operation_type=self.income,
+            category=self.salary,
+            amount="1000.50",
+        )
+
+    def test_matches_sql(self):
+        rollups = CashFlowDailyRollup.objects.owned_by(self.user)
+        frame = analytics.CashFlowFrame.load(rollups)
+        for group_by, period in [
+            ((), None),
+            (("category", "subcategory"), None),
+            (("operation_type",), "month"),
+            (("status", "category"), "week"),
+            ((), "year"),
+        ]:
+            self.assertEqual(frame.summarize(group_by, period), summarize(rollups, group_by, period))
+
+        empty = analytics.CashFlowFrame.load(rollups.none())
+        self.assertEqual(empty.summarize(), summarize(rollups.none()))
+        self.assertEqual(empty.summarize(["status"], "month"), [])
+
+    def test_pivot(self):
+        frame = analytics.CashFlowFrame.load(CashFlowDailyRollup.objects.owned_by(self.user))
+        pivot = frame.pivot(["category", "subcategory"], ["period"], "year")
+        self.assertEqual(pivot["columns"], [(date(2024, 1, 1),), (date(2025, 1, 1),)])
+        self.assertEqual(
+            pivot["rows"],
+            [
+                ((self.category.pk, "Маркетинг"), (self.subcategory.pk, "Avito")),
+                ((self.salary.pk, "Зарплата"), (None, None)),
+            ],
+        )
+        self.assertEqual(
+            pivot["values"], [[Decimal("1266.00"), Decimal("3514.00")], [Decimal("0.00"), Decimal("1000.50")]]
+        )
+
+    def test_pivot_backend(self):
+        params = {"start_date": "2024-12-01", "end_date": "2025-02-28"}
+        expected = build_pivot(params, self.user)
+        cache.clear()
+        with self.settings(CASH_FLOW_REPORT_BACKEND="numpy"):
+            self.assertEqual(build_pivot(params, self.user), expected)
+        self.assertEqual(len(analytics.frames.frames), 1)
+
+    def test_large_ids(self):
+        # Идентификаторы BigAutoField за пределами int32 не путаются с пустым справочником
+        category = Category.objects.create(pk=2**40, name="Крупный", operation_type=self.expense)
+        CashFlow.objects.create(
+            owner=self.user,
+            date=date(2025, 1, 7),
+            status=self.status,
+            operation_type=self.expense,
+            category=category,
+            amount=10,
+        )
+        rollups = CashFlowDailyRollup.objects.owned_by(self.user)
+        frame = analytics.CashFlowFrame.load(rollups)
+        self.assertEqual(frame.summarize(["category", "subcategory"]), summarize(rollups, ["category", "subcategory"]))
+        self.assertEqual(frame.dimensions["category"].dtype, "int64")
+
+    @override_settings(CASH_FLOW_ANALYTICS_CACHE_SIZE=1)
+    def test_cache(self):
+        params = {"start_date": "2025-01-01"}
+        frame = analytics.get_frame(self.user, params)
+        with self.assertNumQueries(0):
+            self.assertIs(analytics.get_frame(self.user, params), frame)
+
+        self.create_cashflows(1, start=date(2025, 3, 1))
+        reloaded = analytics.get_frame(self.user, params)
+        self.assertEqual(len(reloaded), len(frame) + 1)
+
+        analytics.get_frame(self.user, {})
+        self.assertEqual(len(analytics.frames.frames), 1)
+        with self.assertNumQueries(1):
+            analytics.get_frame(self.user, params)
+
+    def test_report_backend(self):
+        url = reverse("cash_flow:cashflow_report_data")
+        params = {"group_by": "operation_type,category", "period": "month"}
+        expected = self.client.get(url, params).json()
+        with override_settings(CASH_FLOW_REPORT_BACKEND="numpy"):
+            cache.clear()
+            self.assertEqual(self.client.get(url, params).json(), expected)
+
+
+class CashFlowPivotTest(CashFlowTestMixin, TestCase):
+    """Сводная таблица «категории × месяцы» одним запросом с условной агрегацией"""
+
+    def setUp(self):
+        super().setUp()
+        self.create_cashflows(40, start=date(2024, 12, 20))
+        self.salary = Category.objects.create(name="Зарплата", operation_type=self.income)
+        CashFlow.objects.create(
+            owner=self.user,
+            date=date(2025, 1, 5),
+            status=self.status,
+            operation_type=self.income,
+            category=self.salary,
+            amount="1000.50",
+        )
+        self.params = {"start_date": "2024-12-15", "end_date": "2025-01-31"}
+
+    def test_pivot(self):
+        get_references()
+        with self.assertNumQueries(1):
+            pivot = build_pivot(self.params, self.user)
+        self.assertEqual(pivot["months"], [date(2024, 12, 1), date(2025, 1, 1)])
+        self.assertEqual([section["name"] for section in pivot["sections"]], ["Пополнение", "Списание"])
+
+        income, expense = pivot["sections"]
+        (salary,) = income["categories"]
+        self.assertEqual([line["name"] for line in salary["subcategories"]], ["Без подкатегории"])
+        self.assertEqual(salary["subcategories"][0]["cells"], [(Decimal("0.00"), None), (Decimal("1000.50"), None)])
+        self.assertEqual(expense["total"], Decimal("4780.00"))
+
+        (marketing,) = expense["categories"]
+        (avito,) = marketing["subcategories"]
+        self.assertEqual([amount for amount, _ in avito["cells"]], [Decimal("1266.00"), Decimal("3514.00")])
+        self.assertEqual(
+            avito["cells"][0][1],
+            f"operation_type={self.expense.pk}&category={self.category.pk}&subcategory={self.subcategory.pk}"
+            "&start_date=2024-12-15&end_date=2024-12-31",
+        )
+
+        # Повторный показ берется из кеша, изменение записей делает его неактуальным
+        with self.assertNumQueries(0):
+            self.assertEqual(build_pivot(self.params, self.user), pivot)
+        self.create_cashflows(1, start=date(2025, 1, 31))
+        self.assertEqual(build_pivot(self.params, self.user)["sections"][1]["total"], Decimal("4880.00"))
+
+    def test_page_and_errors(self):
+        response = self.client.get(reverse("cash_flow:cashflow_pivot"), {**self.params, "status": self.status.pk})
+        self.assertContains(response, "Avito")
+        self.assertContains(
+            response,
+            f"{reverse('cash_flow:cashflow_list')}?status={self.status.pk}&amp;operation_type={self.expense.pk}"
+            f"&amp;category={self.category.pk}&amp;start_date=2024-12-15&amp;end_date=2025-01-31",
+        )
+
+        url = reverse("cash_flow:cashflow_pivot")
+        response = self.client.get(url, {"start_date": "2015-01-01", "end_date": "2025-01-01"})
+        self.assertContains(response, "не больше чем за 120 месяцев")
+        self.assertContains(self.client.get(url, {"start_date": "2025-02-01", "end_date": "2025-01-01"}), "позже")
+        self.assertEqual(self.client.get(url).context["pivot"]["start"], date(timezone.localdate().year, 1, 1))
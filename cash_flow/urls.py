@@ -1,6 +1,6 @@
 from django.urls import path
 
-from cash_flow import views
+from cash_flow import api, views
 from cash_flow.apps import CashFlowConfig
 
 app_name = CashFlowConfig.name
@@ -10,6 +10,18 @@ urlpatterns = [
     path("create/", views.CashFlowCreateView.as_view(), name="cashflow_create"),
     path("<int:pk>/edit/", views.CashFlowUpdateView.as_view(), name="cashflow_edit"),
     path("<int:pk>/delete/", views.CashFlowDeleteView.as_view(), name="cashflow_delete"),
+    path("bulk/", views.CashFlowBulkView.as_view(), name="cashflow_bulk"),
+    path("import/", views.CashFlowImportView.as_view(), name="cashflow_import"),
+    path("export/", views.cashflow_export, name="cashflow_export"),
+    path("report/", views.CashFlowReportView.as_view(), name="cashflow_report"),
+    path("report/data/", views.cashflow_report_data, name="cashflow_report_data"),
+    path("report/pivot/", views.CashFlowPivotView.as_view(), name="cashflow_pivot"),
+    path("api/v1/cashflows/", api.cashflow_list, name="api_cashflow_list"),
+    path("api/v1/cashflows/bulk/", api.cashflow_bulk, name="api_cashflow_bulk"),
+    path("api/v1/balance/", api.balance, name="api_balance"),
+    path("api/v1/balance/curve/", api.balance_curve, name="api_balance_curve"),
+    path("api/v1/hierarchy/", api.reference_tree, name="api_reference_tree"),
+    path("api/v1/<slug:name>/", api.reference_list, name="api_reference_list"),
     path("get-categories/", views.get_categories, name="get_categories"),
     path("get-subcategories/", views.get_subcategories, name="get_subcategories"),
     path("statuses/", views.StatusListView.as_view(), name="status_list"),
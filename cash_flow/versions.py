@@ -0,0 +1,44 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+
+VERSION_KEY = "cash_flow:version:{}"
+
+
+def get_version(name):
+    """Текущая версия данных таблицы (метка времени последнего изменения в наносекундах)"""
+
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    metrics.record_cache("version", hit=version is not None)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(name):
+    """Асинхронная версия get_version для асинхронных представлений"""
+
+    key = VERSION_KEY.format(name)
+    version = await cache.aget(key)
+    metrics.record_cache("version", hit=version is not None)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(name):
+    """Отмечает изменение данных: все ключи кеша со старой версией становятся неактуальными.
+
+    Версия повышается сразу и еще раз после фиксации транзакции, чтобы значения, закешированные
+    другими процессами по еще не зафиксированным данным, тоже устарели.
+    """
+
+    key = VERSION_KEY.format(name)
+    cache.set(key, time.time_ns(), timeout=None)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), timeout=None))
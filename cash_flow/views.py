@@ -1,73 +1,159 @@
-from django.http import JsonResponse
-from django.urls import reverse_lazy
-from django.views.generic import CreateView, DeleteView, ListView, UpdateView
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import InvalidPage
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.urls import reverse, reverse_lazy
+from django.views import View
+from django.views.generic import CreateView, DeleteView, FormView, ListView, TemplateView, UpdateView
+
+from . import bulk
+from .exports import EXPORT_FORMATS, aiter_export, iter_export
+from .forms import (CashFlowBulkForm, CashFlowForm, CashFlowImportForm, CategoryForm, OperationTypeForm, StatusForm,
+                    SubcategoryForm)
+from .http_cache import versioned
+from .importers import CashFlowImporter, ImportFormatError, detect_format, read_rows
+from .models import CashFlow, CashFlowQuerySet, Category, OperationType, Status, Subcategory
+from .pagination import CachedCountPaginator, InvalidCursor, apaginate_keyset
+from .references import aget_references, get_references
+from .reports import GROUP_FIELDS, PERIODS, ReportParamsError, abuild_report, build_pivot, build_report
+
+
+class CashFlowFilterMixin:
+    """Справочники и текущие значения фильтров записей ДДС для шаблона"""
+
+    # Снимок справочников; асинхронные представления загружают его заранее
+    references = None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        references = self.references or get_references()
+        context["statuses"] = references.statuses
+        context["operation_types"] = references.operation_types
+        context["categories"] = references.categories
+        context["subcategories"] = references.subcategories
+
+        # Сохраняем параметры фильтрации для формы
+        context["filter_params"] = {name: self.request.GET.get(name, "") for name in CashFlowQuerySet.FILTER_PARAMS}
+
+        return context
 
-from .forms import CashFlowForm, CategoryForm, OperationTypeForm, StatusForm, SubcategoryForm
-from .models import CashFlow, Category, OperationType, Status, Subcategory
 
+class CashFlowListView(CashFlowFilterMixin, ListView):
+    """Главная страница - список записей ДДС с фильтрацией.
 
-class CashFlowListView(ListView):
-    """Главная страница - список записей ДДС с фильтрацией"""
+    Представление асинхронное: справочники, число записей и строки страницы читаются
+    асинхронным ORM, а шаблон Django рендерит в потоке после возврата ответа.
+    """
 
     model = CashFlow
     template_name = "cashflow/cashflow_list.html"
     context_object_name = "cashflows"
     paginate_by = 20
+    paginator_class = CachedCountPaginator
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # LoginRequiredMixin и method_decorator(dispatch) проверяют пользователя синхронно,
+        # поэтому декораторы применяются к асинхронной функции представления
+        view = super().as_view(**initkwargs)
+        return login_required(versioned("cashflow", "references", policy="cashflow_list", csrf=True)(view))
+
+    async def get(self, request, *args, **kwargs):
+        self.user = await request.auser()
+        self.references = await aget_references()
+        self.object_list = self.get_queryset()
+        self.page_data = await self.afetch_page(self.object_list, self.get_paginate_by(self.object_list))
+        return self.render_to_response(self.get_context_data())
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-
-        # Фильтрация по дате
-        start_date = self.request.GET.get("start_date")
-        end_date = self.request.GET.get("end_date")
-        if start_date:
-            queryset = queryset.filter(date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(date__lte=end_date)
-
-        # Фильтрация по статусу
-        status_id = self.request.GET.get("status")
-        if status_id:
-            queryset = queryset.filter(status_id=status_id)
-
-        # Фильтрация по типу операции
-        operation_type_id = self.request.GET.get("operation_type")
-        if operation_type_id:
-            queryset = queryset.filter(operation_type_id=operation_type_id)
-
-        # Фильтрация по категории
-        category_id = self.request.GET.get("category")
-        if category_id:
-            queryset = queryset.filter(category_id=category_id)
-
-        # Фильтрация по подкатегории
-        subcategory_id = self.request.GET.get("subcategory")
-        if subcategory_id:
-            queryset = queryset.filter(subcategory_id=subcategory_id)
-
-        return queryset
+        return CashFlow.objects.owned_by(self.user).for_list().filter_by_params(self.request.GET)
+
+    def get_pagination_mode(self):
+        """Режим пагинации: offset (по номерам страниц) или keyset (по курсору)"""
+
+        if self.request.GET.get("cursor"):
+            return "keyset"
+        mode = self.request.GET.get("pagination")
+        if mode in ("offset", "keyset"):
+            return mode
+        return settings.CASH_FLOW_PAGINATION_MODE
+
+    async def afetch_page(self, queryset, page_size):
+        """Страница записей асинхронным ORM: (paginator, page, object_list, is_paginated)"""
+
+        if self.get_pagination_mode() == "keyset":
+            try:
+                page = await apaginate_keyset(queryset, page_size, self.request.GET.get("cursor"))
+            except InvalidCursor:
+                raise Http404("Некорректный курсор страницы")
+            return None, page, page.object_list, page.has_other_pages()
+
+        paginator = self.get_paginator(queryset, page_size)
+        await paginator.acount_objects()
+        # Разбор номера страницы как в MultipleObjectMixin.paginate_queryset
+        page_number = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        if page_number == "last":
+            # Номер последней страницы по оценке мог бы указать за конец списка
+            await paginator.acount_exact()
+        try:
+            page_number = paginator.num_pages if page_number == "last" else int(page_number)
+            page = paginator.page(page_number)
+        except (ValueError, InvalidPage) as error:
+            raise Http404(f"Некорректная страница: {error}")
+        page.set_object_list([cashflow async for cashflow in page.object_list])
+        if not page.object_list and page.number > 1:
+            raise Http404("Некорректная страница: на ней нет записей")
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.page_data
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["statuses"] = Status.objects.all()
-        context["operation_types"] = OperationType.objects.all()
-        context["categories"] = Category.objects.all()
-        context["subcategories"] = Subcategory.objects.all()
+        context["pagination_mode"] = self.get_pagination_mode()
+        context["bulk_form"] = CashFlowBulkForm(references=self.references)
+        return context
 
-        # Сохраняем параметры фильтрации для формы
-        context["filter_params"] = {
-            "start_date": self.request.GET.get("start_date", ""),
-            "end_date": self.request.GET.get("end_date", ""),
-            "status": self.request.GET.get("status", ""),
-            "operation_type": self.request.GET.get("operation_type", ""),
-            "category": self.request.GET.get("category", ""),
-            "subcategory": self.request.GET.get("subcategory", ""),
-        }
 
-        return context
+class CashFlowBulkView(LoginRequiredMixin, View):
+    """Массовое изменение справочников или удаление записей ДДС из списка.
 
+    Фильтры списка передаются в строке запроса, как у выгрузки: действие применяется к
+    выбранным записям или ко всем, подходящим под фильтры, набором UPDATE/DELETE.
+    """
 
-class CashFlowCreateView(CreateView):
+    http_method_names = ["post"]
+
+    def post(self, request):
+        params = request.GET.copy()
+        for name in ("page", "cursor"):
+            params.pop(name, None)
+        redirect_to = HttpResponseRedirect(f"{reverse('cash_flow:cashflow_list')}?{params.urlencode()}")
+
+        form = CashFlowBulkForm(request.POST)
+        if not form.is_valid():
+            messages.error(request, " ".join(error for errors in form.errors.values() for error in errors))
+            return redirect_to
+
+        queryset = CashFlow.objects.owned_by(request.user).filter_by_params(request.GET)
+        try:
+            count = bulk.run(
+                form.get_queryset(queryset), form.cleaned_data["action"], form.cleaned_data.get("changes")
+            )
+        except (ValueError, ValidationError):
+            messages.error(request, "Некорректные параметры фильтрации")
+            return redirect_to
+
+        verb = "Удалено" if form.cleaned_data["action"] == "delete" else "Изменено"
+        messages.success(request, f"{verb} записей: {count}")
+        return redirect_to
+
+
+class CashFlowCreateView(LoginRequiredMixin, CreateView):
     """Создание новой записи ДДС"""
 
     model = CashFlow
@@ -76,11 +162,11 @@ class CashFlowCreateView(CreateView):
     success_url = reverse_lazy("cash_flow:cashflow_list")
 
     def form_valid(self, form):
-
+        form.instance.owner = self.request.user
         return super().form_valid(form)
 
 
-class CashFlowUpdateView(UpdateView):
+class CashFlowUpdateView(LoginRequiredMixin, UpdateView):
     """Редактирование записи ДДС"""
 
     model = CashFlow
@@ -88,38 +174,149 @@ class CashFlowUpdateView(UpdateView):
     template_name = "cashflow/cashflow_form.html"
     success_url = reverse_lazy("cash_flow:cashflow_list")
 
+    def get_queryset(self):
+        return CashFlow.objects.owned_by(self.request.user)
 
-class CashFlowDeleteView(DeleteView):
+
+class CashFlowDeleteView(LoginRequiredMixin, DeleteView):
     """Удаление записи ДДС"""
 
     model = CashFlow
     template_name = "cashflow/cashflow_confirm_delete.html"
     success_url = reverse_lazy("cash_flow:cashflow_list")
 
+    def get_queryset(self):
+        return CashFlow.objects.owned_by(self.request.user)
+
+
+class CashFlowImportView(LoginRequiredMixin, FormView):
+    """Загрузка выписки CSV/XLSX и пакетный импорт записей ДДС"""
+
+    form_class = CashFlowImportForm
+    template_name = "cashflow/cashflow_import.html"
+
+    def form_valid(self, form):
+        upload = form.cleaned_data["file"]
+        importer = CashFlowImporter(self.request.user, dry_run=form.cleaned_data["dry_run"])
+        try:
+            rows = read_rows(upload.file, detect_format(upload.name), form.cleaned_data["encoding"] or None)
+            result = importer.run(rows)
+        except ImportFormatError as error:
+            form.add_error("file", str(error))
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
+class CashFlowReportView(LoginRequiredMixin, CashFlowFilterMixin, TemplateView):
+    """Сводный отчет: суммы записей ДДС по справочникам и периодам"""
+
+    template_name = "cashflow/cashflow_report.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["group_choices"] = [
+            ("status", "Статус"),
+            ("operation_type", "Тип операции"),
+            ("category", "Категория"),
+            ("subcategory", "Подкатегория"),
+        ]
+        context["period_choices"] = [("day", "День"), ("week", "Неделя"), ("month", "Месяц"), ("year", "Год")]
+        context["selected_group_by"] = ",".join(self.request.GET.getlist("group_by")).split(",")
+        context["selected_period"] = self.request.GET.get("period", "")
+        try:
+            context["report"] = build_report(self.request.GET, self.request.user)
+        except ReportParamsError as error:
+            context["error"] = str(error)
+        except (ValueError, ValidationError):
+            context["error"] = "Некорректные параметры фильтрации"
+        return context
+
+
+class CashFlowPivotView(LoginRequiredMixin, CashFlowFilterMixin, TemplateView):
+    """Сводная таблица: суммы по категориям и подкатегориям за каждый месяц, по типам операций"""
+
+    template_name = "cashflow/cashflow_pivot.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            context["pivot"] = build_pivot(self.request.GET, self.request.user)
+        except (ReportParamsError, ValueError, ValidationError) as error:
+            context["error"] = str(error)
+        return context
+
 
-def get_subcategories(request):
+@login_required
+@versioned("cashflow", "references", policy="report")
+async def cashflow_report_data(request):
+    """JSON-версия сводного отчета с теми же фильтрами, что и у списка записей"""
+
+    try:
+        report = await abuild_report(request.GET, await request.auser())
+    except ReportParamsError as error:
+        return JsonResponse(
+            {"error": str(error), "group_by": list(GROUP_FIELDS), "period": list(PERIODS)},
+            status=400,
+        )
+    except (ValueError, ValidationError):
+        return JsonResponse({"error": "Некорректные параметры фильтрации"}, status=400)
+    return JsonResponse(report)
+
+
+@login_required
+async def cashflow_export(request):
+    """Потоковая выгрузка записей ДДС (CSV или NDJSON) с фильтрами списка записей.
+
+    Под ASGI строки отдаются асинхронным итератором, под WSGI — синхронным: иначе
+    StreamingHttpResponse собрал бы всю выгрузку в памяти, чтобы сменить режим.
+    """
+
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse(
+            {"error": f"Неизвестный формат: {export_format}", "format": list(EXPORT_FORMATS)}, status=400
+        )
+
+    content_type, extension = EXPORT_FORMATS[export_format]
+    try:
+        queryset = CashFlow.objects.owned_by(await request.auser()).filter_by_params(request.GET)
+        # Запрос компилируется до ответа: ошибка в генераторе оборвала бы уже начатую выгрузку
+        queryset.query.sql_with_params()
+    except (ValueError, ValidationError):
+        return JsonResponse({"error": "Некорректные параметры фильтрации"}, status=400)
+    rows = aiter_export if isinstance(request, ASGIRequest) else iter_export
+    response = StreamingHttpResponse(rows(queryset, export_format), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="cashflows.{extension}"'
+    return response
+
+
+@login_required
+@versioned("references", policy="references")
+async def get_subcategories(request):
     """AJAX-функция для получения подкатегорий по выбранной категории"""
 
     category_id = request.GET.get("category_id")
-    if category_id:
-        subcategories = Subcategory.objects.filter(category_id=category_id)
+    if category_id and category_id.isdigit():
+        subcategories = (await aget_references()).subcategories_for(int(category_id))
         data = [{"id": sub.id, "name": sub.name} for sub in subcategories]
         return JsonResponse(data, safe=False)
     return JsonResponse([], safe=False)
 
 
-def get_categories(request):
+@login_required
+@versioned("references", policy="references")
+async def get_categories(request):
     """AJAX-функция для получения категорий по выбранному типу операции"""
 
     operation_type_id = request.GET.get("operation_type_id")
-    if operation_type_id:
-        categories = Category.objects.filter(operation_type_id=operation_type_id)
+    if operation_type_id and operation_type_id.isdigit():
+        categories = (await aget_references()).categories_for(int(operation_type_id))
         data = [{"id": cat.id, "name": cat.name} for cat in categories]
         return JsonResponse(data, safe=False)
     return JsonResponse([], safe=False)
 
 
-class StatusListView(ListView):
+class StatusListView(LoginRequiredMixin, ListView):
     model = Status
     template_name = "cashflow/reference_list.html"
     context_object_name = "items"
@@ -134,7 +331,7 @@ class StatusListView(ListView):
         return context
 
 
-class StatusCreateView(CreateView):
+class StatusCreateView(LoginRequiredMixin, CreateView):
     model = Status
     form_class = StatusForm
     template_name = "cashflow/reference_form.html"
@@ -147,7 +344,7 @@ class StatusCreateView(CreateView):
         return context
 
 
-class StatusUpdateView(UpdateView):
+class StatusUpdateView(LoginRequiredMixin, UpdateView):
     model = Status
     form_class = StatusForm
     template_name = "cashflow/reference_form.html"
@@ -160,7 +357,7 @@ class StatusUpdateView(UpdateView):
         return context
 
 
-class StatusDeleteView(DeleteView):
+class StatusDeleteView(LoginRequiredMixin, DeleteView):
     model = Status
     template_name = "cashflow/reference_confirm_delete.html"
     success_url = reverse_lazy("cash_flow:status_list")
@@ -173,7 +370,7 @@ class StatusDeleteView(DeleteView):
         return context
 
 
-class OperationTypeListView(ListView):
+class OperationTypeListView(LoginRequiredMixin, ListView):
     model = OperationType
     template_name = "cashflow/reference_list.html"
     context_object_name = "items"
@@ -188,7 +385,7 @@ class OperationTypeListView(ListView):
         return context
 
 
-class OperationTypeCreateView(CreateView):
+class OperationTypeCreateView(LoginRequiredMixin, CreateView):
     model = OperationType
     form_class = OperationTypeForm
     template_name = "cashflow/reference_form.html"
@@ -201,7 +398,7 @@ class OperationTypeCreateView(CreateView):
         return context
 
 
-class OperationTypeUpdateView(UpdateView):
+class OperationTypeUpdateView(LoginRequiredMixin, UpdateView):
     model = OperationType
     form_class = OperationTypeForm
     template_name = "cashflow/reference_form.html"
@@ -214,7 +411,7 @@ class OperationTypeUpdateView(UpdateView):
         return context
 
 
-class OperationTypeDeleteView(DeleteView):
+class OperationTypeDeleteView(LoginRequiredMixin, DeleteView):
     model = OperationType
     template_name = "cashflow/reference_confirm_delete.html"
     success_url = reverse_lazy("cash_flow:operation_type_list")
@@ -227,7 +424,7 @@ class OperationTypeDeleteView(DeleteView):
         return context
 
 
-class CategoryListView(ListView):
+class CategoryListView(LoginRequiredMixin, ListView):
     model = Category
     template_name = "cashflow/reference_list.html"
     context_object_name = "items"
@@ -242,7 +439,7 @@ class CategoryListView(ListView):
         return context
 
 
-class CategoryCreateView(CreateView):
+class CategoryCreateView(LoginRequiredMixin, CreateView):
     model = Category
     form_class = CategoryForm
     template_name = "cashflow/reference_form.html"
@@ -255,7 +452,7 @@ class CategoryCreateView(CreateView):
         return context
 
 
-class CategoryUpdateView(UpdateView):
+class CategoryUpdateView(LoginRequiredMixin, UpdateView):
     model = Category
     form_class = CategoryForm
     template_name = "cashflow/reference_form.html"
@@ -268,7 +465,7 @@ class CategoryUpdateView(UpdateView):
         return context
 
 
-class CategoryDeleteView(DeleteView):
+class CategoryDeleteView(LoginRequiredMixin, DeleteView):
     model = Category
     template_name = "cashflow/reference_confirm_delete.html"
     success_url = reverse_lazy("cash_flow:category_list")
@@ -281,7 +478,7 @@ class CategoryDeleteView(DeleteView):
         return context
 
 
-class SubcategoryListView(ListView):
+class SubcategoryListView(LoginRequiredMixin, ListView):
     model = Subcategory
     template_name = "cashflow/reference_list.html"
     context_object_name = "items"
@@ -296,7 +493,7 @@ class SubcategoryListView(ListView):
         return context
 
 
-class SubcategoryCreateView(CreateView):
+class SubcategoryCreateView(LoginRequiredMixin, CreateView):
     model = Subcategory
     form_class = SubcategoryForm
     template_name = "cashflow/reference_form.html"
@@ -309,7 +506,7 @@ class SubcategoryCreateView(CreateView):
         return context
 
 
-class SubcategoryUpdateView(UpdateView):
+class SubcategoryUpdateView(LoginRequiredMixin, UpdateView):
     model = Subcategory
     form_class = SubcategoryForm
     template_name = "cashflow/reference_form.html"
@@ -322,7 +519,7 @@ class SubcategoryUpdateView(UpdateView):
         return context
 
 
-class SubcategoryDeleteView(DeleteView):
+class SubcategoryDeleteView(LoginRequiredMixin, DeleteView):
     model = Subcategory
     template_name = "cashflow/reference_confirm_delete.html"
     success_url = reverse_lazy("cash_flow:subcategory_list")
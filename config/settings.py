@@ -30,11 +30,16 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "users",
     "cash_flow",
 ]
 
 MIDDLEWARE = [
+    # Отключен, пока не задана настройка CASH_FLOW_INSTRUMENTATION; стоит первым, чтобы замерять весь запрос
+    "cash_flow.middleware.InstrumentationMiddleware",
+    # Отключен, пока не задана настройка CASH_FLOW_METRICS
+    "cash_flow.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -79,6 +84,18 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Для нескольких процессов (gunicorn/uvicorn workers) нужен общий бэкенд, например FileBasedCache или Redis
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", default="cash-flow"),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -130,3 +147,65 @@ AUTH_USER_MODEL = "users.User"
 LOGIN_REDIRECT_URL = "cash_flow:cashflow_list"
 
 LOGIN_URL = "users:login"
+
+# Пагинация списка записей ДДС: "offset" (номера страниц) или "keyset" (курсоры, без OFFSET и COUNT)
+CASH_FLOW_PAGINATION_MODE = os.getenv("CASH_FLOW_PAGINATION_MODE", default="offset")
+
+# Подсчет записей в списке: "exact" (COUNT), "estimate" (статистика планировщика PostgreSQL)
+# или "auto" (оценка, если она не меньше порога, иначе точный COUNT). Оценка только выводится как «≈ всего»:
+# страницы при ней определяются выборкой строк, а «Последняя» считает точный COUNT
+CASH_FLOW_COUNT_MODE = os.getenv("CASH_FLOW_COUNT_MODE", default="exact")
+CASH_FLOW_COUNT_ESTIMATE_THRESHOLD = int(os.getenv("CASH_FLOW_COUNT_ESTIMATE_THRESHOLD", default="100000"))
+CASH_FLOW_COUNT_CACHE_TIMEOUT = int(os.getenv("CASH_FLOW_COUNT_CACHE_TIMEOUT", default="300"))
+
+# Время жизни снимка справочников в общем кеше (секунды); актуальность контролируется версией
+CASH_FLOW_REFERENCE_CACHE_TIMEOUT = int(os.getenv("CASH_FLOW_REFERENCE_CACHE_TIMEOUT", default="86400"))
+
+# Размер порции серверного курсора при потоковой выгрузке записей
+CASH_FLOW_EXPORT_CHUNK_SIZE = int(os.getenv("CASH_FLOW_EXPORT_CHUNK_SIZE", default="2000"))
+
+# Размер порции массового изменения и удаления записей (идентификаторов в одном UPDATE/DELETE)
+CASH_FLOW_BULK_BATCH_SIZE = int(os.getenv("CASH_FLOW_BULK_BATCH_SIZE", default="5000"))
+
+# Бэкенд сводного отчета: "sql" (GROUP BY в PostgreSQL) или "numpy" (группировка кадра дневных итогов в памяти
+# процесса, нужен poetry install -E analytics) и число кадров в памяти процесса (LRU по набору фильтров)
+CASH_FLOW_REPORT_BACKEND = os.getenv("CASH_FLOW_REPORT_BACKEND", default="sql")
+CASH_FLOW_ANALYTICS_CACHE_SIZE = int(os.getenv("CASH_FLOW_ANALYTICS_CACHE_SIZE", default="16"))
+
+# Время жизни сводной таблицы «категории × месяцы» в кеше (секунды); актуальность контролируется версиями
+CASH_FLOW_PIVOT_CACHE_TIMEOUT = int(os.getenv("CASH_FLOW_PIVOT_CACHE_TIMEOUT", default="300"))
+
+# Размер страницы JSON API записей ДДС (?limit=) и его верхняя граница
+CASH_FLOW_API_PAGE_SIZE = int(os.getenv("CASH_FLOW_API_PAGE_SIZE", default="100"))
+CASH_FLOW_API_MAX_PAGE_SIZE = int(os.getenv("CASH_FLOW_API_MAX_PAGE_SIZE", default="1000"))
+
+# Cache-Control для страниц с условным GET (ETag/Last-Modified по версиям таблиц), по политикам
+CASH_FLOW_CACHE_CONTROL = {
+    "cashflow_list": {"private": True, "no_cache": True},
+    "report": {"private": True, "no_cache": True},
+    "api": {"private": True, "no_cache": True},
+    "references": {"private": True, "max_age": int(os.getenv("CASH_FLOW_REFERENCES_MAX_AGE", default="60"))},
+}
+
+# Инструментирование запросов: заголовок Server-Timing и строка JSON в лог (время, SQL-запросы, рендеринг,
+# повторяющиеся запросы). SAMPLE_RATE — доля замеряемых запросов, DUPLICATE_THRESHOLD — с какого числа
+# одинаковых SQL запрос считается повторяющимся (признак N+1)
+CASH_FLOW_INSTRUMENTATION = os.getenv("CASH_FLOW_INSTRUMENTATION") == "True"
+CASH_FLOW_INSTRUMENTATION_SAMPLE_RATE = float(os.getenv("CASH_FLOW_INSTRUMENTATION_SAMPLE_RATE", default="1.0"))
+CASH_FLOW_INSTRUMENTATION_DUPLICATE_THRESHOLD = int(
+    os.getenv("CASH_FLOW_INSTRUMENTATION_DUPLICATE_THRESHOLD", default="2")
+)
+
+# Метрики Prometheus на /metrics. Без CASH_FLOW_METRICS_DIR каждый процесс отдает только свои значения;
+# с ним процессы раз в FLUSH_INTERVAL секунд пишут снимки в каталог, и ответ суммирует все процессы
+CASH_FLOW_METRICS = os.getenv("CASH_FLOW_METRICS") == "True"
+CASH_FLOW_METRICS_DIR = os.getenv("CASH_FLOW_METRICS_DIR", default="")
+CASH_FLOW_METRICS_FLUSH_INTERVAL = float(os.getenv("CASH_FLOW_METRICS_FLUSH_INTERVAL", default="5"))
+CASH_FLOW_METRICS_TOKEN = os.getenv("CASH_FLOW_METRICS_TOKEN", default="")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"cash_flow.instrumentation": {"handlers": ["console"], "level": "INFO", "propagate": False}},
+}
@@ -3,9 +3,12 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from cash_flow.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("cash_flow/", include("cash_flow.urls", namespace="cash_flow")),
+    path("metrics", metrics_view, name="metrics"),
     path("", include("users.urls", namespace="users")),
 ]
 if settings.DEBUG: